@@ -2,15 +2,18 @@
 Admin API endpoints for platform management
 Story 4.4: Admin Dashboard & Kill Switch
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
 from pydantic import BaseModel, Field
 from typing import Optional
 from datetime import datetime
 
 from ...core.auth import get_current_user
+from ...core.auth_cache import api_key_cache, publish_auth_invalidation
 from ...core.supabase import get_supabase_service_client
 from ...core.redis_client import RedisClient
+from ...core.pubsub_multiplexer import get_pubsub_multiplexer
 from ...core.stream_producer import StreamProducer
+from ...services.session_cache import get_session_cache
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
 
@@ -56,9 +59,9 @@ class BanResponse(BaseModel):
 
 async def require_admin(current_user: dict = Depends(get_current_user)):
     """Dependency to require admin access"""
-    supabase = get_supabase_service_client()
+    supabase = await get_supabase_service_client()
     
-    result = supabase.table("profiles")\
+    result = await supabase.table("profiles")\
         .select("is_admin")\
         .eq("id", current_user["id"])\
         .limit(1)\
@@ -81,14 +84,14 @@ async def list_users(
     admin: dict = Depends(require_admin)
 ):
     """List all users (admin only)"""
-    supabase = get_supabase_service_client()
+    supabase = await get_supabase_service_client()
     
     query = supabase.table("profiles").select("*", count="exact")
     
     if search:
         query = query.or_(f"email.ilike.%{search}%,full_name.ilike.%{search}%")
     
-    result = query.order("created_at", desc=True)\
+    result = await query.order("created_at", desc=True)\
         .range(offset, offset + limit - 1)\
         .execute()
     
@@ -106,10 +109,10 @@ async def get_user_detail(
     admin: dict = Depends(require_admin)
 ):
     """Get detailed user info including stats (admin only)"""
-    supabase = get_supabase_service_client()
+    supabase = await get_supabase_service_client()
     
     # Get profile
-    profile_result = supabase.table("profiles")\
+    profile_result = await supabase.table("profiles")\
         .select("*")\
         .eq("id", user_id)\
         .single()\
@@ -121,7 +124,7 @@ async def get_user_detail(
     profile = profile_result.data
     
     # Get subscription
-    sub_result = supabase.table("subscriptions")\
+    sub_result = await supabase.table("subscriptions")\
         .select("plan, messages_used, message_limit")\
         .eq("user_id", user_id)\
         .limit(1)\
@@ -130,7 +133,7 @@ async def get_user_detail(
     sub = sub_result.data[0] if sub_result.data else {}
     
     # Get active sessions count
-    sessions_result = supabase.table("sessions")\
+    sessions_result = await supabase.table("sessions")\
         .select("id", count="exact")\
         .eq("user_id", user_id)\
         .eq("status", "connected")\
@@ -159,10 +162,10 @@ async def ban_user(
     Ban a user and disconnect all their sessions (admin only).
     This is the "Kill Switch" functionality.
     """
-    supabase = get_supabase_service_client()
+    supabase = await get_supabase_service_client()
     
     # Verify user exists and is not already banned
-    profile_result = supabase.table("profiles")\
+    profile_result = await supabase.table("profiles")\
         .select("id, is_banned")\
         .eq("id", user_id)\
         .single()\
@@ -175,7 +178,7 @@ async def ban_user(
         raise HTTPException(status_code=400, detail="User is already banned")
     
     # Get all active sessions
-    sessions_result = supabase.table("sessions")\
+    sessions_result = await supabase.table("sessions")\
         .select("id")\
         .eq("user_id", user_id)\
         .eq("status", "connected")\
@@ -184,7 +187,7 @@ async def ban_user(
     session_ids = [s["id"] for s in sessions_result.data] if sessions_result.data else []
     
     # Ban the user
-    supabase.table("profiles")\
+    await supabase.table("profiles")\
         .update({"is_banned": True})\
         .eq("id", user_id)\
         .execute()
@@ -194,24 +197,31 @@ async def ban_user(
         redis_client = await RedisClient.get_client()
         producer = StreamProducer(redis_client)
         
-        for session_id in session_ids:
-            await producer.publish_command("DISCONNECT_SESSION", {
+        await producer.publish_many([
+            ("DISCONNECT_SESSION", {
                 "session_id": session_id,
                 "reason": "User banned by admin"
             })
+            for session_id in session_ids
+        ])
         
         # Mark sessions as disconnected in DB
-        supabase.table("sessions")\
+        await supabase.table("sessions")\
             .update({"status": "disconnected"})\
             .eq("user_id", user_id)\
             .execute()
+        await (await get_session_cache()).forget_user(user_id)
     
     # Revoke all API keys
-    supabase.table("api_keys")\
+    await supabase.table("api_keys")\
         .update({"is_revoked": True})\
         .eq("user_id", user_id)\
         .execute()
     
+    # Drop the user's cached credentials on every worker
+    redis_client = await RedisClient.get_client()
+    await publish_auth_invalidation(redis_client, user_id=user_id)
+    
     return BanResponse(
         success=True,
         message=f"User banned successfully. {len(session_ids)} session(s) disconnected.",
@@ -225,10 +235,10 @@ async def unban_user(
     admin: dict = Depends(require_admin)
 ):
     """Unban a user (admin only)"""
-    supabase = get_supabase_service_client()
+    supabase = await get_supabase_service_client()
     
     # Verify user exists and is banned
-    profile_result = supabase.table("profiles")\
+    profile_result = await supabase.table("profiles")\
         .select("id, is_banned")\
         .eq("id", user_id)\
         .single()\
@@ -241,7 +251,7 @@ async def unban_user(
         raise HTTPException(status_code=400, detail="User is not banned")
     
     # Unban the user
-    supabase.table("profiles")\
+    await supabase.table("profiles")\
         .update({"is_banned": False})\
         .eq("id", user_id)\
         .execute()
@@ -256,27 +266,27 @@ async def unban_user(
 @router.get("/stats")
 async def get_platform_stats(admin: dict = Depends(require_admin)):
     """Get platform-wide statistics (admin only)"""
-    supabase = get_supabase_service_client()
+    supabase = await get_supabase_service_client()
     
     # Total users
-    users_result = supabase.table("profiles")\
+    users_result = await supabase.table("profiles")\
         .select("id", count="exact")\
         .execute()
     
     # Active sessions
-    sessions_result = supabase.table("sessions")\
+    sessions_result = await supabase.table("sessions")\
         .select("id", count="exact")\
         .eq("status", "connected")\
         .execute()
     
     # Messages sent today (rough estimate)
-    messages_result = supabase.table("messages")\
+    messages_result = await supabase.table("messages")\
         .select("id", count="exact")\
         .gte("created_at", "now() - interval '24 hours'")\
         .execute()
     
     # Paying customers
-    paying_result = supabase.table("subscriptions")\
+    paying_result = await supabase.table("subscriptions")\
         .select("id", count="exact")\
         .neq("plan", "free")\
         .execute()
@@ -287,3 +297,20 @@ async def get_platform_stats(admin: dict = Depends(require_admin)):
         "messagesLast24h": messages_result.count or 0,
         "payingCustomers": paying_result.count or 0
     }
+
+
+@router.get("/metrics")
+async def get_worker_metrics(request: Request, admin: dict = Depends(require_admin)):
+    """Get in-process cache and pipeline metrics for the worker serving this request (admin only)"""
+    metrics = {
+        "apiKeyCache": api_key_cache.stats(),
+        "pubsubMultiplexer": (await get_pubsub_multiplexer()).stats(),
+        "sessionCache": (await get_session_cache()).stats()
+    }
+    
+    dispatcher = getattr(request.app.state, "webhook_dispatcher", None)
+    if dispatcher:
+        metrics["webhookRouting"] = dispatcher.routing.stats()
+        metrics["webhookLogSink"] = dispatcher.log_sink.stats()
+    
+    return metrics
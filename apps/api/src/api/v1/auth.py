@@ -3,9 +3,11 @@ Authentication and Profile Management Endpoints.
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Body
 from typing import Annotated
-from supabase import Client
+from supabase import AsyncClient
 from ...core.supabase import get_supabase_client, get_supabase_service_client
 from ...core.auth import get_current_user
+from ...core.auth_cache import publish_auth_invalidation
+from ...core.redis_client import RedisClient
 from ...models.auth import (
     RegisterRequest, 
     LoginRequest, 
@@ -21,15 +23,15 @@ router = APIRouter(prefix="/auth", tags=["Authentication"])
 @router.post("/register", response_model=AuthResponse, status_code=status.HTTP_201_CREATED)
 async def register(
     request: RegisterRequest,
-    supabase: Annotated[Client, Depends(get_supabase_client)],
-    service_client: Annotated[Client, Depends(get_supabase_service_client)]
+    supabase: Annotated[AsyncClient, Depends(get_supabase_client)],
+    service_client: Annotated[AsyncClient, Depends(get_supabase_service_client)]
 ):
     """
     Register a new user.
     """
     try:
         # Create user in Supabase Auth
-        auth_response = supabase.auth.sign_up({
+        auth_response = await supabase.auth.sign_up({
             "email": request.email,
             "password": request.password,
             "options": {
@@ -49,7 +51,7 @@ async def register(
         
         # Check if profile exists (Trigger might have created it)
         try:
-            profile = service_client.table('profiles').select('*').eq('id', auth_response.user.id).single().execute()
+            profile = await service_client.table('profiles').select('*').eq('id', auth_response.user.id).single().execute()
             profile_data = profile.data
         except Exception:
             # Profile not found (Trigger failed or not installed), create it manually
@@ -63,7 +65,7 @@ async def register(
             # Clean None values
             new_profile = {k: v for k, v in new_profile.items() if v is not None}
             
-            profile = service_client.table('profiles').insert(new_profile).execute()
+            profile = await service_client.table('profiles').insert(new_profile).execute()
             profile_data = profile.data[0]
 
         # Update profile with extra data if needed (if it was created by trigger but missing fields)
@@ -93,15 +95,15 @@ async def register(
 @router.post("/login", response_model=AuthResponse)
 async def login(
     request: LoginRequest,
-    supabase: Annotated[Client, Depends(get_supabase_client)],
-    service_client: Annotated[Client, Depends(get_supabase_service_client)]
+    supabase: Annotated[AsyncClient, Depends(get_supabase_client)],
+    service_client: Annotated[AsyncClient, Depends(get_supabase_service_client)]
 ):
     """
     Login with email and password.
     """
     try:
         # Authenticate with Supabase Auth
-        auth_response = supabase.auth.sign_in_with_password({
+        auth_response = await supabase.auth.sign_in_with_password({
             "email": request.email,
             "password": request.password
         })
@@ -111,7 +113,7 @@ async def login(
 
         # Fetch profile using Service Role to bypass RLS
         # Injected via dependency
-        profile = service_client.table('profiles').select('*').eq('id', auth_response.user.id).single().execute()
+        profile = await service_client.table('profiles').select('*').eq('id', auth_response.user.id).single().execute()
         
         return AuthResponse(
             access_token=auth_response.session.access_token,
@@ -128,13 +130,13 @@ async def login(
 @router.post("/forgot-password", status_code=status.HTTP_200_OK)
 async def forgot_password(
     request: ForgotPasswordRequest,
-    supabase: Annotated[Client, Depends(get_supabase_client)]
+    supabase: Annotated[AsyncClient, Depends(get_supabase_client)]
 ):
     """
     Request password reset email.
     """
     try:
-        supabase.auth.reset_password_email(request.email)
+        await supabase.auth.reset_password_email(request.email)
         return {"message": "Password reset email sent if exists"}
     except Exception as e:
         # Don't reveal if email exists or not
@@ -153,7 +155,7 @@ async def get_profile(
 async def update_profile(
     request: ProfileUpdateRequest,
     current_user: Annotated[dict, Depends(get_current_user)],
-    supabase: Annotated[Client, Depends(get_supabase_client)]
+    supabase: Annotated[AsyncClient, Depends(get_supabase_client)]
 ):
     """
     Update current user profile (Protected).
@@ -166,10 +168,14 @@ async def update_profile(
             return ProfileResponse(**current_user)
             
         # Update using RLS (current_user['id'] matches auth.uid())
-        response = supabase.table('profiles').update(update_data).eq('id', current_user['id']).execute()
+        response = await supabase.table('profiles').update(update_data).eq('id', current_user['id']).execute()
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Profile not found")
+        
+        # Drop cached copies of this profile on every worker
+        redis = await RedisClient.get_client()
+        await publish_auth_invalidation(redis, user_id=str(current_user['id']))
             
         return ProfileResponse(**response.data[0])
         
@@ -12,6 +12,8 @@ from datetime import datetime, timedelta
 from ...core.auth import get_current_user
 from ...core.supabase import get_supabase_service_client as get_supabase_client
 from ...services.payment import PaymentService
+from ...services.quota import get_quota_engine
+from ...utils.logger import logger
 from ...models.payment import PaymentLinkRequest
 from ...models.billing import (
     SubscriptionResponse, CheckoutRequest, CheckoutResponse,
@@ -21,6 +23,15 @@ from ...models.billing import (
 router = APIRouter(prefix="/billing", tags=["billing"])
 
 
+async def refresh_cached_quota(user_id: str) -> None:
+    """Make the quota engine reload plan limits after a subscription change"""
+    try:
+        quota_engine = await get_quota_engine()
+        await quota_engine.invalidate(user_id)
+    except Exception as e:
+        logger.warning(f"Failed to refresh cached quota for {user_id}: {e}")
+
+
 
 
 
@@ -37,14 +48,14 @@ async def subscribe(
 ):
     """Subscribe to a plan (handles activation and downgrades)"""
     try:
-        supabase = get_supabase_client()
+        supabase = await get_supabase_client()
         
         if request.plan == PlanType.FREE:
             # Handle manual activation or downgrade to free
             free_config = PLAN_LIMITS[PlanType.FREE]
             
             # Get current subscription to check if we need to cancel Stripe
-            sub_result = supabase.table("subscriptions")\
+            sub_result = await supabase.table("subscriptions")\
                 .select("stripe_subscription_id")\
                 .eq("user_id", str(user["id"]))\
                 .limit(1)\
@@ -70,7 +81,9 @@ async def subscribe(
             }
             
             # Use upsert to handle both create and update
-            updated_sub = supabase.table("subscriptions").upsert(upsert_data, on_conflict="user_id").execute()
+            updated_sub = await supabase.table("subscriptions").upsert(upsert_data, on_conflict="user_id").execute()
+            
+            await refresh_cached_quota(str(user["id"]))
             
             return SubscriptionResponse(**updated_sub.data[0])
         else:
@@ -150,9 +163,9 @@ async def verify_payment(
                 plan = PlanType(plan_str)
                 plan_config = PLAN_LIMITS[plan]
                 
-                supabase = get_supabase_client()
+                supabase = await get_supabase_client()
                 
-                result = supabase.table("subscriptions").upsert({
+                result = await supabase.table("subscriptions").upsert({
                     "user_id": str(user["id"]),
                     "plan": plan.value,
                     "status": "active",
@@ -164,6 +177,7 @@ async def verify_payment(
                     "current_period_start": datetime.now().isoformat(),
                     "current_period_end": (datetime.now() + timedelta(days=30)).isoformat()
                 }, on_conflict="user_id").execute()
+                await refresh_cached_quota(str(user["id"]))
                 
                 logger.info(f"Subscription activated for user {user['id']} - Plan: {plan.value} via payment verification")
                 
@@ -191,8 +205,8 @@ async def verify_payment(
 async def get_plans():
     """Get all available subscription plans"""
     try:
-        supabase = get_supabase_client()
-        result = supabase.table("plans").select("*").execute()
+        supabase = await get_supabase_client()
+        result = await supabase.table("plans").select("*").execute()
         
         if result.data:
             plans = []
@@ -231,9 +245,9 @@ async def get_plans():
 async def get_subscription(user=Depends(get_current_user)):
     """Get current user's subscription"""
     try:
-        supabase = get_supabase_client()
+        supabase = await get_supabase_client()
         
-        result = supabase.table("subscriptions")\
+        result = await supabase.table("subscriptions")\
             .select("*")\
             .eq("user_id", str(user["id"]))\
             .limit(1)\
@@ -255,9 +269,9 @@ async def get_subscription(user=Depends(get_current_user)):
 async def get_usage(user=Depends(get_current_user)):
     """Get current usage statistics"""
     try:
-        supabase = get_supabase_client()
+        supabase = await get_supabase_client()
         
-        result = supabase.table("subscriptions")\
+        result = await supabase.table("subscriptions")\
             .select("messages_used, message_limit")\
             .eq("user_id", str(user["id"]))\
             .limit(1)\
@@ -270,6 +284,15 @@ async def get_usage(user=Depends(get_current_user)):
         messages_used = sub.get("messages_used", 0)
         message_limit = sub.get("message_limit", 100)
         
+        # The live counter in Redis includes sends not yet reconciled to Postgres
+        try:
+            quota_engine = await get_quota_engine()
+            cached_used = await quota_engine.get_cached_usage(str(user["id"]))
+            if cached_used is not None:
+                messages_used = cached_used
+        except Exception as e:
+            logger.warning(f"Failed to read cached quota usage: {e}")
+        
         return UsageResponse(
             messages_used=messages_used,
             message_limit=message_limit,
@@ -346,9 +369,9 @@ async def create_checkout_session(
 async def create_portal_session(user=Depends(get_current_user)):
     """Create a Stripe customer portal session for managing subscription"""
     try:
-        supabase = get_supabase_client()
+        supabase = await get_supabase_client()
         
-        result = supabase.table("subscriptions")\
+        result = await supabase.table("subscriptions")\
             .select("stripe_customer_id")\
             .eq("user_id", str(user["id"]))\
             .limit(1)\
@@ -421,10 +444,10 @@ async def webhook(request: Request):
                         plan = PlanType(plan_str)
                         plan_config = PLAN_LIMITS[plan]
                         
-                        supabase = get_supabase_client()
+                        supabase = await get_supabase_client()
                         
                         # Check if subscription already activated (by /verify-payment)
-                        existing = supabase.table("subscriptions")\
+                        existing = await supabase.table("subscriptions")\
                             .select("id, status")\
                             .eq("user_id", user_id)\
                             .limit(1)\
@@ -436,7 +459,7 @@ async def webhook(request: Request):
                             logger.info(f"Activating subscription via webhook for user {user_id}")
                         
                         # Activate subscription (upsert is idempotent)
-                        supabase.table("subscriptions").upsert({
+                        await supabase.table("subscriptions").upsert({
                             "user_id": user_id,
                             "plan": plan.value,
                             "status": "active",
@@ -448,6 +471,7 @@ async def webhook(request: Request):
                             "current_period_start": datetime.now().isoformat(),
                             "current_period_end": (datetime.now() + timedelta(days=30)).isoformat()
                         }, on_conflict="user_id").execute()
+                        await refresh_cached_quota(user_id)
                         
                         logger.info(f"✅ Subscription activated for user {user_id} - Plan: {plan.value} (via webhook)")
                         
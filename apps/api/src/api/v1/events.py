@@ -1,10 +1,30 @@
 """
-Events API endpoint.
-Provides the catalog of available webhook event types.
+Events API endpoints.
+Provides the catalog of available webhook event types and a WebSocket
+push channel for customers who cannot host a webhook URL.
 """
-from fastapi import APIRouter
+from fastapi import (
+    APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect, WebSocketException, status
+)
+from typing import Optional
+import asyncio
+import logging
+import re
+import orjson
+
+from ...core.auth import get_current_user, get_websocket_user
+from ...core.redis_client import RedisClient
+from ...core.pubsub_multiplexer import get_pubsub_multiplexer, StreamLimitExceeded
+from ...services.user_events import user_events_channel, user_feed_stream
 
 router = APIRouter(prefix="/events", tags=["Events"])
+logger = logging.getLogger(__name__)
+
+WS_QUEUE_SIZE = 256  # events buffered per connection before it counts as a slow consumer
+WS_SEND_TIMEOUT = 10.0  # seconds a single send may block before the client is dropped
+WS_SLOW_CONSUMER = 4008  # application close code for clients that cannot keep up
+
+_FEED_CURSOR = re.compile(r"^\d+(-\d+)?$")
 
 
 # Event catalog - matches the Node.js event-types.ts
@@ -160,3 +180,147 @@ async def list_events():
             "session.disconnected"
         ]
     }
+
+
+@router.get("/feed")
+async def get_event_feed(
+    cursor: Optional[str] = Query(None, description="nextCursor of the previous call; omit to start at the oldest retained event"),
+    wait: int = Query(30, ge=0, le=30, description="Seconds to wait for new events when there are none"),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Long-poll the user's events (webhook payload format), a pull alternative to webhooks.
+    
+    Returns the events after **cursor** at once if there are any, otherwise
+    waits up to **wait** seconds for the next one. Pass the returned
+    `nextCursor` to the next call. Events are retained for
+    EVENTS_FEED_RETENTION_SECONDS (24 hours by default), so a consumer can
+    catch up after downtime by calling repeatedly while `hasMore` is true.
+    """
+    if cursor is not None and not _FEED_CURSOR.match(cursor):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    cursor = cursor or "0-0"
+    
+    redis = await RedisClient.get_client()
+    feed = user_feed_stream(current_user['id'])
+    
+    async def read():
+        result = await redis.xread({feed: cursor}, count=limit)
+        return result[0][1] if result else []
+    
+    entries = await read()
+    if not entries and wait > 0:
+        # Wait on the user's pub/sub channel (shared connection) rather than
+        # holding a pooled connection in XREAD BLOCK for the whole wait
+        multiplexer = await get_pubsub_multiplexer()
+        try:
+            subscription = await multiplexer.subscribe(
+                user_events_channel(current_user['id']), current_user['id'], queue_size=1
+            )
+        except StreamLimitExceeded as e:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=str(e)
+            )
+        try:
+            # Re-read once subscribed so an event appended in between is not missed
+            entries = await read()
+            if not entries and await subscription.get(timeout=wait) is not None:
+                entries = await read()
+        finally:
+            await subscription.close()
+    
+    return {
+        "events": [orjson.loads(fields['data']) for _, fields in entries],
+        "nextCursor": entries[-1][0] if entries else cursor,
+        "hasMore": len(entries) == limit,
+    }
+
+
+@router.websocket("/ws")
+async def events_websocket(
+    websocket: WebSocket,
+    session_id: Optional[str] = Query(None, alias="sessionId"),
+    events: Optional[str] = Query(None, description="Comma-separated event types"),
+    current_user: dict = Depends(get_websocket_user),
+):
+    """
+    Push the user's events (webhook payload format) over a WebSocket.
+    
+    - **token**: JWT or API key, if no `Authorization: Bearer` header can be sent
+    - **sessionId**: only events of this session
+    - **events**: only these event types, e.g. `message.received,session.connected`
+    
+    Each connection has a bounded buffer. A client that falls behind is
+    disconnected with close code 4008 and should reconnect.
+    """
+    event_types = {e.strip() for e in events.split(",") if e.strip()} if events else None
+    
+    multiplexer = await get_pubsub_multiplexer()
+    try:
+        subscription = await multiplexer.subscribe(
+            user_events_channel(current_user['id']),
+            current_user['id'],
+            queue_size=WS_QUEUE_SIZE,
+            drop_oldest=False
+        )
+    except StreamLimitExceeded as e:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=str(e))
+    
+    async def push():
+        while True:
+            data = await subscription.get()
+            if subscription.overflowed:
+                return "Slow consumer"
+            
+            try:
+                payload = orjson.loads(data)
+            except orjson.JSONDecodeError:
+                continue
+            if event_types is not None and payload.get('type') not in event_types:
+                continue
+            if session_id and (payload.get('data') or {}).get('session_id') != session_id:
+                continue
+            
+            try:
+                await asyncio.wait_for(
+                    websocket.send_text(data if isinstance(data, str) else data.decode('utf-8')),
+                    timeout=WS_SEND_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                return "Slow consumer"
+            except WebSocketDisconnect:
+                return None
+    
+    async def receive():
+        # Client messages are ignored; this notices the disconnect
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return None
+    
+    tasks = set()
+    try:
+        await websocket.accept()
+        logger.info(f"Events WebSocket opened for user {current_user['id']}")
+        
+        tasks = {asyncio.create_task(push()), asyncio.create_task(receive())}
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        reason = next(iter(done)).result()
+        if reason:
+            logger.info(f"Closing events WebSocket of user {current_user['id']}: {reason}")
+            await websocket.close(code=WS_SLOW_CONSUMER, reason=reason)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.warning(f"Events WebSocket of user {current_user['id']} failed: {e}")
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Release the stream slot even if this handler is being cancelled
+        await asyncio.shield(subscription.close())
+        logger.info(f"Events WebSocket closed for user {current_user['id']}")
@@ -1,11 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from supabase import Client
+from supabase import AsyncClient
 from datetime import datetime, timedelta, timezone
 from uuid import UUID
 
 from ...core.auth import get_current_user
+from ...core.auth_cache import publish_auth_invalidation
+from ...core.redis_client import RedisClient
 from ...core.supabase import get_supabase_service_client
 from ...core.security import generate_api_key, hash_api_key, get_key_prefix
+from ...services.api_key_usage import get_pending_usage
 from ...models.api_key import (
     CreateKeyRequest,
     KeyResponse,
@@ -20,7 +23,7 @@ router = APIRouter(prefix="/keys", tags=["API Keys"])
 async def create_api_key(
     request: CreateKeyRequest,
     current_user: dict = Depends(get_current_user),
-    service_client: Client = Depends(get_supabase_service_client)
+    service_client: AsyncClient = Depends(get_supabase_service_client)
 ):
     """
     Create a new API key for the authenticated user.
@@ -39,7 +42,7 @@ async def create_api_key(
     
     # Insert into database
     try:
-        result = service_client.table('api_keys').insert({
+        result = await service_client.table('api_keys').insert({
             'user_id': current_user['id'],
             'key_hash': key_hash,
             'key_prefix': key_prefix,
@@ -70,10 +73,10 @@ async def create_api_key(
 @router.get("", response_model=KeyListResponse)
 async def list_api_keys(
     current_user: dict = Depends(get_current_user),
-    service_client: Client = Depends(get_supabase_service_client)
+    service_client: AsyncClient = Depends(get_supabase_service_client)
 ):
     """List all active API keys for the authenticated user"""
-    result = service_client.table('api_keys')\
+    result = await service_client.table('api_keys')\
         .select('*')\
         .eq('user_id', current_user['id'])\
         .is_('revoked_at', 'null')\
@@ -89,10 +92,10 @@ async def list_api_keys(
 async def get_api_key(
     key_id: UUID,
     current_user: dict = Depends(get_current_user),
-    service_client: Client = Depends(get_supabase_service_client)
+    service_client: AsyncClient = Depends(get_supabase_service_client)
 ):
     """Get details of a specific API key"""
-    result = service_client.table('api_keys')\
+    result = await service_client.table('api_keys')\
         .select('*')\
         .eq('id', str(key_id))\
         .eq('user_id', current_user['id'])\
@@ -112,14 +115,14 @@ async def get_api_key(
 async def revoke_api_key(
     key_id: UUID,
     current_user: dict = Depends(get_current_user),
-    service_client: Client = Depends(get_supabase_service_client)
+    service_client: AsyncClient = Depends(get_supabase_service_client)
 ):
     """
     Revoke an API key (soft delete).
     
     The key will no longer be valid for authentication.
     """
-    result = service_client.table('api_keys')\
+    result = await service_client.table('api_keys')\
         .update({'revoked_at': datetime.now(timezone.utc).isoformat()})\
         .eq('id', str(key_id))\
         .eq('user_id', current_user['id'])\
@@ -132,16 +135,20 @@ async def revoke_api_key(
             detail="API key not found or already revoked"
         )
     
+    # Drop the key from every worker's auth cache
+    redis = await RedisClient.get_client()
+    await publish_auth_invalidation(redis, key_id=str(key_id))
+    
     return None
 
 @router.get("/{key_id}/usage", response_model=KeyUsageStats)
 async def get_key_usage_stats(
     key_id: UUID,
     current_user: dict = Depends(get_current_user),
-    service_client: Client = Depends(get_supabase_service_client)
+    service_client: AsyncClient = Depends(get_supabase_service_client)
 ):
     """Get usage statistics for a specific API key"""
-    result = service_client.table('api_keys')\
+    result = await service_client.table('api_keys')\
         .select('*')\
         .eq('id', str(key_id))\
         .eq('user_id', current_user['id'])\
@@ -169,10 +176,25 @@ async def get_key_usage_stats(
             
     is_expired = expires_at and datetime.now(timezone.utc) > expires_at
     
+    # Merge usage that is still waiting in Redis for the next flush
+    request_count = key_data.get('request_count') or 0
+    last_used_at = key_data.get('last_used_at')
+    try:
+        redis = await RedisClient.get_client()
+        pending_count, pending_last_used_at = await get_pending_usage(redis, str(key_id))
+        request_count += pending_count
+        if pending_last_used_at and (
+            not last_used_at
+            or datetime.fromisoformat(pending_last_used_at) > datetime.fromisoformat(last_used_at)
+        ):
+            last_used_at = pending_last_used_at
+    except Exception:
+        pass  # Fall back to the flushed numbers
+    
     return KeyUsageStats(
         key_id=key_data['id'],
-        request_count=key_data['request_count'],
-        last_used_at=key_data.get('last_used_at'),
+        request_count=request_count,
+        last_used_at=last_used_at,
         created_at=key_data['created_at'],
         days_since_creation=days_since_creation,
         is_expired=bool(is_expired),
@@ -3,17 +3,24 @@ Messages API endpoints.
 Story 2.1: Basic Text Messaging Endpoint
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from supabase import Client
-from uuid import UUID
+from supabase import AsyncClient
+from uuid import UUID, uuid4
+import logging
+import re
 
 from ...core.auth import get_current_user
+from ...core.config import settings
 from ...core.supabase import get_supabase_service_client
-from ...core.redis_client import RedisClient
-from ...core.stream_producer import StreamProducer
+from ...core.stream_producer import get_stream_producer
+from ...services.quota import QuotaResult, get_quota_engine
+from ...services.session_cache import get_session_cache
 from ...models.message import (
     SendTextRequest,
     SendMediaRequest,
     SendAudioRequest,
+    SendBatchRequest,
+    SendBatchResponse,
+    BatchMessageItem,
     MessageResponse,
     MessageListResponse,
     MessageStatus,
@@ -21,90 +28,57 @@ from ...models.message import (
 )
 
 router = APIRouter(prefix="/messages", tags=["Messages"])
+logger = logging.getLogger(__name__)
 
+TEMPLATE_VARIABLE = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+BATCH_INSERT_CHUNK = 1000  # rows per PostgREST insert
 
-from datetime import datetime
-from dateutil import parser as date_parser
 
-async def check_and_increment_quota(user_id: str, supabase: Client) -> None:
+async def check_and_increment_quota(user_id: str, supabase: AsyncClient, amount: int = 1) -> QuotaResult:
     """
     Check if user has remaining quota and increment usage.
-    Raises HTTPException 403 if quota exceeded.
+    Raises HTTPException 402 if there is no valid subscription, 403 if quota exceeded.
     """
-    print(f"Checking quota for User ID: {user_id}")
-    result = supabase.table("subscriptions")\
-        .select("messages_used, message_limit, current_period_end, plan, status, quota_alert_sent_80, quota_alert_sent_100")\
-        .eq("user_id", str(user_id))\
-        .limit(1)\
-        .execute()
+    quota_engine = await get_quota_engine()
+    return await quota_engine.check_and_increment(user_id, supabase, amount=amount)
+
+
+async def resolve_connected_session(user_id: str, session_id: UUID | None, supabase: AsyncClient) -> str:
+    """
+    Session to send from: `session_id`, or the user's newest connected session.
+    Read from the session cache. Raises HTTPException 404 if the session is
+    not the user's, 409 if it is not connected.
+    """
+    session_cache = await get_session_cache()
+    if not session_id:
+        session = await session_cache.connected_session(user_id, supabase)
+        if session is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="No connected WhatsApp session found. Please connect a session first."
+            )
+        return str(session['id'])
     
-    if not result.data:
-        print(f"No subscription found for User ID: {user_id}")
+    session = await session_cache.get_session(user_id, str(session_id), supabase)
+    if session is None:
         raise HTTPException(
-            status_code=status.HTTP_402_PAYMENT_REQUIRED,
-            detail="No active subscription found. Please activate a plan in the dashboard."
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Session not found"
         )
     
-    sub = result.data[0]
-    print(f"Subscription found: {sub}")
-    
-    # Check for expiration
-    if sub.get("current_period_end"):
-        try:
-            expiry = date_parser.parse(sub["current_period_end"])
-            # Naive comparison for simplicity, or ensure both are offset-aware
-            now = datetime.now(expiry.tzinfo)
-            if now > expiry:
-                print(f"Subscription expired: {expiry} vs Now: {now}")
-                raise HTTPException(
-                    status_code=status.HTTP_402_PAYMENT_REQUIRED,
-                    detail=f"Subscription expired on {expiry.strftime('%Y-%m-%d')}. Please upgrade your plan."
-                )
-        except Exception as e:
-            print(f"Date parse error: {e}")
-            # Don't block on date error? Or block safer?
-            pass
-
-    messages_used = sub.get("messages_used", 0)
-    message_limit = sub.get("message_limit", 100)
-    
-    print(f"Usage: {messages_used}/{message_limit}")
-    
-    # Check if quota exceeded
-    if message_limit > 0 and messages_used >= message_limit:
-        print("Quota exceeded")
+    if session['status'] != 'connected':
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Monthly message quota exceeded ({message_limit} messages). Please upgrade your plan."
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Session is not connected (status: {session['status']})"
         )
-    
-    # Increment usage
-    new_usage = messages_used + 1
-    update_data = {"messages_used": new_usage}
-    
-    # Check for 80% threshold alert
-    if message_limit > 0:
-        usage_percent = (new_usage / message_limit) * 100
-        if usage_percent >= 80 and not sub.get("quota_alert_sent_80"):
-            update_data["quota_alert_sent_80"] = True
-            # TODO: Send email alert at 80%
-        
-        # Check for 100% threshold alert
-        if usage_percent >= 100 and not sub.get("quota_alert_sent_100"):
-            update_data["quota_alert_sent_100"] = True
-            # TODO: Send email alert at 100%
-    
-    supabase.table("subscriptions")\
-        .update(update_data)\
-        .eq("user_id", str(user_id))\
-        .execute()
+    return str(session_id)
 
 
 @router.post("", response_model=MessageResponse, status_code=status.HTTP_202_ACCEPTED)
 async def send_text_message(
     request: SendTextRequest,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_service_client),
+    supabase: AsyncClient = Depends(get_supabase_service_client),
 ):
     """
     Send a text message via WhatsApp.
@@ -113,44 +87,7 @@ async def send_text_message(
     """
     print(f"[DEBUG] Received send_text_message request. To: {request.to}")
     print(f"[DEBUG] Current User ID: {current_user.get('id')}")
-    # Get user's default session if not specified
-    session_id = request.session_id
-    if not session_id:
-        result = supabase.table('sessions')\
-            .select('id')\
-            .eq('user_id', current_user['id'])\
-            .eq('status', 'connected')\
-            .order('created_at', desc=True)\
-            .limit(1)\
-            .execute()
-        
-        if not result.data:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="No connected WhatsApp session found. Please connect a session first."
-            )
-        
-        session_id = result.data[0]['id']
-    
-    # Verify session belongs to user and is connected
-    session_result = supabase.table('sessions')\
-        .select('*')\
-        .eq('id', str(session_id))\
-        .eq('user_id', current_user['id'])\
-        .single()\
-        .execute()
-    
-    if not session_result.data:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Session not found"
-        )
-    
-    if session_result.data['status'] != 'connected':
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail=f"Session is not connected (status: {session_result.data['status']})"
-        )
+    session_id = await resolve_connected_session(current_user['id'], request.session_id, supabase)
     
     # Check and increment quota
     print("[DEBUG] Calling check_and_increment_quota...")
@@ -158,7 +95,7 @@ async def send_text_message(
     print("[DEBUG] check_and_increment_quota completed")
     
     # Create message record
-    message_result = supabase.table('messages').insert({
+    message_result = await supabase.table('messages').insert({
         'user_id': current_user['id'],
         'session_id': str(session_id),
         'to_phone': request.to,
@@ -170,8 +107,7 @@ async def send_text_message(
     message_data = message_result.data[0]
     
     # Publish SEND_TEXT command to Redis
-    redis_client = await RedisClient.get_client()
-    producer = StreamProducer(redis_client)
+    producer = await get_stream_producer()
     print(f"[DEBUG] Publishing SEND_TEXT to Redis for message {message_data['id']}")
     await producer.publish_command(
         "SEND_TEXT",
@@ -190,7 +126,7 @@ async def send_text_message(
 async def send_media_message(
     request: SendMediaRequest,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_service_client),
+    supabase: AsyncClient = Depends(get_supabase_service_client),
 ):
     """
     Send an image or video message via WhatsApp.
@@ -202,50 +138,13 @@ async def send_media_message(
     
     Returns 202 Accepted - message is processed asynchronously.
     """
-    # Get user's default session if not specified
-    session_id = request.session_id
-    if not session_id:
-        result = supabase.table('sessions')\
-            .select('id')\
-            .eq('user_id', current_user['id'])\
-            .eq('status', 'connected')\
-            .order('created_at', desc=True)\
-            .limit(1)\
-            .execute()
-        
-        if not result.data:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="No connected WhatsApp session found. Please connect a session first."
-            )
-        
-        session_id = result.data[0]['id']
-    
-    # Verify session belongs to user and is connected
-    session_result = supabase.table('sessions')\
-        .select('*')\
-        .eq('id', str(session_id))\
-        .eq('user_id', current_user['id'])\
-        .single()\
-        .execute()
-    
-    if not session_result.data:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Session not found"
-        )
-    
-    if session_result.data['status'] != 'connected':
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail=f"Session is not connected (status: {session_result.data['status']})"
-        )
+    session_id = await resolve_connected_session(current_user['id'], request.session_id, supabase)
     
     # Check and increment quota
     await check_and_increment_quota(current_user['id'], supabase)
     
     # Create message record
-    message_result = supabase.table('messages').insert({
+    message_result = await supabase.table('messages').insert({
         'user_id': current_user['id'],
         'session_id': str(session_id),
         'to_phone': request.to,
@@ -263,8 +162,7 @@ async def send_media_message(
     command_type = "SEND_IMAGE" if request.media_type == MessageType.IMAGE else "SEND_VIDEO"
     
     # Publish command to Redis
-    redis_client = await RedisClient.get_client()
-    producer = StreamProducer(redis_client)
+    producer = await get_stream_producer()
     await producer.publish_command(
         command_type,
         {
@@ -284,7 +182,7 @@ async def send_media_message(
 async def send_audio_message(
     request: SendAudioRequest,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_service_client),
+    supabase: AsyncClient = Depends(get_supabase_service_client),
 ):
     """
     Send an audio file or voice note via WhatsApp.
@@ -294,50 +192,13 @@ async def send_audio_message(
     
     Returns 202 Accepted - message is processed asynchronously.
     """
-    # Get user's default session if not specified
-    session_id = request.session_id
-    if not session_id:
-        result = supabase.table('sessions')\
-            .select('id')\
-            .eq('user_id', current_user['id'])\
-            .eq('status', 'connected')\
-            .order('created_at', desc=True)\
-            .limit(1)\
-            .execute()
-        
-        if not result.data:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="No connected WhatsApp session found. Please connect a session first."
-            )
-        
-        session_id = result.data[0]['id']
-    
-    # Verify session belongs to user and is connected
-    session_result = supabase.table('sessions')\
-        .select('*')\
-        .eq('id', str(session_id))\
-        .eq('user_id', current_user['id'])\
-        .single()\
-        .execute()
-    
-    if not session_result.data:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Session not found"
-        )
-    
-    if session_result.data['status'] != 'connected':
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail=f"Session is not connected (status: {session_result.data['status']})"
-        )
+    session_id = await resolve_connected_session(current_user['id'], request.session_id, supabase)
     
     # Check and increment quota
     await check_and_increment_quota(current_user['id'], supabase)
     
     # Create message record
-    message_result = supabase.table('messages').insert({
+    message_result = await supabase.table('messages').insert({
         'user_id': current_user['id'],
         'session_id': str(session_id),
         'to_phone': request.to,
@@ -352,8 +213,7 @@ async def send_audio_message(
     message_data = message_result.data[0]
     
     # Publish SEND_AUDIO command to Redis
-    redis_client = await RedisClient.get_client()
-    producer = StreamProducer(redis_client)
+    producer = await get_stream_producer()
     await producer.publish_command(
         "SEND_AUDIO",
         {
@@ -369,6 +229,146 @@ async def send_audio_message(
     return MessageResponse(**message_data)
 
 
+async def refund_quota(user_id: str, amount: int) -> None:
+    """Return quota reserved for messages that were never queued (best effort)"""
+    try:
+        quota_engine = await get_quota_engine()
+        await quota_engine.refund(user_id, amount)
+    except Exception as e:
+        logger.error(f"Failed to refund {amount} messages of quota to user {user_id}: {e}")
+
+
+async def _mark_failed(supabase: AsyncClient, message_ids: list[str]) -> None:
+    await supabase.table('messages')\
+        .update({
+            'status': MessageStatus.FAILED.value,
+            'error_message': 'Failed to queue message'
+        })\
+        .in_('id', message_ids)\
+        .execute()
+
+
+def render_message_template(template: str, variables: dict[str, str]) -> str:
+    """Substitute {{name}} placeholders. Raises KeyError for a missing variable."""
+    return TEMPLATE_VARIABLE.sub(lambda m: variables[m.group(1)], template)
+
+
+@router.post("/batch", response_model=SendBatchResponse, status_code=status.HTTP_202_ACCEPTED)
+async def send_batch_messages(
+    request: SendBatchRequest,
+    current_user: dict = Depends(get_current_user),
+    supabase: AsyncClient = Depends(get_supabase_service_client),
+):
+    """
+    Send a text message to many recipients in one request.
+    
+    The message may contain `{{name}}` placeholders filled from each recipient's
+    `variables`. The session and quota are checked once for the whole batch,
+    rows are inserted in bulk and the commands are published in one pipeline.
+    
+    Returns 202 Accepted with the batch id and one message id per recipient,
+    in recipient order.
+    """
+    if len(request.recipients) > settings.message_batch_max_size:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"A batch can contain at most {settings.message_batch_max_size} recipients"
+        )
+    
+    # Render every message up front so a bad recipient rejects the whole batch
+    texts = []
+    for index, recipient in enumerate(request.recipients):
+        try:
+            text = render_message_template(request.message, recipient.variables)
+        except KeyError as e:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Recipient {index} ({recipient.to}) is missing variable {e.args[0]}"
+            )
+        if len(text) > 4096:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Recipient {index} ({recipient.to}): rendered message exceeds 4096 characters"
+            )
+        texts.append(text)
+    
+    session_id = await resolve_connected_session(current_user['id'], request.session_id, supabase)
+    
+    # Reserve quota for the whole batch (all or nothing); unqueued messages are refunded
+    await check_and_increment_quota(current_user['id'], supabase, amount=len(texts))
+    
+    # Bulk insert message records
+    batch_id = uuid4()
+    rows = [
+        {
+            'user_id': current_user['id'],
+            'session_id': str(session_id),
+            'batch_id': str(batch_id),
+            'to_phone': recipient.to,
+            'type': 'text',
+            'content': {'message': text},
+            'status': MessageStatus.PENDING.value
+        }
+        for recipient, text in zip(request.recipients, texts)
+    ]
+    messages = []
+    try:
+        for start in range(0, len(rows), BATCH_INSERT_CHUNK):
+            insert_result = await supabase.table('messages')\
+                .insert(rows[start:start + BATCH_INSERT_CHUNK])\
+                .execute()
+            messages.extend(insert_result.data)
+    except Exception as e:
+        # Nothing has been queued yet: fail the rows already written and refund the batch
+        logger.error(f"Batch {batch_id} insert failed after {len(messages)} rows: {e}")
+        await refund_quota(current_user['id'], len(texts))
+        if messages:
+            await _mark_failed(supabase, [message_data['id'] for message_data in messages])
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to store the batch; no messages were queued"
+        )
+    
+    # Publish all SEND_TEXT commands in one round trip
+    producer = await get_stream_producer()
+    stream_ids = await producer.publish_many([
+        (
+            "SEND_TEXT",
+            {
+                "message_id": message_data['id'],
+                "session_id": str(session_id),
+                "to": message_data['to_phone'],
+                "message": message_data['content']['message']
+            }
+        )
+        for message_data in messages  # Row order is not guaranteed to match `texts`
+    ])
+    
+    # Commands that could not be queued will never be sent
+    failed_ids = [
+        message_data['id']
+        for message_data, stream_id in zip(messages, stream_ids)
+        if stream_id is None
+    ]
+    if failed_ids:
+        await refund_quota(current_user['id'], len(failed_ids))
+        await _mark_failed(supabase, failed_ids)
+    
+    failed = set(failed_ids)
+    return SendBatchResponse(
+        batch_id=batch_id,
+        total=len(messages),
+        messages=[
+            BatchMessageItem(
+                id=message_data['id'],
+                to_phone=message_data['to_phone'],
+                status=MessageStatus.FAILED if message_data['id'] in failed else MessageStatus.PENDING
+            )
+            for message_data in messages
+        ]
+    )
+
+
 @router.get("", response_model=MessageListResponse)
 async def list_messages(
     session_id: UUID | None = Query(None, alias="sessionId"),
@@ -376,7 +376,7 @@ async def list_messages(
     limit: int = Query(50, ge=1, le=100),
     offset: int = Query(0, ge=0),
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_service_client)
+    supabase: AsyncClient = Depends(get_supabase_service_client)
 ):
     """List messages with optional filters and pagination"""
     query = supabase.table('messages')\
@@ -389,7 +389,7 @@ async def list_messages(
     if message_status:
         query = query.eq('status', message_status.value)
     
-    result = query.order('created_at', desc=True)\
+    result = await query.order('created_at', desc=True)\
         .range(offset, offset + limit - 1)\
         .execute()
     
@@ -405,10 +405,10 @@ async def list_messages(
 async def get_message(
     message_id: UUID,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_service_client)
+    supabase: AsyncClient = Depends(get_supabase_service_client)
 ):
     """Get details of a specific message"""
-    result = supabase.table('messages')\
+    result = await supabase.table('messages')\
         .select('*')\
         .eq('id', str(message_id))\
         .eq('user_id', current_user['id'])\
@@ -2,19 +2,25 @@
 Session management API endpoints.
 Handles WhatsApp session creation, QR streaming (SSE), and session lifecycle.
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, status
 from fastapi.responses import StreamingResponse
-from supabase import Client
+from starlette.background import BackgroundTask
+from supabase import AsyncClient
 from uuid import UUID
 from datetime import datetime, timezone
+from typing import Optional
 import asyncio
 import json
 import logging
+import re
 
 from ...core.auth import get_current_user
 from ...core.supabase import get_supabase_service_client
 from ...core.redis_client import RedisClient
+from ...core.pubsub_multiplexer import get_pubsub_multiplexer, StreamLimitExceeded
 from ...core.stream_producer import StreamProducer
+from ...services.session_cache import get_session_cache
+from ...services.webhook_routing import publish_webhook_routing_change
 from ...models.session import (
     CreateSessionRequest,
     UpdateSessionRequest,
@@ -28,12 +34,41 @@ from ...models.session_settings import SessionSettingsUpdate, SessionSettingsRes
 router = APIRouter(prefix="/sessions", tags=["Sessions"])
 logger = logging.getLogger(__name__)
 
+SSE_HEARTBEAT_INTERVAL = 15.0  # seconds between keep-alive comments on an idle stream
+
+# Written by the engine: capped per-session event log and the latest QR code
+SESSION_EVENT_LOG_KEY = "session:{session_id}:events:log"
+SESSION_QR_KEY = "session:{session_id}:qr"
+_STREAM_ID = re.compile(r"^\d+-\d+$")
+
+_SSE_EVENT_NAMES = {
+    'QR_CODE_UPDATED': 'qr',
+    'SESSION_CONNECTED': 'connected',
+    'SESSION_FAILED': 'error',
+}
+
+
+def _sse_frame(event_data: dict) -> tuple[Optional[str], bool]:
+    """SSE frame for a session event (None if not streamed) and whether it ends the stream"""
+    event_type = event_data.get('type')
+    name = _SSE_EVENT_NAMES.get(event_type)
+    if name is None:
+        return None, False
+    stream_id = event_data.get('stream_id')
+    id_line = f"id: {stream_id}\n" if stream_id else ""
+    return f"{id_line}event: {name}\ndata: {json.dumps(event_data['payload'])}\n\n", event_type != 'QR_CODE_UPDATED'
+
+
+def _stream_id_key(stream_id: str) -> tuple[int, int]:
+    ms, seq = stream_id.split('-')
+    return int(ms), int(seq)
+
 
 @router.post("", response_model=SessionCreatedResponse, status_code=status.HTTP_201_CREATED)
 async def create_session(
     request: CreateSessionRequest,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_service_client),
+    supabase: AsyncClient = Depends(get_supabase_service_client),
 ):
     """
     Create a new WhatsApp session and initiate QR code generation.
@@ -42,7 +77,7 @@ async def create_session(
     """
     try:
         # Check session limit
-        sub_result = supabase.table("subscriptions")\
+        sub_result = await supabase.table("subscriptions")\
             .select("sessions_limit")\
             .eq("user_id", str(current_user['id']))\
             .limit(1)\
@@ -57,7 +92,7 @@ async def create_session(
         sessions_limit = sub_result.data[0].get("sessions_limit", 1)
 
         # Create session in database
-        result = supabase.table('sessions').insert({
+        result = await supabase.table('sessions').insert({
             'user_id': current_user['id'],
             'session_key': request.session_key,
             'status': SessionStatus.INITIALIZING.value
@@ -65,9 +100,11 @@ async def create_session(
         
         session_data = result.data[0]
         session_id = session_data['id']
+        await (await get_session_cache()).put_session(current_user['id'], session_data)
         
         # Publish INIT_SESSION command to Redis
         redis = await RedisClient.get_client()
+        await publish_webhook_routing_change(redis, session_id=session_id)
         producer = StreamProducer(redis)
         await producer.publish_command(
             "INIT_SESSION",
@@ -105,7 +142,8 @@ async def create_session(
 async def stream_qr_codes(
     session_id: UUID,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_service_client),
+    supabase: AsyncClient = Depends(get_supabase_service_client),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
 ):
     """
     Server-Sent Events stream for QR codes and connection status.
@@ -114,9 +152,13 @@ async def stream_qr_codes(
     - qr: QR code data (Base64 image)
     - connected: Session successfully connected
     - error: Connection failed
+    
+    Every event has an `id`. A reconnecting client that sends `Last-Event-ID`
+    (browsers do this automatically) first gets the events it missed. A new
+    client immediately gets the current QR code, if there is one.
     """
     # Verify session belongs to user
-    result = supabase.table('sessions')\
+    result = await supabase.table('sessions')\
         .select('*')\
         .eq('id', str(session_id))\
         .eq('user_id', current_user['id'])\
@@ -129,60 +171,95 @@ async def stream_qr_codes(
             detail="Session not found"
         )
     
+    # One shared pub/sub connection per worker; each client gets its own queue.
+    # Subscribe before reading the log so nothing falls between the two.
+    multiplexer = await get_pubsub_multiplexer()
+    try:
+        subscription = await multiplexer.subscribe(f"session:{session_id}:events", current_user['id'])
+    except StreamLimitExceeded as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e)
+        )
+    
+    if last_event_id and not _STREAM_ID.match(last_event_id):
+        last_event_id = None
+    
     async def event_generator():
-        """Generate SSE events from Redis Pub/Sub"""
+        """Replay missed events from the session log, then tail the live channel"""
         redis = await RedisClient.get_client()
-        pubsub = redis.pubsub()
-        channel = f"session:{session_id}:events"
-        await pubsub.subscribe(channel)
-        
-        logger.info(f"SSE stream started for session: {session_id}")
+        last_id = last_event_id
+        logger.info(f"SSE stream started for session: {session_id} (resume from {last_id})")
         
         try:
-            timeout_counter = 0
-            max_timeout = 300  # 5 minutes
+            if last_id:
+                missed = await redis.xrange(
+                    SESSION_EVENT_LOG_KEY.format(session_id=session_id),
+                    min=f"({last_id}",
+                    max="+"
+                )
+                for entry_id, fields in missed:
+                    last_id = entry_id
+                    try:
+                        event_data = {**json.loads(fields['data']), 'stream_id': entry_id}
+                    except (KeyError, json.JSONDecodeError):
+                        continue
+                    frame, done = _sse_frame(event_data)
+                    if frame:
+                        yield frame
+                    if done:
+                        return
+            else:
+                cached_qr = await redis.get(SESSION_QR_KEY.format(session_id=session_id))
+                if cached_qr:
+                    event_data = json.loads(cached_qr)
+                    last_id = event_data.get('stream_id')
+                    yield _sse_frame(event_data)[0]
             
-            while timeout_counter < max_timeout:
-                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            idle_seconds = 0.0
+            max_idle_seconds = 300  # 5 minutes
+            
+            while idle_seconds < max_idle_seconds:
+                data = await subscription.get(timeout=SSE_HEARTBEAT_INTERVAL)
                 
-                if message is None:
+                if data is None:
                     # Send heartbeat to keep connection alive
                     yield ": heartbeat\n\n"
-                    timeout_counter += 1
+                    idle_seconds += SSE_HEARTBEAT_INTERVAL
                     continue
                 
-                timeout_counter = 0  # Reset timeout on message receipt
+                idle_seconds = 0.0  # Reset timeout on message receipt
                 
                 try:
-                    event_data = json.loads(message['data'])
-                    event_type = event_data.get('type')
-                    
-                    if event_type == 'QR_CODE_UPDATED':
-                        yield f"event: qr\ndata: {json.dumps(event_data['payload'])}\n\n"
-                    
-                    elif event_type == 'SESSION_CONNECTED':
-                        yield f"event: connected\ndata: {json.dumps(event_data['payload'])}\n\n"
-                        break
-                    
-                    elif event_type == 'SESSION_FAILED':
-                        yield f"event: error\ndata: {json.dumps(event_data['payload'])}\n\n"
-                        break
-                        
+                    event_data = json.loads(data)
                 except json.JSONDecodeError:
-                    logger.warning(f"Invalid JSON in event: {message}")
+                    logger.warning(f"Invalid JSON in event: {data}")
                     continue
+                
+                stream_id = event_data.get('stream_id')
+                if stream_id:
+                    if last_id and _stream_id_key(stream_id) <= _stream_id_key(last_id):
+                        continue  # Already sent from the log
+                    last_id = stream_id
+                
+                frame, done = _sse_frame(event_data)
+                if frame:
+                    yield frame
+                if done:
+                    break
             
             # Timeout reached
-            if timeout_counter >= max_timeout:
+            if idle_seconds >= max_idle_seconds:
                 yield f"event: error\ndata: {{\"error\": \"Connection timeout\"}}\n\n"
         
         finally:
-            await pubsub.unsubscribe(channel)
+            await subscription.close()
             logger.info(f"SSE stream closed for session: {session_id}")
     
     return StreamingResponse(
         event_generator(),
         media_type="text/event-stream",
+        background=BackgroundTask(subscription.close),  # Generator may never start if the client left
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
@@ -194,18 +271,15 @@ async def stream_qr_codes(
 @router.get("", response_model=SessionListResponse)
 async def list_sessions(
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_service_client)
+    supabase: AsyncClient = Depends(get_supabase_service_client)
 ):
     """List all sessions for the authenticated user"""
-    result = supabase.table('sessions')\
-        .select('*')\
-        .eq('user_id', current_user['id'])\
-        .order('created_at', desc=True)\
-        .execute()
+    session_cache = await get_session_cache()
+    sessions = await session_cache.list_sessions(current_user['id'], supabase)
     
     return SessionListResponse(
-        sessions=[SessionResponse(**session) for session in result.data],
-        total=len(result.data)
+        sessions=[SessionResponse(**session) for session in sessions],
+        total=len(sessions)
     )
 
 
@@ -213,23 +287,19 @@ async def list_sessions(
 async def get_session(
     session_id: UUID,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_service_client)
+    supabase: AsyncClient = Depends(get_supabase_service_client)
 ):
     """Get details of a specific session"""
-    result = supabase.table('sessions')\
-        .select('*')\
-        .eq('id', str(session_id))\
-        .eq('user_id', current_user['id'])\
-        .single()\
-        .execute()
+    session_cache = await get_session_cache()
+    session = await session_cache.get_session(current_user['id'], str(session_id), supabase)
     
-    if not result.data:
+    if session is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Session not found"
         )
     
-    return SessionResponse(**result.data)
+    return SessionResponse(**session)
 
 
 @router.patch("/{session_id}", response_model=SessionResponse)
@@ -237,13 +307,13 @@ async def update_session(
     session_id: UUID,
     request: UpdateSessionRequest,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_service_client),
+    supabase: AsyncClient = Depends(get_supabase_service_client),
 ):
     """
     Update session details (e.g., session name).
     """
     # Verify session exists and belongs to user
-    result = supabase.table('sessions')\
+    result = await supabase.table('sessions')\
         .select('*')\
         .eq('id', str(session_id))\
         .eq('user_id', current_user['id'])\
@@ -265,11 +335,12 @@ async def update_session(
         return SessionResponse(**result.data)
     
     # Update session
-    updated = supabase.table('sessions')\
+    updated = await supabase.table('sessions')\
         .update(update_data)\
         .eq('id', str(session_id))\
         .execute()
     
+    await (await get_session_cache()).put_session(current_user['id'], updated.data[0])
     logger.info(f"Session updated: {session_id}")
     
     return SessionResponse(**updated.data[0])
@@ -279,7 +350,7 @@ async def update_session(
 async def delete_session(
     session_id: UUID,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_service_client),
+    supabase: AsyncClient = Depends(get_supabase_service_client),
 ):
     """
     Delete a WhatsApp session permanently.
@@ -287,7 +358,7 @@ async def delete_session(
     Publishes LOGOUT command to Node.js engine and removes session from database.
     """
     # Verify session exists
-    result = supabase.table('sessions')\
+    result = await supabase.table('sessions')\
         .select('*')\
         .eq('id', str(session_id))\
         .eq('user_id', current_user['id'])\
@@ -310,10 +381,14 @@ async def delete_session(
         )
     
     # Delete session from database
-    supabase.table('sessions')\
+    await supabase.table('sessions')\
         .delete()\
         .eq('id', str(session_id))\
         .execute()
+    await (await get_session_cache()).remove_session(current_user['id'], str(session_id))
+    
+    # Drop the session and its session-scoped webhooks from the routing index
+    await publish_webhook_routing_change(await RedisClient.get_client(), session_id=str(session_id))
     
     logger.info(f"Session deleted: {session_id}")
     
@@ -324,12 +399,12 @@ async def delete_session(
 async def get_session_settings(
     session_id: UUID,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_service_client),
+    supabase: AsyncClient = Depends(get_supabase_service_client),
 ):
     """Get session behavior settings"""
     
     # Verify session belongs to user
-    session_result = supabase.table('sessions')\
+    session_result = await supabase.table('sessions')\
         .select('id')\
         .eq('id', str(session_id))\
         .eq('user_id', current_user['id'])\
@@ -343,7 +418,7 @@ async def get_session_settings(
         )
     
     # Get or create settings
-    settings_result = supabase.table('session_settings')\
+    settings_result = await supabase.table('session_settings')\
         .select('*')\
         .eq('session_id', str(session_id))\
         .limit(1)\
@@ -354,7 +429,7 @@ async def get_session_settings(
     
     # Create default settings
     try:
-        new_settings = supabase.table('session_settings').insert({
+        new_settings = await supabase.table('session_settings').insert({
             'session_id': str(session_id),
             'always_online': False,
             'auto_read_messages': False,
@@ -368,7 +443,7 @@ async def get_session_settings(
         logger.warning(f"Failed to create default settings (likely race condition): {e}")
         
         # Retry fetch
-        settings_result = supabase.table('session_settings')\
+        settings_result = await supabase.table('session_settings')\
             .select('*')\
             .eq('session_id', str(session_id))\
             .single()\
@@ -389,12 +464,12 @@ async def update_session_settings(
     session_id: UUID,
     request: SessionSettingsUpdate,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_service_client),
+    supabase: AsyncClient = Depends(get_supabase_service_client),
 ):
     """Update session behavior settings"""
     
     # Verify session belongs to user
-    session_result = supabase.table('sessions')\
+    session_result = await supabase.table('sessions')\
         .select('id')\
         .eq('id', str(session_id))\
         .eq('user_id', current_user['id'])\
@@ -422,7 +497,7 @@ async def update_session_settings(
     
     if not update_data:
         # Get current settings
-        settings_result = supabase.table('session_settings')\
+        settings_result = await supabase.table('session_settings')\
             .select('*')\
             .eq('session_id', str(session_id))\
             .single()\
@@ -431,7 +506,7 @@ async def update_session_settings(
     
     
     # Upsert settings
-    settings_result = supabase.table('session_settings')\
+    settings_result = await supabase.table('session_settings')\
         .upsert({
             'session_id': str(session_id),
             **update_data
@@ -456,13 +531,13 @@ async def update_session_settings(
 async def disconnect_session(
     session_id: UUID,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_service_client),
+    supabase: AsyncClient = Depends(get_supabase_service_client),
 ):
     """
     Disconnect a WhatsApp session.
     """
     # Verify session belongs to user
-    result = supabase.table('sessions')\
+    result = await supabase.table('sessions')\
         .select('*')\
         .eq('id', str(session_id))\
         .eq('user_id', current_user['id'])\
@@ -488,6 +563,8 @@ async def disconnect_session(
             }
         )
         logger.info(f"Published DISCONNECT_SESSION command for {session_id}")
+        # The engine logs the session out without a SESSION_DISCONNECTED event
+        await (await get_session_cache()).patch_session(current_user['id'], str(session_id), status='disconnected')
     except Exception as e:
         logger.error(f"Failed to publish DISCONNECT_SESSION: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to disconnect: {str(e)}")
@@ -499,13 +576,13 @@ async def disconnect_session(
 async def restart_session(
     session_id: UUID,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_service_client),
+    supabase: AsyncClient = Depends(get_supabase_service_client),
 ):
     """
     Restart a WhatsApp session.
     """
     # Verify session belongs to user
-    result = supabase.table('sessions')\
+    result = await supabase.table('sessions')\
         .select('*')\
         .eq('id', str(session_id))\
         .eq('user_id', current_user['id'])\
@@ -530,6 +607,8 @@ async def restart_session(
             }
         )
         logger.info(f"Published RESTART_SESSION command for {session_id}")
+        # Restart logs out first; the session is unusable until it reconnects
+        await (await get_session_cache()).patch_session(current_user['id'], str(session_id), status='disconnected')
     except Exception as e:
         logger.error(f"Failed to publish RESTART_SESSION: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to restart: {str(e)}")
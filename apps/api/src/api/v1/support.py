@@ -16,7 +16,7 @@ async def create_support_ticket(
 ):
     """Create a new support ticket"""
     try:
-        supabase = get_supabase_client()
+        supabase = await get_supabase_client()
         
         # Create ticket in database
         ticket_data = {
@@ -29,7 +29,7 @@ async def create_support_ticket(
             "created_at": datetime.now().isoformat(),
         }
         
-        result = supabase.table("support_tickets").insert(ticket_data).execute()
+        result = await supabase.table("support_tickets").insert(ticket_data).execute()
         
         if not result.data:
             raise HTTPException(status_code=500, detail="Failed to create support ticket")
@@ -55,9 +55,9 @@ async def create_support_ticket(
 async def get_user_tickets(user=Depends(get_current_user)):
     """Get all support tickets for the current user"""
     try:
-        supabase = get_supabase_client()
+        supabase = await get_supabase_client()
         
-        result = supabase.table("support_tickets")\
+        result = await supabase.table("support_tickets")\
             .select("*")\
             .eq("user_id", str(user["id"]))\
             .order("created_at", desc=True)\
@@ -3,18 +3,23 @@ Webhook management API endpoints.
 Allows users to register URLs to receive event notifications.
 """
 from fastapi import APIRouter, Depends, HTTPException, status
-from supabase import Client
+from supabase import AsyncClient
 from uuid import UUID
 import secrets
 
 from ...core.auth import get_current_user
 from ...core.supabase import get_supabase_service_client
+from ...core.redis_client import RedisClient
+from ...services.webhook_routing import publish_webhook_routing_change
+from ...services.webhook_dlq import create_replay, get_replay
 from ...models.webhook import (
     WebhookCreate,
     WebhookUpdate,
     WebhookResponse,
     WebhookListResponse,
-    WebhookSecretResponse
+    WebhookSecretResponse,
+    WebhookReplayRequest,
+    WebhookReplayResponse
 )
 
 router = APIRouter(prefix="/webhooks", tags=["Webhooks"])
@@ -25,11 +30,17 @@ def generate_webhook_secret() -> str:
     return f"whsec_{secrets.token_hex(32)}"
 
 
+async def notify_webhook_changed(webhook_id: str) -> None:
+    """Refresh the dispatchers' routing index for this webhook"""
+    redis = await RedisClient.get_client()
+    await publish_webhook_routing_change(redis, webhook_id=webhook_id)
+
+
 @router.post("", response_model=WebhookSecretResponse, status_code=status.HTTP_201_CREATED)
 async def create_webhook(
     request: WebhookCreate,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_service_client),
+    supabase: AsyncClient = Depends(get_supabase_service_client),
 ):
     """
     Create a new webhook endpoint.
@@ -39,7 +50,7 @@ async def create_webhook(
     """
     # Validate session belongs to user if provided
     if request.session_id:
-        session_result = supabase.table('sessions')\
+        session_result = await supabase.table('sessions')\
             .select('id')\
             .eq('id', str(request.session_id))\
             .eq('user_id', current_user['id'])\
@@ -56,16 +67,20 @@ async def create_webhook(
     secret = generate_webhook_secret()
     
     # Create webhook
-    result = supabase.table('webhooks').insert({
+    result = await supabase.table('webhooks').insert({
         'user_id': current_user['id'],
         'session_id': str(request.session_id) if request.session_id else None,
         'url': request.url,
         'secret': secret,
         'events': [e.value for e in request.events],
-        'enabled': True
+        'enabled': True,
+        'delivery_mode': request.delivery_mode.value,
+        'batch_max_events': request.batch_max_events,
+        'batch_max_wait_ms': request.batch_max_wait_ms
     }).execute()
     
     webhook_data = result.data[0]
+    await notify_webhook_changed(str(webhook_data['id']))
     
     return WebhookSecretResponse(
         id=webhook_data['id'],
@@ -74,6 +89,9 @@ async def create_webhook(
         session_id=webhook_data['session_id'],
         events=webhook_data['events'],
         enabled=webhook_data['enabled'],
+        delivery_mode=webhook_data.get('delivery_mode') or 'single',
+        batch_max_events=webhook_data.get('batch_max_events') or 100,
+        batch_max_wait_ms=webhook_data.get('batch_max_wait_ms') or 1000,
         created_at=webhook_data['created_at']
     )
 
@@ -81,10 +99,10 @@ async def create_webhook(
 @router.get("", response_model=WebhookListResponse)
 async def list_webhooks(
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_service_client),
+    supabase: AsyncClient = Depends(get_supabase_service_client),
 ):
     """List all webhooks for the current user"""
-    result = supabase.table('webhooks')\
+    result = await supabase.table('webhooks')\
         .select('*')\
         .eq('user_id', current_user['id'])\
         .order('created_at', desc=True)\
@@ -100,10 +118,10 @@ async def list_webhooks(
 async def get_webhook(
     webhook_id: UUID,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_service_client),
+    supabase: AsyncClient = Depends(get_supabase_service_client),
 ):
     """Get webhook details"""
-    result = supabase.table('webhooks')\
+    result = await supabase.table('webhooks')\
         .select('*')\
         .eq('id', str(webhook_id))\
         .eq('user_id', current_user['id'])\
@@ -124,11 +142,11 @@ async def update_webhook(
     webhook_id: UUID,
     request: WebhookUpdate,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_service_client),
+    supabase: AsyncClient = Depends(get_supabase_service_client),
 ):
     """Update webhook configuration"""
     # Verify webhook exists and belongs to user
-    existing = supabase.table('webhooks')\
+    existing = await supabase.table('webhooks')\
         .select('*')\
         .eq('id', str(webhook_id))\
         .eq('user_id', current_user['id'])\
@@ -149,12 +167,20 @@ async def update_webhook(
         update_data['events'] = [e.value for e in request.events]
     if request.enabled is not None:
         update_data['enabled'] = request.enabled
+        if request.enabled and not existing.data.get('enabled'):
+            update_data['failure_count'] = 0  # Re-enabled: start a fresh failure streak
+    if request.delivery_mode is not None:
+        update_data['delivery_mode'] = request.delivery_mode.value
+    if request.batch_max_events is not None:
+        update_data['batch_max_events'] = request.batch_max_events
+    if request.batch_max_wait_ms is not None:
+        update_data['batch_max_wait_ms'] = request.batch_max_wait_ms
     
     # Handle session_id update - check if field was explicitly provided
     if hasattr(request, 'session_id') and 'sessionId' in (request.model_fields_set or set()):
         if request.session_id is not None:
             # Validate session belongs to user
-            session_result = supabase.table('sessions')\
+            session_result = await supabase.table('sessions')\
                 .select('id')\
                 .eq('id', str(request.session_id))\
                 .eq('user_id', current_user['id'])\
@@ -175,10 +201,11 @@ async def update_webhook(
         return WebhookResponse(**existing.data)
     
     # Update webhook
-    result = supabase.table('webhooks')\
+    result = await supabase.table('webhooks')\
         .update(update_data)\
         .eq('id', str(webhook_id))\
         .execute()
+    await notify_webhook_changed(str(webhook_id))
     
     return WebhookResponse(**result.data[0])
 
@@ -187,11 +214,11 @@ async def update_webhook(
 async def delete_webhook(
     webhook_id: UUID,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_service_client),
+    supabase: AsyncClient = Depends(get_supabase_service_client),
 ):
     """Delete a webhook"""
     # Verify webhook exists and belongs to user
-    existing = supabase.table('webhooks')\
+    existing = await supabase.table('webhooks')\
         .select('id')\
         .eq('id', str(webhook_id))\
         .eq('user_id', current_user['id'])\
@@ -205,10 +232,11 @@ async def delete_webhook(
         )
     
     # Delete webhook
-    supabase.table('webhooks')\
+    await supabase.table('webhooks')\
         .delete()\
         .eq('id', str(webhook_id))\
         .execute()
+    await notify_webhook_changed(str(webhook_id))
     
     return None
 
@@ -217,7 +245,7 @@ async def delete_webhook(
 async def rotate_webhook_secret(
     webhook_id: UUID,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_service_client),
+    supabase: AsyncClient = Depends(get_supabase_service_client),
 ):
     """
     Rotate the webhook secret.
@@ -225,7 +253,7 @@ async def rotate_webhook_secret(
     Generates a new secret and returns it (only shown once).
     """
     # Verify webhook exists and belongs to user
-    existing = supabase.table('webhooks')\
+    existing = await supabase.table('webhooks')\
         .select('*')\
         .eq('id', str(webhook_id))\
         .eq('user_id', current_user['id'])\
@@ -242,10 +270,11 @@ async def rotate_webhook_secret(
     new_secret = generate_webhook_secret()
     
     # Update webhook
-    result = supabase.table('webhooks')\
+    result = await supabase.table('webhooks')\
         .update({'secret': new_secret})\
         .eq('id', str(webhook_id))\
         .execute()
+    await notify_webhook_changed(str(webhook_id))
     
     webhook_data = result.data[0]
     
@@ -256,6 +285,9 @@ async def rotate_webhook_secret(
         session_id=webhook_data['session_id'],
         events=webhook_data['events'],
         enabled=webhook_data['enabled'],
+        delivery_mode=webhook_data.get('delivery_mode') or 'single',
+        batch_max_events=webhook_data.get('batch_max_events') or 100,
+        batch_max_wait_ms=webhook_data.get('batch_max_wait_ms') or 1000,
         created_at=webhook_data['created_at']
     )
 
@@ -264,7 +296,7 @@ async def rotate_webhook_secret(
 async def test_webhook(
     webhook_id: UUID,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_service_client),
+    supabase: AsyncClient = Depends(get_supabase_service_client),
 ):
     """
     Send a test ping event to the webhook URL.
@@ -278,7 +310,7 @@ async def test_webhook(
     from datetime import datetime, timezone
     
     # Get webhook with secret
-    result = supabase.table('webhooks')\
+    result = await supabase.table('webhooks')\
         .select('*')\
         .eq('id', str(webhook_id))\
         .eq('user_id', current_user['id'])\
@@ -367,7 +399,7 @@ async def get_webhook_logs(
     limit: int = 50,
     success_filter: bool = None,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_service_client)
+    supabase: AsyncClient = Depends(get_supabase_service_client)
 ):
     """
     Get webhook call logs for debugging and monitoring.
@@ -376,7 +408,7 @@ async def get_webhook_logs(
     - **success_filter**: Filter by success status (true/false/null for all)
     """
     # Verify webhook belongs to user
-    webhook_result = supabase.table('webhooks')\
+    webhook_result = await supabase.table('webhooks')\
         .select('id, name, url')\
         .eq('id', webhook_id)\
         .eq('user_id', current_user['id'])\
@@ -403,7 +435,7 @@ async def get_webhook_logs(
     if success_filter is not None:
         query = query.eq('success', success_filter)
     
-    logs_result = query.execute()
+    logs_result = await query.execute()
     
     # Calculate stats
     total_logs = len(logs_result.data)
@@ -429,3 +461,85 @@ async def get_webhook_logs(
             "avg_response_time_ms": avg_response_time
         }
     }
+
+
+@router.post(
+    "/{webhook_id}/dlq/replay",
+    response_model=WebhookReplayResponse,
+    status_code=status.HTTP_202_ACCEPTED
+)
+async def replay_webhook_dlq(
+    webhook_id: UUID,
+    request: WebhookReplayRequest,
+    current_user: dict = Depends(get_current_user),
+    supabase: AsyncClient = Depends(get_supabase_service_client)
+):
+    """
+    Replay deliveries that exhausted their retries (dead-letter queue).
+    
+    Entries dead-lettered between **from** and **to** are sent again through
+    the normal delivery pipeline at up to **ratePerSecond**. The webhook must
+    be enabled. Poll the returned replay for progress.
+    """
+    webhook_result = await supabase.table('webhooks')\
+        .select('id, enabled')\
+        .eq('id', str(webhook_id))\
+        .eq('user_id', current_user['id'])\
+        .single()\
+        .execute()
+    
+    if not webhook_result.data:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Webhook not found"
+        )
+    
+    if not webhook_result.data['enabled']:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Webhook is disabled; enable it before replaying"
+        )
+    
+    if request.from_time >= request.to_time:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="'from' must be before 'to'"
+        )
+    
+    redis = await RedisClient.get_client()
+    replay = await create_replay(
+        redis,
+        str(webhook_id),
+        request.from_time,
+        request.to_time,
+        request.rate_per_second
+    )
+    return WebhookReplayResponse(**{k: v for k, v in replay.items() if v != ""})
+
+
+@router.get("/{webhook_id}/dlq/replay/{replay_id}", response_model=WebhookReplayResponse)
+async def get_webhook_dlq_replay(
+    webhook_id: UUID,
+    replay_id: str,
+    current_user: dict = Depends(get_current_user),
+    supabase: AsyncClient = Depends(get_supabase_service_client)
+):
+    """Get the progress of a dead-letter replay"""
+    webhook_result = await supabase.table('webhooks')\
+        .select('id')\
+        .eq('id', str(webhook_id))\
+        .eq('user_id', current_user['id'])\
+        .single()\
+        .execute()
+    
+    replay = None
+    if webhook_result.data:
+        replay = await get_replay(await RedisClient.get_client(), replay_id)
+    
+    if not replay or replay['webhook_id'] != str(webhook_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Replay not found"
+        )
+    
+    return WebhookReplayResponse(**{k: v for k, v in replay.items() if v != ""})
@@ -1,19 +1,28 @@
 """
 Authentication middleware and dependencies.
 """
-from datetime import datetime, timezone
-from fastapi import Depends, HTTPException, status
+import hashlib
+import logging
+from datetime import datetime
+from typing import Optional
+from fastapi import Depends, HTTPException, Query, WebSocket, WebSocketException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from supabase import Client
+from jose import JWTError
+from supabase import AsyncClient
+from .config import settings
 from .supabase import get_supabase_client, get_supabase_service_client
-from .security import hash_api_key, verify_api_key_format, is_api_key_expired
+from .security import hash_api_key, verify_api_key_format, is_api_key_expired, decode_supabase_jwt
+from .auth_cache import api_key_cache, jwt_session_cache, profile_cache
+from .redis_client import RedisClient
+from ..services.api_key_usage import record_api_key_usage
 
 security = HTTPBearer()
+logger = logging.getLogger(__name__)
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    supabase: Client = Depends(get_supabase_client),
-    service_client: Client = Depends(get_supabase_service_client)
+    supabase: AsyncClient = Depends(get_supabase_client),
+    service_client: AsyncClient = Depends(get_supabase_service_client)
 ):
     """
     Validate JWT token OR API Key and return current user profile.
@@ -22,19 +31,47 @@ async def get_current_user(
     1. JWT Bearer token (from Supabase Auth)
     2. API Key (sk_live_... or sk_test_...)
     """
-    token = credentials.credentials
+    return await authenticate_token(credentials.credentials, supabase, service_client)
+
+async def get_websocket_user(
+    websocket: WebSocket,
+    token: Optional[str] = Query(None),
+    supabase: AsyncClient = Depends(get_supabase_client),
+    service_client: AsyncClient = Depends(get_supabase_service_client)
+):
+    """
+    Authenticate a WebSocket handshake with a JWT or API key.
+    
+    Browsers cannot set headers on WebSocket requests, so the credential may
+    also be passed as the `token` query parameter.
+    """
+    authorization = websocket.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        token = authorization[7:].strip()
     
-    # Check if it's an API key (based on prefix)
+    if not token:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="Not authenticated")
+    
+    try:
+        return await authenticate_token(token, supabase, service_client)
+    except HTTPException as e:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=str(e.detail))
+
+async def authenticate_token(token: str, supabase: AsyncClient, service_client: AsyncClient):
+    """Authenticate a bearer credential: API key (by prefix) or Supabase JWT"""
     if verify_api_key_format(token):
         return await authenticate_with_api_key(token, service_client)
     else:
         return await authenticate_with_jwt(token, supabase, service_client)
 
-async def authenticate_with_jwt(token: str, supabase: Client, service_client: Client):
+async def authenticate_with_jwt(token: str, supabase: AsyncClient, service_client: AsyncClient):
     """Authenticate using Supabase JWT token"""
+    if settings.jwt_verification_mode in ("local", "hybrid"):
+        return await authenticate_with_local_jwt(token, supabase, service_client)
+    
     try:
         # Validate JWT with Supabase Auth
-        user_response = supabase.auth.get_user(token)
+        user_response = await supabase.auth.get_user(token)
         
         if not user_response or not user_response.user:
             raise HTTPException(
@@ -45,7 +82,7 @@ async def authenticate_with_jwt(token: str, supabase: Client, service_client: Cl
         
         # Fetch full profile using Service Role (Bypass RLS)
         # Using injected service_client ensures tests can mock this
-        profile = service_client.table('profiles').select('*').eq('id', user_response.user.id).single().execute()
+        profile = await service_client.table('profiles').select('*').eq('id', user_response.user.id).single().execute()
         
         return profile.data
         
@@ -56,29 +93,108 @@ async def authenticate_with_jwt(token: str, supabase: Client, service_client: Cl
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-async def authenticate_with_api_key(api_key: str, service_client: Client):
+async def authenticate_with_local_jwt(token: str, supabase: AsyncClient, service_client: AsyncClient):
+    """
+    Authenticate a Supabase JWT without calling Supabase Auth.
+    
+    The token is verified in-process and the profile is served from a short-TTL
+    cache. In "hybrid" mode each session is also confirmed remotely at least every
+    PROFILE_CACHE_TTL seconds, so a revoked session is rejected at most that much
+    later, even while other sessions of the same user stay active.
+    """
+    try:
+        claims = decode_supabase_jwt(token)
+    except JWTError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"Could not validate credentials: {str(e)}",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    user_id = claims.get('sub')
+    if not user_id:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    if settings.jwt_verification_mode == "hybrid":
+        await confirm_jwt_session(token, claims, supabase)
+    
+    profile = profile_cache.get(user_id)
+    if profile is not None:
+        return profile
+    
+    try:
+        result = await service_client.table('profiles').select('*').eq('id', user_id).single().execute()
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"Could not validate credentials: {str(e)}",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    profile_cache.set(user_id, result.data)
+    return result.data
+
+async def confirm_jwt_session(token: str, claims: dict, supabase: AsyncClient):
+    """
+    Confirm with Supabase Auth that the token's session is still valid.
+    
+    Confirmations are cached per session (the `session_id` claim, or the token
+    itself for tokens without one), never per user.
+    """
+    session_key = claims.get('session_id') or hashlib.sha256(token.encode('utf-8')).hexdigest()
+    if jwt_session_cache.get(session_key) is not None:
+        return
+    
+    try:
+        user_response = await supabase.auth.get_user(token)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"Could not validate credentials: {str(e)}",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    if not user_response or not user_response.user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    jwt_session_cache.set(session_key, claims['sub'])
+
+async def authenticate_with_api_key(api_key: str, service_client: AsyncClient):
     """Authenticate using API key"""
     try:
         # Hash the provided key for lookup
         key_hash = hash_api_key(api_key)
-        
-        # Lookup key
-        result = service_client.table('api_keys')\
-            .select('*, profiles(*)')\
-            .eq('key_hash', key_hash)\
-            .is_('revoked_at', 'null')\
-            .single()\
-            .execute()
-            
-        if not result.data:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid API key",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-            
-        key_data = result.data
-        
+
+        # Serve from the in-process cache when possible
+        key_data = api_key_cache.get(key_hash)
+
+        if key_data is None:
+            # Lookup key
+            result = await service_client.table('api_keys')\
+                .select('*, profiles(*)')\
+                .eq('key_hash', key_hash)\
+                .is_('revoked_at', 'null')\
+                .single()\
+                .execute()
+
+            if not result.data:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Invalid API key",
+                    headers={"WWW-Authenticate": "Bearer"},
+                )
+
+            key_data = result.data
+            api_key_cache.set(key_hash, key_data)
+
         # Check expiration
         expires_at = None
         if key_data.get('expires_at'):
@@ -91,14 +207,12 @@ async def authenticate_with_api_key(api_key: str, service_client: Client):
                 headers={"WWW-Authenticate": "Bearer"},
             )
             
-        # Update usage stats (Synchronous for now, move to task queue later)
+        # Count usage in Redis; ApiKeyUsageFlusher writes it to the database in batches
         try:
-            service_client.table('api_keys').update({
-                'last_used_at': datetime.now(timezone.utc).isoformat(),
-                'request_count': (key_data.get('request_count') or 0) + 1
-            }).eq('id', key_data['id']).execute()
-        except Exception:
-            pass
+            redis = await RedisClient.get_client()
+            await record_api_key_usage(redis, str(key_data['id']))
+        except Exception as e:
+            logger.warning(f"Failed to record API key usage: {e}")
             
         # Return user profile associated with the key
         return key_data['profiles']
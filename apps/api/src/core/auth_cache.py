@@ -0,0 +1,179 @@
+"""
+In-process caches for request authentication.
+
+Authenticated API key rows (joined with their profile) are kept in a bounded
+TTL/LRU map keyed by `hash_api_key()` output, so repeat requests skip the
+PostgREST lookup. Profiles of locally verified JWT users get a short-TTL cache
+of their own, and in hybrid mode the Supabase Auth confirmation of each JWT
+session is cached separately, keyed by session. Revocations and bans are fanned out to every worker through
+Redis Pub/Sub so no worker keeps serving a revoked key for the full TTL.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+import orjson
+from redis.asyncio import Redis
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+AUTH_INVALIDATION_CHANNEL = "auth:invalidate"
+
+
+class TTLCache:
+    """Bounded LRU map whose entries expire a fixed number of seconds after insertion."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Any | None:
+        """Return the cached value, or None on a miss or expired entry."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        """Insert or refresh an entry, evicting the least recently used ones."""
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: str) -> Any | None:
+        """Remove an entry and return its value if present."""
+        entry = self._entries.pop(key, None)
+        return entry[1] if entry else None
+
+    def discard_where(self, predicate: Callable[[Any], bool]) -> int:
+        """Remove every entry whose value matches the predicate."""
+        stale = [key for key, (_, value) in self._entries.items() if predicate(value)]
+        for key in stale:
+            del self._entries[key]
+        return len(stale)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        """Hit/miss counters for monitoring."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxSize": self.max_size,
+            "ttlSeconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class ApiKeyCache(TTLCache):
+    """Cache of `api_keys` rows (with joined `profiles`) keyed by key hash."""
+
+    def invalidate(self, key_id: str | None = None, user_id: str | None = None) -> int:
+        """Drop cached rows for a key id and/or every key of a user."""
+        def matches(key_data: dict) -> bool:
+            if key_id and str(key_data.get("id")) == key_id:
+                return True
+            return bool(user_id and str(key_data.get("user_id")) == user_id)
+
+        return self.discard_where(matches)
+
+
+# Global cache instance (one per worker process)
+api_key_cache = ApiKeyCache(
+    max_size=settings.api_key_cache_max_size,
+    ttl=settings.api_key_cache_ttl,
+)
+
+profile_cache = TTLCache(
+    max_size=settings.profile_cache_max_size,
+    ttl=settings.profile_cache_ttl,
+)
+
+# JWT session id (or token hash) -> user id, for sessions Supabase Auth confirmed
+jwt_session_cache = TTLCache(
+    max_size=settings.profile_cache_max_size,
+    ttl=settings.profile_cache_ttl,
+)
+
+
+def apply_auth_invalidation(message: dict) -> None:
+    """Apply an invalidation message to this worker's caches."""
+    removed = api_key_cache.invalidate(
+        key_id=message.get("key_id"),
+        user_id=message.get("user_id"),
+    )
+    if message.get("user_id"):
+        if profile_cache.pop(message["user_id"]) is not None:
+            removed += 1
+        removed += jwt_session_cache.discard_where(lambda user_id: user_id == message["user_id"])
+    logger.debug(f"Auth cache invalidation {message} removed {removed} entries")
+
+
+async def publish_auth_invalidation(
+    redis: Redis,
+    key_id: str | None = None,
+    user_id: str | None = None
+) -> None:
+    """
+    Invalidate cached credentials locally and on every other worker.
+
+    Publishing is best effort: the local cache is always cleared, and other
+    workers fall back to the cache TTL if Redis is unreachable.
+    """
+    message = {"key_id": key_id, "user_id": user_id}
+    apply_auth_invalidation(message)
+
+    try:
+        await redis.publish(AUTH_INVALIDATION_CHANNEL, orjson.dumps(message).decode())
+    except Exception as e:
+        logger.warning(f"Failed to publish auth invalidation {message}: {e}")
+
+
+async def listen_for_auth_invalidations(redis: Redis) -> None:
+    """Apply invalidations published by other workers until cancelled."""
+    while True:
+        pubsub = redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(AUTH_INVALIDATION_CHANNEL)
+            logger.info(f"Listening for auth invalidations on {AUTH_INVALIDATION_CHANNEL}")
+
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                try:
+                    apply_auth_invalidation(orjson.loads(message["data"]))
+                except orjson.JSONDecodeError:
+                    logger.warning(f"Invalid auth invalidation message: {message}")
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Messages may have been missed while disconnected
+            logger.warning(f"Auth invalidation listener error, clearing caches: {e}")
+            api_key_cache.clear()
+            profile_cache.clear()
+            jwt_session_cache.clear()
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
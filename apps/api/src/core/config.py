@@ -32,11 +32,20 @@ class Settings(BaseSettings):
     supabase_url: str = Field(alias="SUPABASE_URL")
     supabase_key: str = Field(alias="SUPABASE_KEY")
     supabase_service_key: str | None = Field(default=None, alias="SUPABASE_SERVICE_KEY")
+    supabase_pool_size: int = Field(default=50, alias="SUPABASE_POOL_SIZE")
+    supabase_http2: bool = Field(default=True, alias="SUPABASE_HTTP2")
+    supabase_keepalive_expiry: float = Field(default=30.0, alias="SUPABASE_KEEPALIVE_EXPIRY")  # seconds
+    supabase_timeout: float = Field(default=30.0, alias="SUPABASE_TIMEOUT")  # seconds
     
     # JWT
     jwt_secret: str = Field(alias="JWT_SECRET")
     jwt_algorithm: str = Field(default="HS256")
     jwt_expiration: int = Field(default=3600)  # 1 hour in seconds
+    jwt_audience: str = Field(default="authenticated", alias="JWT_AUDIENCE")
+    # remote: ask Supabase Auth on every request
+    # local: verify signature/exp/aud in-process
+    # hybrid: verify locally, confirm each session with Supabase Auth every PROFILE_CACHE_TTL seconds
+    jwt_verification_mode: str = Field(default="remote", alias="JWT_VERIFICATION_MODE")
     
     # Redis
     redis_host: str = Field(default="localhost", alias="REDIS_HOST")
@@ -46,7 +55,13 @@ class Settings(BaseSettings):
     
     # Authentication
     # JWT settings combined above
-    
+    api_key_cache_ttl: int = Field(default=60, alias="API_KEY_CACHE_TTL")  # seconds
+    api_key_cache_max_size: int = Field(default=10000, alias="API_KEY_CACHE_MAX_SIZE")
+    profile_cache_ttl: int = Field(default=30, alias="PROFILE_CACHE_TTL")  # seconds
+    profile_cache_max_size: int = Field(default=10000, alias="PROFILE_CACHE_MAX_SIZE")
+    api_key_usage_flush_interval: float = Field(default=5.0, alias="API_KEY_USAGE_FLUSH_INTERVAL")  # seconds
+    api_key_usage_flush_batch_size: int = Field(default=500, alias="API_KEY_USAGE_FLUSH_BATCH_SIZE")
+
     # CORS
     cors_origins_raw: str = Field(
         default="http://localhost:3000,http://localhost:8000",
@@ -64,6 +79,61 @@ class Settings(BaseSettings):
     flutterwave_webhook_secret: str = Field(default="", validation_alias="FLUTTERWAVE_WEBHOOK_SECRET")
     flutterwave_encryption_key: str = Field(default="", validation_alias="FLUTTERWAVE_ENCRYPTION_KEY")
     
+    # Webhook dispatcher
+    # Run the dispatcher inside the API process; disable when using `python -m src.dispatcher`
+    webhook_dispatcher_in_api: bool = Field(default=True, alias="WEBHOOK_DISPATCHER_IN_API")
+    webhook_dispatcher_workers: int = Field(default=1, alias="WEBHOOK_DISPATCHER_WORKERS")  # standalone processes
+    webhook_dispatcher_metrics_port: int = Field(default=9100, alias="WEBHOOK_DISPATCHER_METRICS_PORT")
+    webhook_max_in_flight_events: int = Field(default=200, alias="WEBHOOK_MAX_IN_FLIGHT_EVENTS")
+    webhook_max_queued_events: int = Field(default=10000, alias="WEBHOOK_MAX_QUEUED_EVENTS")  # waiting behind their session or batch
+    webhook_dispatch_concurrency: int = Field(default=100, alias="WEBHOOK_DISPATCH_CONCURRENCY")  # HTTP requests in flight
+    webhook_per_endpoint_concurrency: int = Field(default=4, alias="WEBHOOK_PER_ENDPOINT_CONCURRENCY")
+    webhook_shutdown_timeout: float = Field(default=10.0, alias="WEBHOOK_SHUTDOWN_TIMEOUT")  # seconds
+    webhook_consumer_name: str | None = Field(default=None, alias="WEBHOOK_CONSUMER_NAME")  # default: host-pid-random
+    webhook_claim_interval: float = Field(default=30.0, alias="WEBHOOK_CLAIM_INTERVAL")  # seconds
+    webhook_claim_min_idle_ms: int = Field(default=60000, alias="WEBHOOK_CLAIM_MIN_IDLE_MS")  # > 3 heartbeat intervals
+    webhook_heartbeat_interval: float = Field(default=10.0, alias="WEBHOOK_HEARTBEAT_INTERVAL")  # seconds
+    webhook_max_attempts: int = Field(default=6, alias="WEBHOOK_MAX_ATTEMPTS")
+    webhook_retry_base_delay: float = Field(default=1.0, alias="WEBHOOK_RETRY_BASE_DELAY")  # seconds, doubled per attempt
+    webhook_retry_max_delay: float = Field(default=3600.0, alias="WEBHOOK_RETRY_MAX_DELAY")  # seconds
+    webhook_retry_jitter: float = Field(default=0.2, alias="WEBHOOK_RETRY_JITTER")  # +/- fraction of the delay
+    webhook_retry_poll_interval: float = Field(default=0.5, alias="WEBHOOK_RETRY_POLL_INTERVAL")  # seconds
+    webhook_retry_lease_seconds: float = Field(default=300.0, alias="WEBHOOK_RETRY_LEASE_SECONDS")  # before an unfinished retry runs again
+    webhook_breaker_failure_threshold: int = Field(default=5, alias="WEBHOOK_BREAKER_FAILURE_THRESHOLD")  # consecutive failures
+    webhook_breaker_open_seconds: float = Field(default=30.0, alias="WEBHOOK_BREAKER_OPEN_SECONDS")  # before a probe
+    webhook_backlog_max: int = Field(default=10000, alias="WEBHOOK_BACKLOG_MAX")  # parked deliveries per webhook
+    webhook_backlog_drain_interval: float = Field(default=5.0, alias="WEBHOOK_BACKLOG_DRAIN_INTERVAL")  # seconds
+    webhook_disable_after_failures: int = Field(default=25, alias="WEBHOOK_DISABLE_AFTER_FAILURES")  # consecutive failed attempts
+    webhook_dlq_max_len: int = Field(default=100000, alias="WEBHOOK_DLQ_MAX_LEN")  # approximate cap of whatsapp:events:dlq
+    # webhook_logs rows are buffered and bulk inserted; successes are sampled when the buffer backs up
+    webhook_log_batch_size: int = Field(default=500, alias="WEBHOOK_LOG_BATCH_SIZE")
+    webhook_log_flush_interval: float = Field(default=1.0, alias="WEBHOOK_LOG_FLUSH_INTERVAL")  # seconds
+    webhook_log_max_buffer: int = Field(default=20000, alias="WEBHOOK_LOG_MAX_BUFFER")
+    webhook_log_sample_threshold: float = Field(default=0.5, alias="WEBHOOK_LOG_SAMPLE_THRESHOLD")  # fraction of max buffer
+    webhook_log_success_sample_rate: float = Field(default=0.1, alias="WEBHOOK_LOG_SUCCESS_SAMPLE_RATE")
+    
+    # Command stream producer
+    # Buffered mode coalesces XADDs from concurrent requests into pipelined flushes
+    stream_producer_buffered: bool = Field(default=False, alias="STREAM_PRODUCER_BUFFERED")
+    stream_producer_batch_size: int = Field(default=256, alias="STREAM_PRODUCER_BATCH_SIZE")
+    stream_producer_linger_ms: float = Field(default=2.0, alias="STREAM_PRODUCER_LINGER_MS")
+    stream_producer_max_pending: int = Field(default=10000, alias="STREAM_PRODUCER_MAX_PENDING")
+    
+    # Streaming clients (SSE, WebSocket) share one pub/sub connection per worker
+    stream_max_per_user: int = Field(default=10, alias="STREAM_MAX_PER_USER")  # concurrent streams per worker
+    # Per-user event feed for /events/feed long polling
+    events_feed_retention_seconds: int = Field(default=86400, alias="EVENTS_FEED_RETENTION_SECONDS")
+    
+    # Session status cache (send paths, session reads)
+    session_cache_ttl: int = Field(default=60, alias="SESSION_CACHE_TTL")  # seconds
+    
+    # Messages
+    message_batch_max_size: int = Field(default=10000, alias="MESSAGE_BATCH_MAX_SIZE")
+    
+    # Message quotas
+    quota_cache_ttl: int = Field(default=300, alias="QUOTA_CACHE_TTL")  # seconds
+    quota_reconcile_interval: float = Field(default=5.0, alias="QUOTA_RECONCILE_INTERVAL")  # seconds
+    
     # Rate Limiting
     rate_limit_per_minute: int = Field(default=60, alias="RATE_LIMIT_PER_MINUTE")
     rate_limit_burst: int = Field(default=10, alias="RATE_LIMIT_BURST")
@@ -0,0 +1,231 @@
+"""
+Pub/Sub Multiplexer
+
+One Redis pub/sub connection per worker shared by every streaming client
+(SSE, WebSocket). Channels are subscribed while at least one local client
+listens to them, and each message is fanned out to the clients' bounded
+in-process queues. Redis connections no longer grow with open browser tabs.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Optional
+
+from redis.asyncio import Redis
+
+from .config import settings
+from .redis_client import RedisClient
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_QUEUE_SIZE = 100  # messages buffered per client; the oldest is dropped when full
+
+
+class StreamLimitExceeded(Exception):
+    """The user already has the maximum number of open streams on this worker"""
+
+
+class Subscription:
+    """One client's view of a channel"""
+
+    def __init__(
+        self,
+        multiplexer: "PubSubMultiplexer",
+        channel: str,
+        user_id: str,
+        queue_size: int,
+        drop_oldest: bool = True
+    ):
+        self.multiplexer = multiplexer
+        self.channel = channel
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.drop_oldest = drop_oldest
+        self.dropped = 0
+        self.overflowed = False  # Set instead of dropping when drop_oldest is False
+        self.closed = False
+
+    def put(self, data) -> None:
+        if self.queue.full():
+            self.dropped += 1
+            if not self.drop_oldest:
+                # The client is too slow; its owner is expected to disconnect it
+                self.overflowed = True
+                return
+            self.queue.get_nowait()
+        self.queue.put_nowait(data)
+
+    async def get(self, timeout: Optional[float] = None):
+        """Next message data, or None if nothing arrived within `timeout` seconds"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self) -> None:
+        """Release the subscription (idempotent)"""
+        if not self.closed:
+            self.closed = True
+            await self.multiplexer.unsubscribe(self)
+
+
+class PubSubMultiplexer:
+    """Shares one pub/sub connection between all local subscribers"""
+
+    def __init__(self, redis: Redis, max_streams_per_user: int, queue_size: int = SUBSCRIPTION_QUEUE_SIZE):
+        self.redis = redis
+        self.max_streams_per_user = max_streams_per_user
+        self.queue_size = queue_size
+        self._pubsub = redis.pubsub()
+        self._subscribers: dict[str, set[Subscription]] = defaultdict(set)
+        self._user_streams: dict[str, int] = defaultdict(int)
+        self._lock = asyncio.Lock()  # Serializes SUBSCRIBE/UNSUBSCRIBE per channel
+        self._wakeup = asyncio.Event()
+        self._reader: Optional[asyncio.Task] = None
+        self._delivered = 0
+
+    async def subscribe(
+        self,
+        channel: str,
+        user_id: str,
+        queue_size: Optional[int] = None,
+        drop_oldest: bool = True
+    ) -> Subscription:
+        """
+        Start receiving `channel` for one client.
+
+        A full queue drops its oldest message, or with `drop_oldest=False`
+        flags the subscription as overflowed so the caller can disconnect.
+        Raises StreamLimitExceeded if the user is at the per-user limit.
+        The caller must `close()` the subscription when the client goes away.
+        """
+        if self._user_streams[user_id] >= self.max_streams_per_user:
+            raise StreamLimitExceeded(
+                f"Too many open streams (max {self.max_streams_per_user} per user)"
+            )
+        self._user_streams[user_id] += 1
+
+        subscription = Subscription(self, channel, user_id, queue_size or self.queue_size, drop_oldest)
+        try:
+            async with self._lock:
+                first = channel not in self._subscribers
+                self._subscribers[channel].add(subscription)
+                if first:
+                    await self._pubsub.subscribe(channel)
+        except Exception:
+            subscription.closed = True
+            await self._remove(subscription)
+            raise
+
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._run())
+        self._wakeup.set()
+        return subscription
+
+    async def unsubscribe(self, subscription: Subscription) -> None:
+        await self._remove(subscription)
+
+    async def close(self) -> None:
+        if self._reader:
+            self._reader.cancel()
+            await asyncio.gather(self._reader, return_exceptions=True)
+        await self._pubsub.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "channels": len(self._subscribers),
+            "subscribers": sum(len(s) for s in self._subscribers.values()),
+            "users": len(self._user_streams),
+            "delivered": self._delivered,
+        }
+
+    async def _remove(self, subscription: Subscription) -> None:
+        channel = subscription.channel
+        async with self._lock:
+            subscribers = self._subscribers.get(channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[channel]
+                    try:
+                        await self._pubsub.unsubscribe(channel)
+                    except Exception as e:
+                        logger.warning(f"Failed to unsubscribe from {channel}: {e}")
+
+        self._user_streams[subscription.user_id] -= 1
+        if self._user_streams[subscription.user_id] <= 0:
+            del self._user_streams[subscription.user_id]
+
+    async def _run(self) -> None:
+        """Read the shared connection and fan messages out to local queues"""
+        while True:
+            try:
+                if not self._subscribers:
+                    # Nothing to read until a client subscribes
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                if not self._pubsub.subscribed:
+                    async with self._lock:  # Waits out a SUBSCRIBE in progress
+                        lost = bool(self._subscribers) and not self._pubsub.subscribed
+                    if lost:
+                        raise ConnectionError("subscriptions lost")
+                    continue
+
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=None)
+                if message is None or message.get("type") != "message":
+                    continue
+
+                channel = message["channel"]
+                if isinstance(channel, bytes):
+                    channel = channel.decode("utf-8")
+                for subscription in tuple(self._subscribers.get(channel, ())):
+                    subscription.put(message["data"])
+                    self._delivered += 1
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Messages published while disconnected are lost
+                logger.warning(f"Pub/sub multiplexer connection error, resubscribing: {e}")
+                await asyncio.sleep(1)
+                await self._resubscribe()
+
+    async def _resubscribe(self) -> None:
+        async with self._lock:
+            try:
+                await self._pubsub.aclose()
+            except Exception:
+                pass
+            self._pubsub = self.redis.pubsub()
+            if self._subscribers:
+                try:
+                    await self._pubsub.subscribe(*self._subscribers)
+                except Exception as e:
+                    logger.warning(f"Pub/sub multiplexer resubscribe failed: {e}")
+
+
+_multiplexer: Optional[PubSubMultiplexer] = None
+_multiplexer_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+async def get_pubsub_multiplexer() -> PubSubMultiplexer:
+    """Process-wide multiplexer on the shared Redis client"""
+    global _multiplexer, _multiplexer_loop
+    loop = asyncio.get_running_loop()
+    if _multiplexer is None or _multiplexer_loop is not loop:
+        _multiplexer = PubSubMultiplexer(
+            await RedisClient.get_client(),
+            max_streams_per_user=settings.stream_max_per_user
+        )
+        _multiplexer_loop = loop
+    return _multiplexer
+
+
+async def close_pubsub_multiplexer() -> None:
+    """Drop the shared subscription connection (application shutdown)"""
+    global _multiplexer, _multiplexer_loop
+    if _multiplexer is not None:
+        await _multiplexer.close()
+    _multiplexer = None
+    _multiplexer_loop = None
@@ -1,9 +1,12 @@
 """
-Security utilities for API Key generation and hashing.
+Security utilities for API Key generation and hashing, and JWT verification.
 """
 import secrets
 import hashlib
 from datetime import datetime, timezone
+from jose import jwt
+
+from .config import settings
 
 def generate_api_key(prefix: str = "sk_live") -> str:
     """
@@ -58,3 +61,20 @@ def is_api_key_expired(expires_at: datetime | None) -> bool:
         expires_at = expires_at.replace(tzinfo=timezone.utc)
         
     return datetime.now(timezone.utc) > expires_at
+
+def decode_supabase_jwt(token: str) -> dict:
+    """
+    Verify a Supabase access token locally and return its claims.
+    
+    Checks the signature against JWT_SECRET as well as the `exp` and `aud`
+    claims, without a round trip to Supabase Auth.
+    
+    Raises:
+        jose.JWTError: If the token is invalid, expired or for another audience
+    """
+    return jwt.decode(
+        token,
+        settings.jwt_secret,
+        algorithms=[settings.jwt_algorithm],
+        audience=settings.jwt_audience
+    )
@@ -1,10 +1,14 @@
+import asyncio
 import orjson
 from uuid import uuid4
 from datetime import datetime, timezone
 from redis.asyncio import Redis
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 import logging
 
+from .config import settings
+from .redis_client import RedisClient
+
 logger = logging.getLogger(__name__)
 
 class StreamProducer:
@@ -30,13 +34,7 @@ class StreamProducer:
         Returns:
             Message ID from Redis
         """
-        envelope = {
-            "id": str(uuid4()),
-            "type": command_type,
-            "version": "1.0",
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "payload": payload
-        }
+        envelope = self._build_envelope(command_type, payload)
         
         try:
             # Serialize to JSON
@@ -65,6 +63,63 @@ class StreamProducer:
             await self._publish_error(command_type, str(e), payload)
             raise
     
+    async def publish_many(
+        self,
+        commands: Sequence[Tuple[str, Dict[str, Any]]],
+        stream_name: str = "whatsapp:commands",
+        transaction: bool = False
+    ) -> List[Optional[str]]:
+        """
+        Publish many commands to a Redis Stream in one round trip.
+        
+        Args:
+            commands: (command_type, payload) pairs
+            stream_name: Target stream name
+            transaction: Wrap the XADDs in MULTI/EXEC (all or nothing)
+        
+        Returns:
+            Message IDs in the same order as `commands`. Commands that could
+            not be published get None and are reported to whatsapp:errors;
+            they never fail the rest of the batch.
+        """
+        results = await self._publish_batch(commands, stream_name, transaction)
+        return [None if isinstance(result, Exception) else result for result in results]
+    
+    async def _publish_batch(
+        self,
+        commands: Sequence[Tuple[str, Dict[str, Any]]],
+        stream_name: str,
+        transaction: bool = False
+    ) -> List[Union[str, Exception]]:
+        """Pipeline the XADDs, returning a stream id or the exception for each command"""
+        if not commands:
+            return []
+        
+        pipe = self.redis.pipeline(transaction=transaction)
+        for command_type, payload in commands:
+            envelope = self._build_envelope(command_type, payload)
+            # orjson bytes go to Redis as-is, no intermediate str
+            pipe.xadd(stream_name, {"data": orjson.dumps(envelope)}, maxlen=10000)
+        
+        try:
+            results = await pipe.execute(raise_on_error=False)
+        except Exception as e:
+            # The round trip itself failed (connection lost, MULTI aborted)
+            results = [e] * len(commands)
+        
+        errors = [
+            self._build_error(command_type, str(result), payload)
+            for (command_type, payload), result in zip(commands, results)
+            if isinstance(result, Exception)
+        ]
+        
+        if errors:
+            logger.error(f"Failed to publish {len(errors)}/{len(commands)} commands to {stream_name}")
+            await self._publish_errors(errors)
+        
+        logger.info(f"Published {len(commands) - len(errors)} commands to {stream_name}")
+        return results
+    
     async def publish_event(
         self,
         event_type: str,
@@ -74,6 +129,26 @@ class StreamProducer:
         """Publish an event to Redis Stream (same logic as commands)"""
         return await self.publish_command(event_type, payload, stream_name)
     
+    @staticmethod
+    def _build_envelope(command_type: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Wrap a payload in the standard command envelope"""
+        return {
+            "id": str(uuid4()),
+            "type": command_type,
+            "version": "1.0",
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "payload": payload
+        }
+    
+    @staticmethod
+    def _build_error(operation: str, error: str, context: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "operation": operation,
+            "error": error,
+            "context": context,
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }
+    
     async def _publish_error(
         self,
         operation: str,
@@ -81,12 +156,7 @@ class StreamProducer:
         context: Dict[str, Any]
     ):
         """Publish error to error stream for monitoring"""
-        error_payload = {
-            "operation": operation,
-            "error": error,
-            "context": context,
-            "timestamp": datetime.now(timezone.utc).isoformat()
-        }
+        error_payload = self._build_error(operation, error, context)
         
         try:
             await self.redis.xadd(
@@ -97,3 +167,165 @@ class StreamProducer:
         except Exception as e:
             # Last resort logging
             logger.critical(f"Failed to log error to stream: {e}")
+    
+    async def _publish_errors(self, error_payloads: List[Dict[str, Any]]):
+        """Publish several errors to the error stream in one round trip"""
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for error_payload in error_payloads:
+                pipe.xadd("whatsapp:errors", {"data": orjson.dumps(error_payload)}, maxlen=1000)
+            await pipe.execute()
+        except Exception as e:
+            # Last resort logging
+            logger.critical(f"Failed to log {len(error_payloads)} errors to stream: {e}")
+
+
+class BufferedStreamProducer(StreamProducer):
+    """
+    StreamProducer that coalesces commands from concurrent callers.
+    
+    publish_command() enqueues the command and waits for its real stream id.
+    A single background task drains the queue into pipelined XADDs. It flushes
+    once `max_batch_size` commands are waiting or `linger_ms` has passed since
+    the first one. The queue is bounded, so while Redis is slow, callers wait
+    in publish_command() instead of piling up memory.
+    """
+    
+    def __init__(
+        self,
+        redis_client: Redis,
+        max_batch_size: int = settings.stream_producer_batch_size,
+        linger_ms: float = settings.stream_producer_linger_ms,
+        max_pending: int = settings.stream_producer_max_pending
+    ):
+        super().__init__(redis_client)
+        self.max_batch_size = max_batch_size
+        self.linger = linger_ms / 1000
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+    
+    def start(self):
+        """Start the flush loop on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Flush everything already queued, then stop"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._task:
+            await self._queue.put(None)  # Sentinel: flush and exit
+            await self._task
+            self._task = None
+    
+    async def publish_command(
+        self,
+        command_type: str,
+        payload: Dict[str, Any],
+        stream_name: str = "whatsapp:commands"
+    ) -> str:
+        """Queue a command and return its stream id once flushed"""
+        if self._closed or self._task is None or self._task.done():
+            return await super().publish_command(command_type, payload, stream_name)
+        
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((stream_name, command_type, payload, future))  # Blocks when full
+        return await future
+    
+    async def _run(self):
+        """Collect batches from the queue and flush them"""
+        loop = asyncio.get_running_loop()
+        stopping = False
+        
+        while not stopping:
+            item = await self._queue.get()
+            batch = []
+            if item is None:
+                stopping = True
+            else:
+                batch.append(item)
+                deadline = loop.time() + self.linger
+                while len(batch) < self.max_batch_size:
+                    try:
+                        item = self._queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        timeout = deadline - loop.time()
+                        if timeout <= 0:
+                            break
+                        try:
+                            item = await asyncio.wait_for(self._queue.get(), timeout)
+                        except asyncio.TimeoutError:
+                            break
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(item)
+            
+            if stopping:
+                # Nothing new can arrive after the sentinel except from racing callers
+                while not self._queue.empty():
+                    item = self._queue.get_nowait()
+                    if item is not None:
+                        batch.append(item)
+            
+            if batch:
+                await self._flush(batch)
+    
+    async def _flush(self, batch: List[Tuple[str, str, Dict[str, Any], asyncio.Future]]):
+        """Publish one batch and resolve each caller's future"""
+        by_stream: Dict[str, List[Tuple[str, Dict[str, Any], asyncio.Future]]] = {}
+        for stream_name, command_type, payload, future in batch:
+            by_stream.setdefault(stream_name, []).append((command_type, payload, future))
+        
+        for stream_name, items in by_stream.items():
+            try:
+                results = await self._publish_batch(
+                    [(command_type, payload) for command_type, payload, _ in items],
+                    stream_name
+                )
+            except Exception as e:
+                results = [e] * len(items)
+            
+            for (_, _, future), result in zip(items, results):
+                if future.done():
+                    continue  # Caller went away
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+_stream_producer: Optional[StreamProducer] = None
+_stream_producer_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+async def get_stream_producer() -> StreamProducer:
+    """
+    Process-wide producer for API handlers.
+    
+    Returns a BufferedStreamProducer when STREAM_PRODUCER_BUFFERED is enabled,
+    otherwise a plain StreamProducer on the shared Redis client.
+    """
+    global _stream_producer, _stream_producer_loop
+    loop = asyncio.get_running_loop()
+    if _stream_producer is None or _stream_producer_loop is not loop:
+        redis = await RedisClient.get_client()
+        if settings.stream_producer_buffered:
+            producer = BufferedStreamProducer(redis)
+            producer.start()
+            _stream_producer = producer
+        else:
+            _stream_producer = StreamProducer(redis)
+        _stream_producer_loop = loop
+    return _stream_producer
+
+
+async def close_stream_producer():
+    """Flush and stop the shared producer (application shutdown)"""
+    global _stream_producer, _stream_producer_loop
+    if isinstance(_stream_producer, BufferedStreamProducer):
+        await _stream_producer.stop()
+    _stream_producer = None
+    _stream_producer_loop = None
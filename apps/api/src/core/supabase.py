@@ -1,25 +1,99 @@
 """
 Supabase client initialization.
+
+Clients are the async supabase-py flavour, so PostgREST and Auth round trips
+never block the event loop. Every client shares one process-wide httpx pool
+(keep-alive, HTTP/2), so requests reuse warm connections. The service role
+client is a singleton. The anon client is still built per request because
+signing in stores the user's session on the client instance, but building it
+on top of the shared pool is cheap.
 """
-from supabase import create_client, Client
+import logging
+from typing import Optional
+
+import httpx
+from supabase import acreate_client, AsyncClient, AsyncClientOptions
+
 from .config import settings
 
-def get_supabase_client() -> Client:
+logger = logging.getLogger(__name__)
+
+_http_client: Optional[httpx.AsyncClient] = None
+_service_client: Optional[AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Get the shared HTTP connection pool used by every Supabase client.
+
+    Returns:
+        httpx.AsyncClient: Pooled HTTP client
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            http2=settings.supabase_http2,
+            timeout=settings.supabase_timeout,
+            limits=httpx.Limits(
+                max_connections=settings.supabase_pool_size,
+                max_keepalive_connections=settings.supabase_pool_size,
+                keepalive_expiry=settings.supabase_keepalive_expiry
+            )
+        )
+    return _http_client
+
+
+async def get_supabase_client() -> AsyncClient:
     """
     Get initialized Supabase client.
-    
+
     Returns:
-        Client: Supabase client instance
+        AsyncClient: Supabase client instance
     """
-    return create_client(settings.supabase_url, settings.supabase_key)
+    return await acreate_client(
+        settings.supabase_url,
+        settings.supabase_key,
+        options=AsyncClientOptions(httpx_client=get_http_client())
+    )
 
-def get_supabase_service_client() -> Client:
+
+async def get_supabase_service_client() -> AsyncClient:
     """
     Get initialized Supabase client with service role key (admin).
-    
+
     Returns:
-        Client: Supabase admin client instance
+        AsyncClient: Supabase admin client instance
     """
+    global _service_client
     if not settings.supabase_service_key:
         raise ValueError("SUPABASE_SERVICE_KEY not configured")
-    return create_client(settings.supabase_url, settings.supabase_service_key)
+    if _service_client is None:
+        _service_client = await acreate_client(
+            settings.supabase_url,
+            settings.supabase_service_key,
+            options=AsyncClientOptions(
+                httpx_client=get_http_client(),
+                auto_refresh_token=False,
+                persist_session=False
+            )
+        )
+    return _service_client
+
+
+async def warm_up_supabase_clients() -> None:
+    """Build the shared clients and open a first connection to PostgREST."""
+    try:
+        supabase = await get_supabase_service_client()
+        await supabase.table('profiles').select('id').limit(1).execute()
+        logger.info("Supabase connection pool warmed up")
+    except Exception as e:
+        logger.warning(f"Supabase warm-up failed: {e}")
+
+
+async def close_supabase_clients() -> None:
+    """Close the shared connection pool (application shutdown)."""
+    global _http_client, _service_client
+    _service_client = None
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
@@ -0,0 +1,255 @@
+"""
+Standalone Webhook Dispatcher
+
+Runs the webhook dispatcher outside the API so fan-out does not compete with
+HTTP serving, and its capacity does not depend on the uvicorn worker count.
+A supervisor process starts N worker processes. Each worker is one consumer
+in the `webhook-dispatcher` group. The supervisor serves /health and /metrics
+for all of them and drains them gracefully on SIGTERM.
+
+Usage (from apps/api):
+    python -m src.dispatcher [--workers N] [--metrics-port PORT]
+
+Set WEBHOOK_DISPATCHER_IN_API=false on the API when running this.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.core.config import settings
+
+logging.basicConfig(level=logging.INFO)
+for logger_name in ["hpack", "httpcore", "httpx", "urllib3"]:
+    logging.getLogger(logger_name).setLevel(logging.WARNING)
+
+logger = logging.getLogger(__name__)
+
+STATS_INTERVAL = 5.0  # seconds between worker stats reports
+STALE_AFTER = STATS_INTERVAL * 4  # a worker that stops reporting is unhealthy
+RESTART_BACKOFF_INITIAL = 1.0  # seconds before restarting an exited worker
+RESTART_BACKOFF_MAX = 60.0  # the delay doubles per crash up to this
+STABLE_AFTER = 60.0  # a worker that ran this long restarts without backoff
+
+
+# ============================================
+# Worker process
+# ============================================
+
+def run_worker(index: int, stats_queue: multiprocessing.Queue) -> None:
+    """Entry point of one worker process"""
+    asyncio.run(_worker(index, stats_queue))
+
+
+async def _worker(index: int, stats_queue: multiprocessing.Queue) -> None:
+    from redis.asyncio import Redis
+
+    from src.core.supabase import get_supabase_service_client, close_supabase_clients
+    from src.services.webhook_dispatcher import WebhookDispatcher
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+
+    redis = Redis.from_url(settings.redis_url)
+    dispatcher = WebhookDispatcher(
+        redis=redis,
+        supabase=await get_supabase_service_client()
+    )
+    dispatcher_task = asyncio.create_task(dispatcher.start())
+    logger.info(f"Dispatcher worker {index} started")
+
+    try:
+        while not stopping.is_set() and not dispatcher_task.done():
+            _report(stats_queue, index, dispatcher.stats())
+            try:
+                await asyncio.wait_for(stopping.wait(), timeout=STATS_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        # Drain: stop reading, let in-flight events settle, flush logs, leave the group
+        logger.info(f"Dispatcher worker {index} draining")
+        await dispatcher.stop()
+        dispatcher_task.cancel()
+        await asyncio.gather(dispatcher_task, return_exceptions=True)
+        await redis.close()
+        await close_supabase_clients()
+        logger.info(f"Dispatcher worker {index} stopped")
+
+
+def _report(stats_queue: multiprocessing.Queue, index: int, stats: dict) -> None:
+    try:
+        stats_queue.put_nowait((index, time.time(), stats))
+    except queue.Full:
+        pass
+
+
+# ============================================
+# Supervisor
+# ============================================
+
+class DispatcherSupervisor:
+    """Starts, watches and drains the worker processes"""
+
+    def __init__(self, workers: int, metrics_port: int):
+        self.worker_count = workers
+        self.metrics_port = metrics_port
+        self.context = multiprocessing.get_context("spawn")
+        self.stats_queue = self.context.Queue(maxsize=workers * 16)
+        self.processes: dict[int, multiprocessing.Process] = {}
+        self.reports: dict[int, tuple[float, dict]] = {}
+        self.restarts = 0
+        self.started_at: dict[int, float] = {}
+        self.restart_delays: dict[int, float] = {}
+        self.restart_at: dict[int, float] = {}  # exited workers waiting out their backoff
+        self.stopping = threading.Event()
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        server = ThreadingHTTPServer(("0.0.0.0", self.metrics_port), self._handler())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logger.info(f"Dispatcher supervisor: {self.worker_count} workers, metrics on :{self.metrics_port}")
+
+        for index in range(self.worker_count):
+            self._spawn(index)
+
+        while not self.stopping.is_set():
+            self._collect_stats(timeout=1.0)
+            self._restart_exited(time.monotonic())
+
+        self._drain()
+        server.shutdown()
+        return 0
+
+    def _restart_exited(self, now: float) -> None:
+        """Restart exited workers, backing off exponentially while they keep crashing"""
+        for index, process in list(self.processes.items()):
+            if process.is_alive() or self.stopping.is_set():
+                continue
+            if index not in self.restart_at:
+                delay = self._restart_delay(index, now)
+                logger.error(f"Dispatcher worker {index} exited with {process.exitcode}, restarting in {delay:.0f}s")
+                self.restart_at[index] = now + delay
+            elif now >= self.restart_at[index]:
+                del self.restart_at[index]
+                self.restarts += 1
+                self._spawn(index)
+
+    def _restart_delay(self, index: int, now: float) -> float:
+        previous = self.restart_delays.get(index)
+        if previous is None or now - self.started_at.get(index, now) >= STABLE_AFTER:
+            delay = RESTART_BACKOFF_INITIAL
+        else:
+            delay = min(previous * 2, RESTART_BACKOFF_MAX)
+        self.restart_delays[index] = delay
+        return delay
+
+    def _spawn(self, index: int) -> None:
+        process = self.context.Process(
+            target=run_worker,
+            args=(index, self.stats_queue),
+            name=f"webhook-dispatcher-{index}"
+        )
+        process.start()
+        self.processes[index] = process
+        self.started_at[index] = time.monotonic()
+
+    def _request_stop(self, signum, frame) -> None:
+        logger.info(f"Received signal {signum}, draining dispatcher workers")
+        self.stopping.set()
+
+    def _drain(self) -> None:
+        """Forward SIGTERM and give workers the shutdown timeout to finish"""
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+
+        deadline = time.monotonic() + settings.webhook_shutdown_timeout + 5
+        for index, process in self.processes.items():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"Dispatcher worker {index} did not drain in time, killing")
+                process.kill()
+                process.join()
+
+    def _collect_stats(self, timeout: float) -> None:
+        try:
+            index, reported_at, stats = self.stats_queue.get(timeout=timeout)
+            self.reports[index] = (reported_at, stats)
+            while True:
+                index, reported_at, stats = self.stats_queue.get_nowait()
+                self.reports[index] = (reported_at, stats)
+        except queue.Empty:
+            pass
+
+    def health(self) -> tuple[bool, dict]:
+        now = time.time()
+        workers = []
+        for index, process in sorted(self.processes.items()):
+            reported_at = self.reports.get(index, (0, None))[0]
+            workers.append({
+                "worker": index,
+                "pid": process.pid,
+                "alive": process.is_alive(),
+                "lastReportSecondsAgo": round(now - reported_at, 1) if reported_at else None,
+            })
+        healthy = not self.stopping.is_set() and all(
+            w["alive"] and w["lastReportSecondsAgo"] is not None and w["lastReportSecondsAgo"] < STALE_AFTER
+            for w in workers
+        )
+        return healthy, {"status": "healthy" if healthy else "unhealthy", "workers": workers}
+
+    def metrics(self) -> dict:
+        return {
+            "workers": self.worker_count,
+            "restarts": self.restarts,
+            "dispatchers": {index: stats for index, (_, stats) in sorted(self.reports.items())},
+        }
+
+    def _handler(self):
+        supervisor = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/health":
+                    healthy, body = supervisor.health()
+                    self._send(200 if healthy else 503, body)
+                elif self.path == "/metrics":
+                    self._send(200, supervisor.metrics())
+                else:
+                    self._send(404, {"detail": "Not found"})
+
+            def _send(self, status_code: int, body: dict):
+                payload = json.dumps(body).encode()
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return MetricsHandler
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run the webhook dispatcher outside the API")
+    parser.add_argument("--workers", type=int, default=settings.webhook_dispatcher_workers)
+    parser.add_argument("--metrics-port", type=int, default=settings.webhook_dispatcher_metrics_port)
+    args = parser.parse_args()
+
+    return DispatcherSupervisor(args.workers, args.metrics_port).run()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -10,12 +10,23 @@ logging.basicConfig(level=logging.INFO)
 for logger_name in ["hpack", "httpcore", "httpx", "urllib3"]:
     logging.getLogger(logger_name).setLevel(logging.WARNING)
 
+logger = logging.getLogger(__name__)
+
 from contextlib import asynccontextmanager
 
 import asyncio
 from redis.asyncio import Redis
 
 from src.core.config import settings
+from src.core.redis_client import RedisClient
+from src.core.stream_producer import close_stream_producer
+from src.core.pubsub_multiplexer import close_pubsub_multiplexer
+from src.core.auth_cache import listen_for_auth_invalidations
+from src.core.supabase import (
+    get_supabase_service_client,
+    warm_up_supabase_clients,
+    close_supabase_clients
+)
 from src.api.v1.auth import router as auth_router
 from src.api.v1.keys import router as keys_router
 from src.api.v1.sessions import router as sessions_router
@@ -27,6 +38,8 @@ from src.api.v1.admin import router as admin_router
 from src.api.v1.payment import router as payment_router
 from src.api.v1.support import router as support_router
 from src.services.webhook_dispatcher import WebhookDispatcher
+from src.services.api_key_usage import ApiKeyUsageFlusher
+from src.services.quota import QuotaReconciler
 # Global dispatcher instance
 webhook_dispatcher = None
 
@@ -39,38 +52,74 @@ async def lifespan(app: FastAPI):
     print("[DEBUG] LIFESPAN STARTED")
     
     # Startup
-    try:
-        redis = Redis.from_url(settings.redis_url)
-        webhook_dispatcher = WebhookDispatcher(
-            redis=redis,
-            supabase_url=settings.supabase_url,
-            supabase_key=settings.supabase_service_key
-        )
-        
-        # Start dispatcher in background task
-        loop = asyncio.get_event_loop()
-        task = loop.create_task(webhook_dispatcher.start())
-        
-        def handle_dispatcher_result(t):
-            try:
-                t.result()
-            except Exception as e:
-                import logging
-                logging.error(f"WebhookDispatcher task died with error: {e}")
-                print(f"[CRITICAL] WebhookDispatcher task died: {e}")
-        
-        task.add_done_callback(handle_dispatcher_result)
-        print("[DEBUG] WebhookDispatcher task scheduled")
-        
-    except Exception as e:
-        print(f"[CRITICAL] Failed to start WebhookDispatcher: {e}")
+    # Open the shared Supabase connection pool before taking traffic
+    await warm_up_supabase_clients()
+
+    # The dispatcher can run standalone instead (python -m src.dispatcher)
+    redis = None
+    if settings.webhook_dispatcher_in_api:
+        try:
+            redis = Redis.from_url(settings.redis_url)
+            webhook_dispatcher = WebhookDispatcher(
+                redis=redis,
+                supabase=await get_supabase_service_client()
+            )
+            app.state.webhook_dispatcher = webhook_dispatcher
+
+            # Start dispatcher in background task
+            loop = asyncio.get_event_loop()
+            task = loop.create_task(webhook_dispatcher.start())
+
+            def handle_dispatcher_result(t):
+                try:
+                    t.result()
+                except Exception as e:
+                    import logging
+                    logging.error(f"WebhookDispatcher task died with error: {e}")
+                    print(f"[CRITICAL] WebhookDispatcher task died: {e}")
+
+            task.add_done_callback(handle_dispatcher_result)
+            print("[DEBUG] WebhookDispatcher task scheduled")
+
+        except Exception as e:
+            print(f"[CRITICAL] Failed to start WebhookDispatcher: {e}")
+    else:
+        logger.info("WebhookDispatcher disabled in API (WEBHOOK_DISPATCHER_IN_API=false)")
+
+    # Apply API key cache invalidations published by other workers
+    auth_listener_task = asyncio.create_task(
+        listen_for_auth_invalidations(await RedisClient.get_client())
+    )
+
+    # Write-behind flush of API key usage counters
+    usage_flusher = ApiKeyUsageFlusher(
+        redis=await RedisClient.get_client(),
+        supabase=await get_supabase_service_client()
+    )
+    usage_flusher_task = asyncio.create_task(usage_flusher.start())
+
+    # Periodic write-back of Redis message quota counters
+    quota_reconciler = QuotaReconciler(
+        redis=await RedisClient.get_client(),
+        supabase=await get_supabase_service_client()
+    )
+    quota_reconciler_task = asyncio.create_task(quota_reconciler.start())
 
     yield
     
     # Shutdown
+    auth_listener_task.cancel()
+    usage_flusher_task.cancel()
+    await usage_flusher.stop()
+    quota_reconciler_task.cancel()
+    await quota_reconciler.stop()
+    await close_stream_producer()
+    await close_pubsub_multiplexer()
     if webhook_dispatcher:
         await webhook_dispatcher.stop()
-    await redis.close()
+    if redis:
+        await redis.close()
+    await close_supabase_clients()
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -109,6 +109,31 @@ class SendAudioRequest(BaseModel):
         return v
 
 
+class BatchRecipient(BaseModel):
+    """One recipient of a batch send"""
+    model_config = ConfigDict(populate_by_name=True)
+    
+    to: str = Field(description="Phone number in international format")
+    variables: dict[str, str] = Field(default_factory=dict, description="Values for {{name}} placeholders in the message")
+    
+    @field_validator('to')
+    @classmethod
+    def validate_phone(cls, v: str) -> str:
+        phone = re.sub(r'[^\d+]', '', v)
+        if not (phone.startswith('+') or (len(phone) >= 10 and len(phone) <= 15)):
+            raise ValueError('Invalid phone number format. Use international format like +1234567890')
+        return phone
+
+
+class SendBatchRequest(BaseModel):
+    """Request to send one text message template to many recipients"""
+    model_config = ConfigDict(populate_by_name=True)
+    
+    message: str = Field(min_length=1, max_length=4096, description="Message text, may contain {{name}} placeholders")
+    recipients: list[BatchRecipient] = Field(min_length=1, description="Recipients with optional per-recipient variables")
+    session_id: UUID | None = Field(None, alias="sessionId", description="Optional session ID (uses default if not provided)")
+
+
 class MessageResponse(BaseModel):
     """Message response (CamelCase JSON)"""
     model_config = ConfigDict(
@@ -139,3 +164,27 @@ class MessageListResponse(BaseModel):
     total: int
     limit: int
     offset: int
+
+
+class BatchMessageItem(BaseModel):
+    """Message created for one batch recipient"""
+    model_config = ConfigDict(
+        populate_by_name=True,
+        alias_generator=to_camel
+    )
+    
+    id: UUID
+    to_phone: str
+    status: MessageStatus
+
+
+class SendBatchResponse(BaseModel):
+    """Batch send result, items in recipient order"""
+    model_config = ConfigDict(
+        populate_by_name=True,
+        alias_generator=to_camel
+    )
+    
+    batch_id: UUID
+    total: int
+    messages: list[BatchMessageItem]
@@ -51,6 +51,12 @@ class WebhookEventType(str, Enum):
     CALL_MISSED = "call.missed"
 
 
+class WebhookDeliveryMode(str, Enum):
+    """How events are POSTed to the webhook URL"""
+    SINGLE = "single"  # One event object per request
+    BATCH = "batch"    # JSON array of events per request
+
+
 def to_camel(string: str) -> str:
     """Convert snake_case to camelCase"""
     components = string.split('_')
@@ -72,6 +78,15 @@ class WebhookCreate(BaseModel):
         ],
         description="Events to subscribe to"
     )
+    delivery_mode: WebhookDeliveryMode = Field(
+        WebhookDeliveryMode.SINGLE, alias="deliveryMode", description="single or batch delivery"
+    )
+    batch_max_events: int = Field(
+        100, alias="batchMaxEvents", ge=1, le=1000, description="Batch mode: max events per request"
+    )
+    batch_max_wait_ms: int = Field(
+        1000, alias="batchMaxWaitMs", ge=10, le=60000, description="Batch mode: max delay before sending"
+    )
 
 
 class WebhookUpdate(BaseModel):
@@ -82,6 +97,9 @@ class WebhookUpdate(BaseModel):
     session_id: UUID | None = Field(None, alias="sessionId", description="Session to associate (null for global)")
     events: list[WebhookEventType] | None = Field(None, description="New events list")
     enabled: bool | None = Field(None, description="Enable/disable webhook")
+    delivery_mode: WebhookDeliveryMode | None = Field(None, alias="deliveryMode", description="single or batch delivery")
+    batch_max_events: int | None = Field(None, alias="batchMaxEvents", ge=1, le=1000)
+    batch_max_wait_ms: int | None = Field(None, alias="batchMaxWaitMs", ge=10, le=60000)
 
 
 class WebhookResponse(BaseModel):
@@ -98,6 +116,9 @@ class WebhookResponse(BaseModel):
     enabled: bool
     last_triggered_at: datetime | None = None
     failure_count: int
+    delivery_mode: WebhookDeliveryMode = WebhookDeliveryMode.SINGLE
+    batch_max_events: int = 100
+    batch_max_wait_ms: int = 1000
     created_at: datetime
 
 
@@ -125,4 +146,38 @@ class WebhookSecretResponse(BaseModel):
     session_id: UUID | None = None
     events: list[str]
     enabled: bool
+    delivery_mode: WebhookDeliveryMode = WebhookDeliveryMode.SINGLE
+    batch_max_events: int = 100
+    batch_max_wait_ms: int = 1000
+    created_at: datetime
+
+
+class WebhookReplayRequest(BaseModel):
+    """Request to replay dead-lettered deliveries of a webhook"""
+    model_config = ConfigDict(populate_by_name=True)
+    
+    from_time: datetime = Field(alias="from", description="Replay deliveries dead-lettered at or after this time")
+    to_time: datetime = Field(alias="to", description="Replay deliveries dead-lettered up to this time")
+    rate_per_second: int = Field(10, alias="ratePerSecond", ge=1, le=100, description="Max deliveries per second")
+
+
+class WebhookReplayResponse(BaseModel):
+    """Replay job progress"""
+    model_config = ConfigDict(
+        populate_by_name=True,
+        alias_generator=to_camel
+    )
+    
+    replay_id: str
+    webhook_id: UUID
+    status: str = Field(description="pending, running, completed or failed")
+    rate_per_second: int
+    scanned: int = Field(description="DLQ entries read in the time range")
+    matched: int = Field(description="Entries belonging to this webhook")
+    delivered: int = Field(description="Entries delivered on the replay attempt")
+    requeued: int = Field(description="Entries that failed again and went to the retry queue")
+    cursor: str | None = Field(None, description="Last DLQ entry id processed")
+    error: str | None = None
     created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
@@ -0,0 +1,138 @@
+"""
+API Key Usage Counters
+
+Per-request usage is accumulated in Redis (HINCRBY/HSET per key id) and a
+background flusher applies the aggregated deltas to `api_keys` in batches,
+instead of a synchronous read-modify-write UPDATE on every request.
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any
+
+from redis.asyncio import Redis
+from supabase import AsyncClient
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+USAGE_KEY_PREFIX = "api_keys:usage:"
+USAGE_DIRTY_SET = "api_keys:usage:dirty"
+
+
+def _usage_key(key_id: str) -> str:
+    return f"{USAGE_KEY_PREFIX}{key_id}"
+
+
+async def record_api_key_usage(redis: Redis, key_id: str) -> None:
+    """Count one request for an API key (single pipelined round trip)."""
+    key = _usage_key(key_id)
+    pipe = redis.pipeline(transaction=False)
+    pipe.hincrby(key, "count", 1)
+    pipe.hset(key, "last_used_at", datetime.now(timezone.utc).isoformat())
+    pipe.sadd(USAGE_DIRTY_SET, key_id)
+    await pipe.execute()
+
+
+async def get_pending_usage(redis: Redis, key_id: str) -> tuple[int, str | None]:
+    """
+    Return usage recorded in Redis but not yet flushed to the database.
+    
+    Returns:
+        (request count delta, latest last_used_at ISO timestamp or None)
+    """
+    data = await redis.hgetall(_usage_key(key_id))
+    return int(data.get("count", 0)), data.get("last_used_at")
+
+
+class ApiKeyUsageFlusher:
+    """
+    Background task that writes accumulated API key usage to Supabase.
+    
+    Every worker can run one: SPOP hands each dirty key id to a single flusher,
+    and each key's counters are read and reset atomically in a MULTI block.
+    """
+    
+    def __init__(
+        self,
+        redis: Redis,
+        supabase: AsyncClient,
+        interval: float = settings.api_key_usage_flush_interval,
+        batch_size: int = settings.api_key_usage_flush_batch_size
+    ):
+        self.redis = redis
+        self.supabase = supabase
+        self.interval = interval
+        self.batch_size = batch_size
+        self.running = False
+    
+    async def start(self):
+        """Flush periodically until stopped"""
+        self.running = True
+        logger.info(f"API key usage flusher started (every {self.interval}s)")
+        
+        while self.running:
+            try:
+                await asyncio.sleep(self.interval)
+                while await self.flush_once() >= self.batch_size:
+                    pass  # Backlog larger than one batch: keep draining
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"API key usage flush failed: {e}")
+    
+    async def stop(self):
+        """Stop the loop and flush what is left"""
+        self.running = False
+        try:
+            await self.flush_once()
+        except Exception as e:
+            logger.error(f"Final API key usage flush failed: {e}")
+        logger.info("API key usage flusher stopped")
+    
+    async def flush_once(self) -> int:
+        """Flush one batch of dirty keys. Returns the number of keys taken."""
+        key_ids = await self.redis.spop(USAGE_DIRTY_SET, self.batch_size)
+        if not key_ids:
+            return 0
+        
+        # Read and reset each key's counters atomically
+        pipe = self.redis.pipeline(transaction=True)
+        for key_id in key_ids:
+            pipe.hgetall(_usage_key(key_id))
+            pipe.delete(_usage_key(key_id))
+        results = await pipe.execute()
+        
+        updates: list[dict[str, Any]] = []
+        for key_id, data in zip(key_ids, results[::2]):
+            count = int(data.get("count", 0))
+            if count:
+                updates.append({
+                    "id": key_id,
+                    "count": count,
+                    "last_used_at": data.get("last_used_at")
+                })
+        
+        if not updates:
+            return len(key_ids)
+        
+        try:
+            await self.supabase.rpc("increment_api_key_usage", {"updates": updates}).execute()
+            logger.debug(f"Flushed usage for {len(updates)} API keys")
+        except Exception:
+            await self._restore(updates)
+            raise
+        
+        return len(key_ids)
+    
+    async def _restore(self, updates: list[dict[str, Any]]):
+        """Put deltas back so the next flush retries them"""
+        pipe = self.redis.pipeline(transaction=False)
+        for update in updates:
+            key = _usage_key(update["id"])
+            pipe.hincrby(key, "count", update["count"])
+            if update["last_used_at"]:
+                pipe.hsetnx(key, "last_used_at", update["last_used_at"])
+            pipe.sadd(USAGE_DIRTY_SET, update["id"])
+        await pipe.execute()
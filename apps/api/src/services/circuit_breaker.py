@@ -0,0 +1,55 @@
+"""
+Circuit Breaker
+
+Per-endpoint breaker used by the webhook dispatcher so a dead URL stops
+costing an HTTP timeout for every event.
+
+    closed    -> requests flow; `failure_threshold` consecutive failures open it
+    open      -> requests are refused until `open_seconds` have passed
+    half_open -> exactly one probe request; success closes, failure re-opens
+"""
+import time
+from enum import Enum
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker for one endpoint (not thread-safe; one event loop)"""
+
+    def __init__(self, failure_threshold: int, open_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self) -> bool:
+        """Whether a request may go out now. Admitting the half-open probe is a transition."""
+        if self.state is CircuitState.CLOSED:
+            return True
+        if self.state is CircuitState.OPEN and self.probe_due():
+            self.state = CircuitState.HALF_OPEN
+            return True
+        return False  # Open, or a probe is already in flight
+
+    def probe_due(self) -> bool:
+        """Open long enough that the next request should be a probe"""
+        return self.state is CircuitState.OPEN and time.monotonic() - self.opened_at >= self.open_seconds
+
+    def record_success(self) -> None:
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state is CircuitState.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = CircuitState.OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {"state": self.state.value, "failures": self.failures}
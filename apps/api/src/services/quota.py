@@ -0,0 +1,339 @@
+"""
+Message Quota Engine
+
+Per-user message counters live in Redis. A Lua script checks the subscription
+expiry and the monthly limit and increments the counter in one atomic step,
+so parallel sends can no longer lose increments. Counters are seeded from
+`subscriptions` on a miss. The accumulated deltas are reconciled back to
+Postgres in periodic batches by QuotaReconciler.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+from fastapi import HTTPException, status
+from redis.asyncio import Redis
+from supabase import AsyncClient
+
+from ..core.config import settings
+from ..core.redis_client import RedisClient
+
+logger = logging.getLogger(__name__)
+
+QUOTA_KEY_PREFIX = "quota:"
+QUOTA_PENDING_KEY = "quota:pending"            # user_id -> messages not yet written to Postgres
+QUOTA_INFLIGHT_KEY = "quota:pending:inflight"  # batch currently being reconciled
+QUOTA_RECONCILE_LOCK = "quota:reconcile:lock"
+
+# Script result codes
+_OK = 0
+_MISS = -1
+_EXPIRED = -2
+_EXCEEDED = -3
+
+# Alert bits returned by the check script
+ALERT_80 = 1
+ALERT_100 = 2
+
+# KEYS: quota hash, pending hash   ARGV: amount, now (epoch seconds), user_id
+_CHECK_AND_INCREMENT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {-1, 0, 0, 0}
+end
+local q = redis.call('HMGET', KEYS[1], 'used', 'limit', 'period_end', 'alert_80', 'alert_100')
+local used = tonumber(q[1])
+local limit = tonumber(q[2])
+local period_end = tonumber(q[3])
+local amount = tonumber(ARGV[1])
+
+if period_end > 0 and tonumber(ARGV[2]) > period_end then
+    return {-2, used, limit, 0}
+end
+if limit > 0 and used + amount > limit then
+    return {-3, used, limit, 0}
+end
+
+used = redis.call('HINCRBY', KEYS[1], 'used', amount)
+redis.call('HINCRBY', KEYS[2], ARGV[3], amount)
+
+local alerts = 0
+if limit > 0 then
+    if used * 100 >= limit * 80 and q[4] ~= '1' then
+        redis.call('HSET', KEYS[1], 'alert_80', '1')
+        alerts = alerts + 1
+    end
+    if used >= limit and q[5] ~= '1' then
+        redis.call('HSET', KEYS[1], 'alert_100', '1')
+        alerts = alerts + 2
+    end
+end
+return {0, used, limit, alerts}
+"""
+
+# KEYS: quota hash, pending hash, inflight hash
+# ARGV: used, limit, period_end, alert_80, alert_100, ttl, user_id
+_SEED = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+-- Deltas not yet reconciled are not in the database row yet
+local used = tonumber(ARGV[1])
+    + tonumber(redis.call('HGET', KEYS[2], ARGV[7]) or '0')
+    + tonumber(redis.call('HGET', KEYS[3], ARGV[7]) or '0')
+redis.call('HSET', KEYS[1],
+    'used', used, 'limit', ARGV[2], 'period_end', ARGV[3],
+    'alert_80', ARGV[4], 'alert_100', ARGV[5])
+redis.call('EXPIRE', KEYS[1], ARGV[6])
+return 1
+"""
+
+# KEYS: quota hash, pending hash   ARGV: amount, user_id
+_REFUND = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('HINCRBY', KEYS[1], 'used', -tonumber(ARGV[1]))
+end
+-- A missing counter is seeded from the database plus pending deltas, so this counts either way
+redis.call('HINCRBY', KEYS[2], ARGV[2], -tonumber(ARGV[1]))
+return 1
+"""
+
+
+@dataclass
+class QuotaResult:
+    """Outcome of a successful quota check"""
+    used: int
+    limit: int
+    alerts: list[int] = field(default_factory=list)  # thresholds (80, 100) crossed by this call
+
+
+def _quota_key(user_id: str) -> str:
+    return f"{QUOTA_KEY_PREFIX}{user_id}"
+
+
+def _period_end_timestamp(value: str | None) -> float:
+    """Parse current_period_end into epoch seconds (0 = no expiry)."""
+    if not value:
+        return 0
+    try:
+        expiry = datetime.fromisoformat(value)
+        if expiry.tzinfo is None:
+            expiry = expiry.replace(tzinfo=timezone.utc)
+        return expiry.timestamp()
+    except ValueError as e:
+        logger.warning(f"Unparseable current_period_end {value!r}: {e}")
+        return 0
+
+
+class QuotaEngine:
+    """
+    Atomic check-and-increment of monthly message quotas.
+
+    The Redis hash `quota:{user_id}` caches the plan limit, period end and
+    alert flags next to the running count. It expires after QUOTA_CACHE_TTL
+    seconds so plan changes and the monthly reset in Postgres are picked up.
+    """
+
+    def __init__(self, redis: Redis, cache_ttl: int = settings.quota_cache_ttl):
+        self.redis = redis
+        self.cache_ttl = cache_ttl
+        self._check_script = redis.register_script(_CHECK_AND_INCREMENT)
+        self._seed_script = redis.register_script(_SEED)
+        self._refund_script = redis.register_script(_REFUND)
+
+    async def check_and_increment(
+        self,
+        user_id: str,
+        supabase: AsyncClient,
+        amount: int = 1
+    ) -> QuotaResult:
+        """
+        Reserve `amount` messages from the user's quota.
+
+        Raises:
+            HTTPException: 402 if there is no subscription or it has expired,
+                403 if the monthly quota would be exceeded.
+        """
+        user_id = str(user_id)
+        code, used, limit, alerts = await self._check(user_id, amount)
+
+        if code == _MISS:
+            await self._seed(user_id, supabase)
+            code, used, limit, alerts = await self._check(user_id, amount)
+
+        if code == _EXPIRED:
+            period_end = float(await self.redis.hget(_quota_key(user_id), 'period_end') or 0)
+            expiry = datetime.fromtimestamp(period_end, tz=timezone.utc)
+            raise HTTPException(
+                status_code=status.HTTP_402_PAYMENT_REQUIRED,
+                detail=f"Subscription expired on {expiry.strftime('%Y-%m-%d')}. Please upgrade your plan."
+            )
+
+        if code == _EXCEEDED:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Monthly message quota exceeded ({limit} messages). Please upgrade your plan."
+            )
+
+        result = QuotaResult(used=used, limit=limit)
+        if alerts & ALERT_80:
+            result.alerts.append(80)
+        if alerts & ALERT_100:
+            result.alerts.append(100)
+        if result.alerts:
+            await self._record_alerts(user_id, supabase, result)
+
+        return result
+
+    async def refund(self, user_id: str, amount: int) -> None:
+        """Give back messages reserved by check_and_increment that were never queued."""
+        if amount <= 0:
+            return
+        await self._refund_script(
+            keys=[_quota_key(str(user_id)), QUOTA_PENDING_KEY],
+            args=[amount, str(user_id)]
+        )
+
+    async def get_cached_usage(self, user_id: str) -> int | None:
+        """Live message count from Redis, or None if the user isn't cached."""
+        used = await self.redis.hget(_quota_key(str(user_id)), 'used')
+        return int(used) if used is not None else None
+
+    async def invalidate(self, user_id: str) -> None:
+        """Drop the cached plan fields so the next send reseeds from Postgres."""
+        await self.redis.delete(_quota_key(str(user_id)))
+
+    async def _check(self, user_id: str, amount: int) -> list[int]:
+        result = await self._check_script(
+            keys=[_quota_key(user_id), QUOTA_PENDING_KEY],
+            args=[amount, int(time.time()), user_id]
+        )
+        return [int(v) for v in result]
+
+    async def _seed(self, user_id: str, supabase: AsyncClient) -> None:
+        """Load the user's subscription into Redis"""
+        result = await supabase.table("subscriptions")\
+            .select("messages_used, message_limit, current_period_end, quota_alert_sent_80, quota_alert_sent_100")\
+            .eq("user_id", user_id)\
+            .limit(1)\
+            .execute()
+
+        if not result.data:
+            raise HTTPException(
+                status_code=status.HTTP_402_PAYMENT_REQUIRED,
+                detail="No active subscription found. Please activate a plan in the dashboard."
+            )
+
+        sub = result.data[0]
+        message_limit = sub.get("message_limit")
+        await self._seed_script(
+            keys=[_quota_key(user_id), QUOTA_PENDING_KEY, QUOTA_INFLIGHT_KEY],
+            args=[
+                sub.get("messages_used") or 0,
+                100 if message_limit is None else message_limit,
+                int(_period_end_timestamp(sub.get("current_period_end"))),
+                1 if sub.get("quota_alert_sent_80") else 0,
+                1 if sub.get("quota_alert_sent_100") else 0,
+                self.cache_ttl,
+                user_id
+            ]
+        )
+
+    async def _record_alerts(self, user_id: str, supabase: AsyncClient, result: QuotaResult) -> None:
+        """Persist alert flags (the script hands each threshold out exactly once)"""
+        update_data = {f"quota_alert_sent_{threshold}": True for threshold in result.alerts}
+        logger.info(f"User {user_id} crossed quota thresholds {result.alerts} ({result.used}/{result.limit})")
+        # TODO: Send email alerts at 80% / 100%
+        try:
+            await supabase.table("subscriptions")\
+                .update(update_data)\
+                .eq("user_id", user_id)\
+                .execute()
+        except Exception as e:
+            logger.error(f"Failed to record quota alerts for {user_id}: {e}")
+
+
+class QuotaReconciler:
+    """
+    Background task that writes accumulated quota usage to `subscriptions`.
+
+    Pending deltas are renamed to an in-flight hash before the write and only
+    deleted once it succeeds, so a failed batch is retried on the next tick.
+    A short Redis lock keeps workers from reconciling the same batch twice.
+    """
+
+    LOCK_TTL = 60  # seconds
+
+    def __init__(
+        self,
+        redis: Redis,
+        supabase: AsyncClient,
+        interval: float = settings.quota_reconcile_interval
+    ):
+        self.redis = redis
+        self.supabase = supabase
+        self.interval = interval
+        self.running = False
+
+    async def start(self):
+        """Reconcile periodically until stopped"""
+        self.running = True
+        logger.info(f"Quota reconciler started (every {self.interval}s)")
+
+        while self.running:
+            try:
+                await asyncio.sleep(self.interval)
+                await self.flush_once()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Quota reconciliation failed: {e}")
+
+    async def stop(self):
+        """Stop the loop and reconcile what is left"""
+        self.running = False
+        try:
+            await self.flush_once()
+        except Exception as e:
+            logger.error(f"Final quota reconciliation failed: {e}")
+        logger.info("Quota reconciler stopped")
+
+    async def flush_once(self) -> int:
+        """Write one batch of deltas. Returns the number of users updated."""
+        if not await self.redis.set(QUOTA_RECONCILE_LOCK, "1", nx=True, ex=self.LOCK_TTL):
+            return 0  # Another worker is reconciling
+
+        try:
+            # Retry a previously failed batch before taking a new one
+            if not await self.redis.exists(QUOTA_INFLIGHT_KEY):
+                if not await self.redis.exists(QUOTA_PENDING_KEY):
+                    return 0
+                await self.redis.rename(QUOTA_PENDING_KEY, QUOTA_INFLIGHT_KEY)
+
+            deltas = await self.redis.hgetall(QUOTA_INFLIGHT_KEY)
+            updates = [
+                {"user_id": user_id, "count": int(count)}
+                for user_id, count in deltas.items()
+                if int(count)
+            ]
+
+            if updates:
+                await self.supabase.rpc("increment_messages_used", {"updates": updates}).execute()
+                logger.debug(f"Reconciled quota usage for {len(updates)} users")
+
+            await self.redis.delete(QUOTA_INFLIGHT_KEY)
+            return len(updates)
+        finally:
+            await self.redis.delete(QUOTA_RECONCILE_LOCK)
+
+
+_quota_engine: QuotaEngine | None = None
+
+
+async def get_quota_engine() -> QuotaEngine:
+    """Process-wide QuotaEngine on the shared Redis client"""
+    global _quota_engine
+    if _quota_engine is None:
+        _quota_engine = QuotaEngine(await RedisClient.get_client())
+    return _quota_engine
@@ -0,0 +1,222 @@
+"""
+Session Status Cache
+
+The Redis hash `user:{user_id}:sessions` holds the user's session rows
+(session_id -> JSON row) so the send paths and session reads no longer
+query `sessions` on every request. It is seeded from Postgres on a miss and
+kept current by the webhook dispatcher, which applies SESSION_CONNECTED /
+SESSION_DISCONNECTED / SESSION_FAILED events, and by the session routes.
+
+The hash only exists while it holds every session of the user, so a missing
+field means "no such session". It expires after SESSION_CACHE_TTL seconds,
+which bounds drift from status changes the engine does not announce.
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+import orjson
+from redis.asyncio import Redis
+from supabase import AsyncClient
+
+from ..core.config import settings
+from ..core.redis_client import RedisClient
+
+logger = logging.getLogger(__name__)
+
+USER_SESSIONS_KEY = "user:{user_id}:sessions"
+_LOADED = "__loaded__"  # Marker field: the hash was seeded from Postgres
+
+# Engine session events -> the status the engine wrote to Postgres
+SESSION_EVENT_STATUSES = {
+    'SESSION_CONNECTED': 'connected',
+    'SESSION_DISCONNECTED': 'disconnected',
+    'SESSION_FAILED': 'failed',
+}
+
+# KEYS: user sessions hash   ARGV: ttl, then session_id/row pairs
+_SEED = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+# KEYS: user sessions hash   ARGV: session_id, row
+_PUT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+return 1
+"""
+
+# KEYS: user sessions hash   ARGV: session_id, JSON object of fields to set
+_PATCH = """
+local raw = redis.call('HGET', KEYS[1], ARGV[1])
+if not raw then
+    return 0
+end
+local row = cjson.decode(raw)
+for k, v in pairs(cjson.decode(ARGV[2])) do
+    row[k] = v
+end
+redis.call('HSET', KEYS[1], ARGV[1], cjson.encode(row))
+return 1
+"""
+
+
+def _sessions_key(user_id: str) -> str:
+    return USER_SESSIONS_KEY.format(user_id=user_id)
+
+
+def _newest_first(rows: list[dict]) -> list[dict]:
+    return sorted(rows, key=lambda row: row.get('created_at') or '', reverse=True)
+
+
+class SessionCache:
+    """
+    Read-through cache of a user's sessions.
+
+    Writes only touch users that are already cached; everyone else is loaded
+    from Postgres (which the engine updates before announcing a change) on
+    their next read. Redis errors fall back to Postgres.
+    """
+
+    def __init__(self, redis: Redis, ttl: int = settings.session_cache_ttl):
+        self.redis = redis
+        self.ttl = ttl
+        self._seed_script = redis.register_script(_SEED)
+        self._put_script = redis.register_script(_PUT)
+        self._patch_script = redis.register_script(_PATCH)
+        self.hits = 0
+        self.misses = 0
+
+    async def list_sessions(self, user_id: str, supabase: AsyncClient) -> list[dict]:
+        """All of the user's sessions, newest first"""
+        user_id = str(user_id)
+        try:
+            cached = await self.redis.hgetall(_sessions_key(user_id))
+        except Exception as e:
+            logger.warning(f"Session cache read failed for user {user_id}: {e}")
+            return await self._query(user_id, supabase)
+
+        if not cached:
+            self.misses += 1
+            return await self._load(user_id, supabase)
+
+        self.hits += 1
+        return _newest_first([
+            orjson.loads(row) for field, row in cached.items()
+            if field not in (_LOADED, _LOADED.encode())
+        ])
+
+    async def get_session(self, user_id: str, session_id: str, supabase: AsyncClient) -> Optional[dict]:
+        """The session if it belongs to the user, else None"""
+        user_id, session_id = str(user_id), str(session_id)
+        try:
+            row, loaded = await self.redis.hmget(_sessions_key(user_id), session_id, _LOADED)
+        except Exception as e:
+            logger.warning(f"Session cache read failed for user {user_id}: {e}")
+            rows = await self._query(user_id, supabase)
+        else:
+            if loaded is not None:
+                self.hits += 1
+                return orjson.loads(row) if row is not None else None
+            self.misses += 1
+            rows = await self._load(user_id, supabase)
+
+        return next((row for row in rows if str(row['id']) == session_id), None)
+
+    async def connected_session(self, user_id: str, supabase: AsyncClient) -> Optional[dict]:
+        """The user's newest connected session (the default for sends)"""
+        rows = await self.list_sessions(user_id, supabase)
+        return next((row for row in rows if row.get('status') == 'connected'), None)
+
+    async def put_session(self, user_id: str, row: dict) -> None:
+        """Store a created or updated row (best effort)"""
+        try:
+            await self._put_script(
+                keys=[_sessions_key(str(user_id))],
+                args=[str(row['id']), orjson.dumps(row)]
+            )
+        except Exception as e:
+            logger.warning(f"Session cache write failed for session {row.get('id')}: {e}")
+
+    async def patch_session(self, user_id: str, session_id: str, **fields) -> None:
+        """Update fields of a cached row (best effort)"""
+        fields.setdefault('updated_at', datetime.now(timezone.utc).isoformat())
+        try:
+            await self._patch_script(
+                keys=[_sessions_key(str(user_id))],
+                args=[str(session_id), orjson.dumps(fields)]
+            )
+        except Exception as e:
+            logger.warning(f"Session cache write failed for session {session_id}: {e}")
+
+    async def apply_event(self, user_id: str, session_id: str, event_type: str, payload: dict) -> None:
+        """Mirror the status change behind an engine session event"""
+        session_status = SESSION_EVENT_STATUSES.get(event_type)
+        if session_status is None:
+            return
+        fields = {'status': session_status}
+        if payload.get('timestamp'):
+            fields['updated_at'] = payload['timestamp']
+        if session_status == 'connected' and payload.get('phone_number'):
+            fields['phone_number'] = payload['phone_number']
+        await self.patch_session(user_id, session_id, **fields)
+
+    async def remove_session(self, user_id: str, session_id: str) -> None:
+        """Forget a deleted session (best effort)"""
+        try:
+            await self.redis.hdel(_sessions_key(str(user_id)), str(session_id))
+        except Exception as e:
+            logger.warning(f"Session cache write failed for session {session_id}: {e}")
+
+    async def forget_user(self, user_id: str) -> None:
+        """Drop the user's cached sessions after a bulk change (best effort)"""
+        try:
+            await self.redis.delete(_sessions_key(str(user_id)))
+        except Exception as e:
+            logger.warning(f"Session cache write failed for user {user_id}: {e}")
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+    async def _query(self, user_id: str, supabase: AsyncClient) -> list[dict]:
+        result = await supabase.table('sessions')\
+            .select('*')\
+            .eq('user_id', user_id)\
+            .order('created_at', desc=True)\
+            .execute()
+        return result.data or []
+
+    async def _load(self, user_id: str, supabase: AsyncClient) -> list[dict]:
+        """Read the user's sessions from Postgres and seed the hash"""
+        rows = await self._query(user_id, supabase)
+        args = [self.ttl]
+        for row in rows:
+            args += [str(row['id']), orjson.dumps(row)]
+        args += [_LOADED, 1]
+        try:
+            await self._seed_script(keys=[_sessions_key(user_id)], args=args)
+        except Exception as e:
+            logger.warning(f"Session cache seed failed for user {user_id}: {e}")
+        return rows
+
+
+_session_cache: Optional[SessionCache] = None
+_session_cache_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+async def get_session_cache() -> SessionCache:
+    """Process-wide SessionCache on the shared Redis client"""
+    global _session_cache, _session_cache_loop
+    loop = asyncio.get_running_loop()
+    if _session_cache is None or _session_cache_loop is not loop:
+        _session_cache = SessionCache(await RedisClient.get_client())
+        _session_cache_loop = loop
+    return _session_cache
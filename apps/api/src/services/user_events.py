@@ -0,0 +1,39 @@
+"""
+User Event Channels
+
+The webhook dispatcher republishes every event it processes, in webhook
+payload format, for the owning user:
+
+- on the `user:{id}:events` pub/sub channel, for live push clients
+  (the /events WebSocket) and to wake up long polls;
+- on the `user:{id}:feed` stream, trimmed by age, which the /events/feed
+  long poll reads so pull clients can catch up after downtime.
+"""
+import time
+
+from redis.asyncio import Redis
+
+from ..core.config import settings
+
+USER_EVENTS_CHANNEL = "user:{user_id}:events"
+USER_FEED_STREAM = "user:{user_id}:feed"
+
+
+def user_events_channel(user_id: str) -> str:
+    return USER_EVENTS_CHANNEL.format(user_id=user_id)
+
+
+def user_feed_stream(user_id: str) -> str:
+    return USER_FEED_STREAM.format(user_id=user_id)
+
+
+async def publish_user_event(redis: Redis, user_id: str, body: bytes) -> None:
+    """Append the event to the user's feed and notify live listeners (one round trip)"""
+    retention = settings.events_feed_retention_seconds
+    feed = user_feed_stream(user_id)
+
+    pipe = redis.pipeline(transaction=False)
+    pipe.xadd(feed, {"data": body}, minid=int((time.time() - retention) * 1000), approximate=True)
+    pipe.expire(feed, retention)  # Feeds of inactive users disappear
+    pipe.publish(user_events_channel(user_id), body)
+    await pipe.execute()
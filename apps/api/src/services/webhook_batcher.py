@@ -0,0 +1,93 @@
+"""
+Webhook Batcher
+
+Accumulates event payloads for webhooks in `batch` delivery mode and hands
+them to the dispatcher as one list once `batch_max_events` payloads are
+queued or `batch_max_wait_ms` has passed since the first one. The dispatcher
+sends the list as a single signed JSON array.
+"""
+import asyncio
+import logging
+import uuid
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_MAX_EVENTS = 100
+DEFAULT_BATCH_MAX_WAIT_MS = 1000
+
+DeliverBatch = Callable[[dict, str, list[dict]], Awaitable[None]]
+
+
+@dataclass
+class _Batch:
+    webhook: dict
+    payloads: list[dict] = field(default_factory=list)
+    waiters: list[asyncio.Future] = field(default_factory=list)
+    timer: Optional[asyncio.TimerHandle] = None
+
+
+class WebhookBatcher:
+    """Per-webhook size/linger batching of outgoing deliveries"""
+
+    def __init__(self, deliver: DeliverBatch):
+        self._deliver = deliver
+        self._batches: dict[str, _Batch] = {}  # webhook_id -> open batch
+        self._flushes: set[asyncio.Task] = set()
+
+    def add(self, webhook: dict, payload: dict) -> asyncio.Future:
+        """Queue a payload; the future resolves once its batch has been attempted"""
+        webhook_id = str(webhook['id'])
+        batch = self._batches.get(webhook_id)
+        if batch is None:
+            batch = self._batches[webhook_id] = _Batch(webhook=webhook)
+            wait_ms = webhook.get('batch_max_wait_ms') or DEFAULT_BATCH_MAX_WAIT_MS
+            batch.timer = asyncio.get_running_loop().call_later(
+                wait_ms / 1000, self._start_flush, webhook_id
+            )
+
+        waiter = asyncio.get_running_loop().create_future()
+        batch.payloads.append(payload)
+        batch.waiters.append(waiter)
+
+        if len(batch.payloads) >= (webhook.get('batch_max_events') or DEFAULT_BATCH_MAX_EVENTS):
+            self._start_flush(webhook_id)
+        return waiter
+
+    async def close(self) -> None:
+        """Send every open batch (shutdown)"""
+        for webhook_id in list(self._batches):
+            self._start_flush(webhook_id)
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "openBatches": len(self._batches),
+            "queuedEvents": sum(len(b.payloads) for b in self._batches.values()),
+        }
+
+    def _start_flush(self, webhook_id: str) -> None:
+        batch = self._batches.pop(webhook_id, None)
+        if batch is None:
+            return  # Already flushed by size
+        if batch.timer:
+            batch.timer.cancel()
+        task = asyncio.create_task(self._flush(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: _Batch) -> None:
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        try:
+            await self._deliver(batch.webhook, batch_id, batch.payloads)
+        except Exception as e:
+            logger.error(f"Batch delivery to webhook {batch.webhook['id']} failed: {e}")
+            for waiter in batch.waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            return
+        for waiter in batch.waiters:
+            if not waiter.done():
+                waiter.set_result(None)
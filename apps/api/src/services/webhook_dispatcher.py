@@ -2,7 +2,11 @@
 Webhook Dispatcher Service
 
 Consumes events from Redis stream and dispatches to user webhook URLs
-with HMAC-SHA256 signatures.
+with HMAC-SHA256 signatures. Failed deliveries are parked in a Redis sorted
+set scored by due time and retried by a scheduler task with exponential
+backoff, so they never hold up the stream consumer. A per-URL circuit
+breaker parks deliveries to a failing endpoint in a per-webhook backlog,
+which is replayed once a probe gets through.
 """
 import hmac
 import hashlib
@@ -10,36 +14,162 @@ import json
 import asyncio
 import httpx
 import logging
+import orjson
+import os
+import random
+import socket
 import time
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
+from functools import lru_cache
 from typing import Optional
-from supabase import create_client, Client
+from supabase import AsyncClient
+
+from ..core.config import settings
+from .webhook_routing import WebhookRoutingIndex, publish_webhook_routing_change
+from .circuit_breaker import CircuitBreaker, CircuitState
+from .webhook_batcher import WebhookBatcher
+from .webhook_logs import WebhookLogSink
+from .user_events import publish_user_event
+from .session_cache import SessionCache
+from .webhook_dlq import (
+    DLQ_STREAM,
+    REPLAY_LEASE_SECONDS,
+    REPLAY_QUEUE_KEY,
+    dead_letter,
+    decode_entry,
+    get_replay,
+    lease_replay,
+    recover_replays,
+    release_replay,
+    requeue_replay,
+    update_replay
+)
 
 logger = logging.getLogger(__name__)
 
+RETRY_QUEUE_KEY = "webhooks:retry"
+CONSUMER_HEARTBEAT_PREFIX = "webhooks:dispatcher:heartbeat:"
+BACKLOG_KEY_PREFIX = "webhooks:backlog:"
+BACKLOG_INDEX_KEY = "webhooks:backlog:index"  # webhook ids with parked deliveries
+REPLAY_PAGE_SIZE = 100  # DLQ entries read per XRANGE during a replay
+ROUTING_SYNC_TIMEOUT = 10.0  # seconds start() waits for the routing index
+REFRESH_CHUNK_SIZE = 1000  # entry ids per XCLAIM when refreshing in-progress entries
+
+# Atomically lease up to ARGV[2] jobs due at ARGV[1] until ARGV[3] so each is retried
+# by one worker. The job is removed after its attempt; a lease that runs out (the
+# worker died or stopped) makes it due again.
+_CLAIM_DUE_RETRIES = """
+local jobs = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, job in ipairs(jobs) do
+    redis.call('ZADD', KEYS[1], ARGV[3], job)
+end
+return jobs
+"""
+
+
+def _backlog_key(webhook_id: str) -> str:
+    return f"{BACKLOG_KEY_PREFIX}{webhook_id}"
+
 
 class WebhookDispatcher:
     """
     Service that consumes events from Redis and dispatches to webhook URLs.
     """
     
-    def __init__(self, redis, supabase_url: str, supabase_key: str):
+    def __init__(self, redis, supabase: AsyncClient):
         self.redis = redis
-        self.supabase: Client = create_client(supabase_url, supabase_key)
+        self.supabase = supabase
         self.running = False
         self.consumer_group = "webhook-dispatcher"
-        self.consumer_name = "dispatcher-1"
+        # Unique per process so replicas share the group instead of impersonating each other
+        self.consumer_name = settings.webhook_consumer_name or \
+            f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
         self.stream_key = "whatsapp:events"
         self.http_client: Optional[httpx.AsyncClient] = None
         
         # Retry configuration
-        self.max_retries = 3
-        self.retry_delays = [1, 5, 30]  # seconds
+        self.max_attempts = settings.webhook_max_attempts
+        self.retry_base_delay = settings.webhook_retry_base_delay
+        self.retry_max_delay = settings.webhook_retry_max_delay
+        self.retry_jitter = settings.webhook_retry_jitter
+        self.retry_poll_interval = settings.webhook_retry_poll_interval
+        self.retry_lease_seconds = settings.webhook_retry_lease_seconds
+        self._claim_retries = redis.register_script(_CLAIM_DUE_RETRIES)
+        self._retry_scheduler_task: Optional[asyncio.Task] = None
+        self._retry_tasks: set[asyncio.Task] = set()
+        
+        # Concurrency: events in flight, HTTP requests in flight, and per endpoint URL
+        self.max_in_flight_events = settings.webhook_max_in_flight_events
+        self.concurrency = settings.webhook_dispatch_concurrency
+        self.per_endpoint_concurrency = settings.webhook_per_endpoint_concurrency
+        self._event_slots = asyncio.Semaphore(self.max_in_flight_events)
+        self._delivery_slots = asyncio.Semaphore(self.concurrency)
+        self._endpoint_slots: dict[str, asyncio.Semaphore] = {}
+        self._endpoint_users: dict[str, int] = {}
+        self._consumer_task: Optional[asyncio.Task] = None
+        self._event_tasks: set[asyncio.Task] = set()
+        self._handling: set = set()  # ids of events being processed by this consumer
+        # session_id -> events waiting their turn; exists only while the session has work
+        self._partitions: dict[str, deque] = {}
+        # Events waiting in a partition or for their batch hold no event slot, so a
+        # busy session or a slow batch cannot starve the others; their number is
+        # capped to bound memory instead
+        self.max_queued_events = settings.webhook_max_queued_events
+        self._queued_events = 0
+        self._queue_room = asyncio.Event()
+        self._queue_room.set()
+        
+        # In-memory (session_id, event_type) -> webhooks index
+        self.routing = WebhookRoutingIndex(supabase)
+        self._routing_listener_task: Optional[asyncio.Task] = None
+        
+        # Session status changes are mirrored into the API's session cache
+        self.session_cache = SessionCache(redis)
+        
+        # Attempt records are written to webhook_logs in batches
+        self.log_sink = WebhookLogSink(supabase)
+        self._log_sink_task: Optional[asyncio.Task] = None
+        
+        # Pending-entry recovery and consumer liveness
+        self.claim_interval = settings.webhook_claim_interval
+        self.claim_min_idle_ms = settings.webhook_claim_min_idle_ms
+        self.heartbeat_interval = settings.webhook_heartbeat_interval
+        self._recovery_task: Optional[asyncio.Task] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        
+        # Circuit breakers (per URL, only while unhealthy) and parked deliveries
+        self.breaker_failure_threshold = settings.webhook_breaker_failure_threshold
+        self.breaker_open_seconds = settings.webhook_breaker_open_seconds
+        self.backlog_max = settings.webhook_backlog_max
+        self.backlog_drain_interval = settings.webhook_backlog_drain_interval
+        self.disable_after_failures = settings.webhook_disable_after_failures
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._failure_streaks: dict[str, int] = {}  # webhook_id -> consecutive failed attempts
+        self._draining: set[str] = set()
+        # Webhooks with parked deliveries; refreshed from the backlog index every drain tick
+        self._parked_webhooks: set[str] = set()
+        self._backlog_task: Optional[asyncio.Task] = None
+        
+        # Webhooks in "batch" delivery mode get several events per POST
+        self.batcher = WebhookBatcher(self._deliver_batch)
+        
+        # Customer-requested replays of dead-lettered deliveries
+        self._replay_task: Optional[asyncio.Task] = None
+        self._active_replay: Optional[str] = None
     
     async def start(self):
         """Start the webhook dispatcher"""
         self.running = True
-        self.http_client = httpx.AsyncClient(timeout=30.0)
+        self.http_client = httpx.AsyncClient(
+            timeout=30.0,
+            limits=httpx.Limits(
+                max_connections=self.concurrency,
+                max_keepalive_connections=self.concurrency
+            )
+        )
         
         # Create consumer group if not exists
         try:
@@ -54,42 +184,119 @@ class WebhookDispatcher:
             if "BUSYGROUP" not in str(e):
                 logger.warning(f"Consumer group may already exist: {e}")
         
-        logger.info("Webhook dispatcher started")
-        await self._consume_events()
+        # The listener subscribes to routing changes before loading the index
+        self._routing_listener_task = asyncio.create_task(self.routing.listen(self.redis))
+        try:
+            await asyncio.wait_for(self.routing.synced.wait(), timeout=ROUTING_SYNC_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error("Webhook routing index not loaded yet, will load on first event")
+        self._log_sink_task = asyncio.create_task(self.log_sink.start())
+        
+        logger.info(f"Webhook dispatcher started as consumer {self.consumer_name}")
+        self._retry_scheduler_task = asyncio.create_task(self._run_retry_scheduler())
+        self._heartbeat_task = asyncio.create_task(self._run_heartbeat())
+        self._recovery_task = asyncio.create_task(self._run_pending_recovery())
+        self._backlog_task = asyncio.create_task(self._run_backlog_drainer())
+        self._replay_task = asyncio.create_task(self._run_replays())
+        self._consumer_task = asyncio.create_task(self._consume_events())
+        await asyncio.gather(self._consumer_task, return_exceptions=True)
     
     async def stop(self):
         """Stop the webhook dispatcher"""
         self.running = False
+        if self._retry_scheduler_task:
+            self._retry_scheduler_task.cancel()
+        if self._routing_listener_task:
+            self._routing_listener_task.cancel()
+        if self._recovery_task:
+            self._recovery_task.cancel()
+        if self._backlog_task:
+            self._backlog_task.cancel()
+        if self._replay_task:
+            self._replay_task.cancel()
+        # Stop reading before draining, so no new event is sent through a closed client
+        if self._consumer_task:
+            self._consumer_task.cancel()
+            await asyncio.gather(self._consumer_task, return_exceptions=True)
+        await self._drain_pending()
         if self.http_client:
             await self.http_client.aclose()
+        if self._log_sink_task:
+            self._log_sink_task.cancel()
+            await self.log_sink.stop()
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            try:
+                # Leave the group cleanly if nothing is pending; otherwise peers claim it
+                await self.redis.delete(self._heartbeat_key(self.consumer_name))
+                await self._remove_consumer_if_idle(self.consumer_name)
+            except Exception as e:
+                logger.warning(f"Failed to deregister consumer {self.consumer_name}: {e}")
         logger.info("Webhook dispatcher stopped")
     
+    async def _drain_pending(self):
+        """
+        Let in-flight events, batches and retries finish and a cancelled replay
+        requeue itself, up to the shutdown timeout. Unacked events are
+        redelivered and unfinished retries come due again when their lease runs out.
+        """
+        deadline = time.monotonic() + settings.webhook_shutdown_timeout
+        while True:
+            # Events still being handled may open batches: send them right away
+            await self.batcher.close()
+            pending = {task for task in self._event_tasks | self._retry_tasks if not task.done()}
+            if self._replay_task and not self._replay_task.done():
+                pending.add(self._replay_task)
+            remaining = deadline - time.monotonic()
+            if not pending or remaining <= 0:
+                return
+            await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+    
+    def stats(self) -> dict:
+        """Consumer, concurrency and pipeline metrics for monitoring"""
+        return {
+            "consumer": self.consumer_name,
+            "running": self.running,
+            "eventsInFlight": len(self._event_tasks),
+            "maxInFlightEvents": self.max_in_flight_events,
+            "endpointsInFlight": len(self._endpoint_users),
+            "sessionPartitions": len(self._partitions),
+            "queuedEvents": self._queued_events,
+            "batcher": self.batcher.stats(),
+            "circuitBreakers": {url: breaker.stats() for url, breaker in self._breakers.items()},
+            "activeReplay": self._active_replay,
+            "routing": self.routing.stats(),
+            "logSink": self.log_sink.stats(),
+        }
+    
     async def _consume_events(self):
-        """Consume events from Redis stream"""
+        """Consume events from Redis stream, processing up to max_in_flight_events at once"""
         while self.running:
             try:
-                # Read from stream
-                messages = await self.redis.xreadgroup(
-                    self.consumer_group,
-                    self.consumer_name,
-                    {self.stream_key: '>'},
-                    count=10,
-                    block=1000
-                )
+                # Wait for room and a free slot before reading, so unread events stay in the stream
+                await self._queue_room.wait()
+                free_slots = await self._acquire_event_slots()
                 
-                if not messages:
-                    continue
+                try:
+                    # Read from stream
+                    messages = await self.redis.xreadgroup(
+                        self.consumer_group,
+                        self.consumer_name,
+                        {self.stream_key: '>'},
+                        count=free_slots,
+                        block=1000
+                    )
+                except BaseException:
+                    self._release_event_slots(free_slots)
+                    raise
                 
-                for stream_name, stream_messages in messages:
+                for stream_name, stream_messages in messages or []:
                     for msg_id, msg_data in stream_messages:
-                        await self._process_event(msg_id, msg_data)
-                        
-                        # Acknowledge message
-                        await self.redis.xack(
-                            self.stream_key,
-                            self.consumer_group,
-                            msg_id
-                        )
+                        free_slots -= 1
+                        self._spawn_event(msg_id, msg_data)
+                
+                # Return the slots this read did not use
+                self._release_event_slots(free_slots)
                         
             except asyncio.CancelledError:
                 break
@@ -97,16 +304,280 @@ class WebhookDispatcher:
                 logger.error(f"Error consuming events: {e}")
                 await asyncio.sleep(1)
     
-    async def _process_event(self, msg_id: str, msg_data: dict):
-        """Process a single event and dispatch to webhooks"""
+    async def _acquire_event_slots(self) -> int:
+        """Wait for one event slot, then take every other free one"""
+        await self._event_slots.acquire()
+        free_slots = 1
+        while free_slots < self.max_in_flight_events and not self._event_slots.locked():
+            await self._event_slots.acquire()
+            free_slots += 1
+        return free_slots
+    
+    def _release_event_slots(self, count: int):
+        for _ in range(count):
+            self._event_slots.release()
+    
+    def _spawn_event(self, msg_id, msg_data: dict):
+        """
+        Handle an event in the background; it is given one event slot.
+        
+        Events are partitioned by session: one session's events are handled
+        in stream order, so customers see message.sent before
+        message.delivered. Different sessions run in parallel. An event that
+        has to wait behind its session's earlier ones gives its slot back
+        and takes a new one when its turn comes.
+        """
+        self._handling.add(msg_id)
+        event = self._parse_event(msg_data)
+        session_id = event.get('payload', {}).get('session_id') if event else None
+        
+        if session_id is None:
+            self._track(self._handle_message(msg_id, msg_data, event))
+            return
+        
+        partition = self._partitions.get(session_id)
+        if partition is None:
+            partition = self._partitions[session_id] = deque()
+            partition.append((msg_id, msg_data, event, True))
+            self._track(self._drain_partition(session_id, partition))
+            return
+        
+        self._event_slots.release()
+        self._queue_event()
+        partition.append((msg_id, msg_data, event, False))
+    
+    async def _drain_partition(self, session_id: str, partition: deque):
+        """Handle a session's events one at a time, then drop the idle partition"""
+        try:
+            while partition:
+                msg_id, msg_data, event, has_slot = partition.popleft()
+                if not has_slot:
+                    self._dequeue_event()
+                    await self._event_slots.acquire()
+                await self._handle_message(msg_id, msg_data, event)
+        finally:
+            del self._partitions[session_id]
+    
+    def _queue_event(self):
+        self._queued_events += 1
+        if self._queued_events >= self.max_queued_events:
+            self._queue_room.clear()  # Stop reading until partitions drain
+    
+    def _dequeue_event(self):
+        self._queued_events -= 1
+        if self._queued_events < self.max_queued_events:
+            self._queue_room.set()
+    
+    def _track(self, coro):
+        task = asyncio.create_task(coro)
+        self._event_tasks.add(task)
+        task.add_done_callback(self._event_tasks.discard)
+    
+    @staticmethod
+    def _parse_event(msg_data: dict) -> Optional[dict]:
         try:
-            print(f"[DEBUG] Processing event {msg_id}")
-            # Parse event data
             raw_data = msg_data.get(b'data') or msg_data.get('data')
-            if isinstance(raw_data, bytes):
-                raw_data = raw_data.decode('utf-8')
+            event = orjson.loads(raw_data)
+            return event if isinstance(event, dict) else None
+        except (TypeError, ValueError):
+            return None  # _process_event reports it
+    
+    async def _run_pending_recovery(self):
+        """Periodically take over stale pending entries and drop dead consumers"""
+        while self.running:
+            try:
+                await asyncio.sleep(self.claim_interval)
+                await self._claim_pending()
+                await self._remove_dead_consumers()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Pending entry recovery failed: {e}")
+    
+    async def _claim_pending(self) -> int:
+        """
+        XAUTOCLAIM entries idle longer than claim_min_idle_ms (left behind by a
+        crashed or stuck consumer) and process them like fresh events.
+        
+        Live consumers refresh their in-progress entries every heartbeat, so
+        claim_min_idle_ms only has to exceed a few heartbeat intervals, not the
+        longest time an event can take.
+        """
+        claimed = 0
+        start_id = "0-0"
+        while self.running:
+            free_slots = await self._acquire_event_slots()
+            try:
+                result = await self.redis.xautoclaim(
+                    self.stream_key,
+                    self.consumer_group,
+                    self.consumer_name,
+                    min_idle_time=self.claim_min_idle_ms,
+                    start_id=start_id,
+                    count=free_slots
+                )
+            except BaseException:
+                self._release_event_slots(free_slots)
+                raise
             
-            event = json.loads(raw_data)
+            start_id, messages = result[0], result[1]
+            for msg_id, msg_data in messages:
+                if msg_data is None:
+                    # Trimmed from the stream while pending (Redis < 7 reports these)
+                    await self.redis.xack(self.stream_key, self.consumer_group, msg_id)
+                    continue
+                if msg_id in self._handling:
+                    continue  # Our own slow event, still in progress
+                free_slots -= 1
+                claimed += 1
+                self._spawn_event(msg_id, msg_data)
+            self._release_event_slots(free_slots)
+            
+            if start_id in (b"0-0", "0-0"):
+                break
+        
+        if claimed:
+            logger.warning(f"Claimed {claimed} stale pending events")
+        return claimed
+    
+    async def _run_heartbeat(self):
+        """Advertise this consumer as alive and keep its in-progress entries from being claimed"""
+        ttl = max(1, int(self.heartbeat_interval * 3))
+        while self.running:
+            try:
+                await self.redis.set(self._heartbeat_key(self.consumer_name), int(time.time()), ex=ttl)
+                await self._refresh_in_progress()
+                await asyncio.sleep(self.heartbeat_interval)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.warning(f"Consumer heartbeat failed: {e}")
+                await asyncio.sleep(self.heartbeat_interval)
+    
+    async def _refresh_in_progress(self) -> None:
+        """
+        Reset the idle time of every entry this consumer still holds (queued
+        behind its session, waiting on an endpoint, or in an open batch), so
+        peers only XAUTOCLAIM entries of consumers that stopped heartbeating.
+        """
+        ids = list(self._handling)
+        for start in range(0, len(ids), REFRESH_CHUNK_SIZE):
+            await self.redis.xclaim(
+                self.stream_key,
+                self.consumer_group,
+                self.consumer_name,
+                min_idle_time=0,
+                message_ids=ids[start:start + REFRESH_CHUNK_SIZE],
+                justid=True
+            )
+    
+    async def _remove_dead_consumers(self) -> int:
+        """
+        Delete group consumers whose heartbeat expired and that own no pending
+        entries (those are claimed first, so nothing is lost).
+        """
+        removed = 0
+        for consumer in await self.redis.xinfo_consumers(self.stream_key, self.consumer_group):
+            name = consumer['name']
+            if isinstance(name, bytes):
+                name = name.decode('utf-8')
+            if name == self.consumer_name or consumer['pending']:
+                continue
+            if await self.redis.exists(self._heartbeat_key(name)):
+                continue
+            await self.redis.xgroup_delconsumer(self.stream_key, self.consumer_group, name)
+            logger.info(f"Removed dead dispatcher consumer {name}")
+            removed += 1
+        return removed
+    
+    async def _remove_consumer_if_idle(self, name: str):
+        for consumer in await self.redis.xinfo_consumers(self.stream_key, self.consumer_group):
+            consumer_name = consumer['name']
+            if isinstance(consumer_name, bytes):
+                consumer_name = consumer_name.decode('utf-8')
+            if consumer_name == name and not consumer['pending']:
+                await self.redis.xgroup_delconsumer(self.stream_key, self.consumer_group, name)
+    
+    @staticmethod
+    def _heartbeat_key(consumer_name: str) -> str:
+        return f"{CONSUMER_HEARTBEAT_PREFIX}{consumer_name}"
+    
+    async def _handle_message(self, msg_id: str, msg_data: dict, event: Optional[dict] = None):
+        """Process one event and ACK it once every delivery has settled"""
+        try:
+            batched = await self._process_event(msg_id, msg_data, event)
+        except Exception as e:
+            logger.error(f"Error handling event {msg_id}: {e}")
+            self._handling.discard(msg_id)
+            self._event_slots.release()
+            return
+        
+        if batched:
+            # Settles when its batches are sent; the session's next event need not wait.
+            # Its slot goes back now: a batch may wait for more events than there are slots.
+            self._event_slots.release()
+            self._queue_event()
+            self._track(self._settle(msg_id, batched))
+        else:
+            await self._settle(msg_id)
+    
+    async def _settle(self, msg_id: str, batched: Optional[list] = None):
+        """
+        Acknowledge an event once its batched deliveries (if any) were attempted.
+        
+        A batched event no longer holds an event slot, only a queued-event count.
+        """
+        try:
+            if batched:
+                await asyncio.gather(*batched, return_exceptions=True)
+            
+            # Acknowledge message
+            await self.redis.xack(
+                self.stream_key,
+                self.consumer_group,
+                msg_id
+            )
+        except Exception as e:
+            logger.error(f"Error handling event {msg_id}: {e}")
+        finally:
+            self._handling.discard(msg_id)
+            if batched:
+                self._dequeue_event()
+            else:
+                self._event_slots.release()
+    
+    @asynccontextmanager
+    async def _delivery_slot(self, url: str):
+        """Hold a per-endpoint slot, then a global one, for one HTTP attempt"""
+        endpoint_slot = self._endpoint_slots.get(url)
+        if endpoint_slot is None:
+            endpoint_slot = self._endpoint_slots[url] = asyncio.Semaphore(self.per_endpoint_concurrency)
+        self._endpoint_users[url] = self._endpoint_users.get(url, 0) + 1
+        try:
+            # Endpoint first: a slow endpoint's queued deliveries must not hold global slots
+            async with endpoint_slot, self._delivery_slots:
+                yield
+        finally:
+            self._endpoint_users[url] -= 1
+            if not self._endpoint_users[url]:
+                del self._endpoint_users[url]
+                del self._endpoint_slots[url]
+    
+    async def _process_event(self, msg_id: str, msg_data: dict, event: Optional[dict] = None) -> list:
+        """
+        Process a single event and dispatch to webhooks.
+        
+        Returns futures for deliveries queued on batch-mode webhooks.
+        """
+        try:
+            print(f"[DEBUG] Processing event {msg_id}")
+            # Parse event data (unless the partitioner already did)
+            if event is None:
+                raw_data = msg_data.get(b'data') or msg_data.get('data')
+                if isinstance(raw_data, bytes):
+                    raw_data = raw_data.decode('utf-8')
+                
+                event = json.loads(raw_data)
             event_type = event.get('type', '')
             payload = event.get('payload', {})
             session_id = payload.get('session_id')
@@ -128,14 +599,44 @@ class WebhookDispatcher:
                 logger.debug("Event type missing in payload")
                 return
             
+            # Build and serialize the payload once for every consumer
+            payload = self._build_payload(webhook_event_type, event)
+            body = orjson.dumps(payload)
+            
+            user_id = await self._session_owner(session_id)
+            if user_id:
+                # User's event feed and live push (WebSocket, long polls)
+                await self._publish_to_user(user_id, body)
+                await self.session_cache.apply_event(user_id, session_id, event_type, event.get('payload', {}))
+            
             # Find matching webhooks
             webhooks = await self._find_webhooks(session_id, webhook_event_type)
             print(f"[DEBUG] Found {len(webhooks)} webhooks for {event_type}")
             
-            # Dispatch to each webhook
-            for webhook in webhooks:
-                print(f"[DEBUG] Dispatching to {webhook['url']}")
-                await self._dispatch_webhook(webhook, webhook_event_type, event)
+            if not webhooks:
+                return []
+            
+            # Batch-mode webhooks collect the payload; it is sent with the batch
+            batched = [
+                self.batcher.add(webhook, payload)
+                for webhook in webhooks
+                if webhook.get('delivery_mode') == 'batch'
+            ]
+            webhooks = [webhook for webhook in webhooks if webhook.get('delivery_mode') != 'batch']
+            
+            # Dispatch to all webhooks concurrently; the event is settled when all are
+            results = await asyncio.gather(
+                *(
+                    self._dispatch_webhook(webhook, webhook_event_type, event, payload=payload, body=body)
+                    for webhook in webhooks
+                ),
+                return_exceptions=True
+            )
+            for webhook, result in zip(webhooks, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Webhook {webhook['id']} dispatch error: {result}")
+            
+            return batched
                 
         except json.JSONDecodeError as e:
             logger.error(f"Failed to parse event: {e}")
@@ -143,68 +644,412 @@ class WebhookDispatcher:
         except Exception as e:
             logger.error(f"Error processing event {msg_id}: {e}")
             print(f"[ERROR] Error processing event {msg_id}: {e}")
+        return []
+    
+    async def _session_owner(self, session_id: str) -> Optional[str]:
+        try:
+            if not self.routing.loaded:
+                await self.routing.load()
+            return await self.routing.owner(session_id)
+        except Exception as e:
+            logger.warning(f"Failed to look up the owner of session {session_id}: {e}")
+            return None
+    
+    async def _publish_to_user(self, user_id: str, body: bytes):
+        """Append the event payload to the user's feed and channel (best effort)"""
+        try:
+            await publish_user_event(self.redis, user_id, body)
+        except Exception as e:
+            logger.warning(f"Failed to publish event to user {user_id}: {e}")
     
     async def _find_webhooks(self, session_id: str, event_type: str) -> list:
-        """Find webhooks that match the session and event type"""
+        """Find enabled webhooks that match the session and event type"""
         try:
-            # Get session to find user_id
-            session_result = self.supabase.table('sessions')\
-                .select('user_id')\
-                .eq('id', session_id)\
-                .single()\
-                .execute()
-            
-            if not session_result.data:
-                return []
-            
-            user_id = session_result.data['user_id']
-            
-            # Find enabled webhooks for this user that:
-            # 1. Have no session filter OR match this session
-            # 2. Include this event type
-            webhooks_result = self.supabase.table('webhooks')\
-                .select('*')\
-                .eq('user_id', user_id)\
-                .eq('enabled', True)\
-                .contains('events', [event_type])\
-                .execute()
-            
-            # Filter by session_id if specified
-            webhooks = []
-            for w in webhooks_result.data:
-                if w['session_id'] is None or w['session_id'] == session_id:
-                    webhooks.append(w)
-            
-            return webhooks
+            if not self.routing.loaded:
+                await self.routing.load()
+            return await self.routing.match(session_id, event_type)
             
         except Exception as e:
             logger.error(f"Error finding webhooks: {e}")
             return []
     
-    async def _dispatch_webhook(self, webhook: dict, event_type: str, event: dict):
-        """Dispatch event to a webhook URL with signature"""
+    async def _dispatch_webhook(
+        self,
+        webhook: dict,
+        event_type: str,
+        event: dict,
+        attempt: int = 1,
+        payload: dict | list | None = None,
+        body: Optional[bytes] = None,
+        parked: bool = False
+    ) -> bool:
+        """
+        Make one delivery attempt. On failure the delivery is handed to the
+        retry queue instead of being retried inline. Returns True if delivered.
+        
+        `body` is the serialized payload, shared by every webhook an event
+        fans out to; it is built here only when the caller has none.
+        
+        `parked` deliveries come from the backlog drainer, which has already
+        been let through by the breaker; a failed one goes back to the head
+        of the backlog so parked deliveries keep their order.
+        """
         webhook_id = webhook['id']
-        url = webhook['url']
-        secret = webhook['secret']
         
-        # Build payload
-        timestamp = int(datetime.now(timezone.utc).timestamp())
-        payload = {
+        # Build payload (kept identical across retries)
+        if payload is None:
+            payload = self._build_payload(event_type, event)
+        if body is None:
+            body = orjson.dumps(payload)
+        
+        # Endpoint is failing, or older deliveries are still parked: queue behind
+        # them. Only the backlog drainer probes, oldest delivery first.
+        breaker = self._breaker(webhook['url'])
+        if not parked and (breaker.state is not CircuitState.CLOSED or webhook_id in self._parked_webhooks):
+            await self._park(webhook_id, event_type, event, payload, attempt)
+            return False
+        
+        if await self._attempt_delivery(webhook, event_type, event, payload, attempt, body):
+            breaker.record_success()
+            self._breakers.pop(webhook['url'], None)  # Only unhealthy endpoints keep a breaker
+            logger.info(f"Webhook {webhook_id} delivered: {event_type}")
+            
+            # Update last_triggered_at and reset failure_count
+            webhook['failure_count'] = 0
+            self._failure_streaks.pop(webhook_id, None)
+            await self.supabase.table('webhooks')\
+                .update({
+                    'last_triggered_at': datetime.now(timezone.utc).isoformat(),
+                    'failure_count': 0
+                })\
+                .eq('id', webhook_id)\
+                .execute()
+            return True
+        
+        was_open = breaker.state is CircuitState.OPEN
+        breaker.record_failure()
+        
+        # failure_count is the streak of consecutive failed attempts. It is kept in
+        # memory and written only when the circuit opens or the webhook is disabled.
+        stored = webhook.get('failure_count') or 0
+        if stored >= self.disable_after_failures:
+            stored = 0  # Left over from before the webhook was re-enabled
+        failures = self._failure_streaks.get(webhook_id, stored) + 1
+        self._failure_streaks[webhook_id] = webhook['failure_count'] = failures
+        if failures >= self.disable_after_failures:
+            self._failure_streaks.pop(webhook_id, None)
+            await self._dead_letter([self._build_job(webhook_id, event_type, event, payload, attempt)], "webhook_disabled")
+            await self._suspend_webhook(webhook)
+            return False
+        
+        if breaker.state is CircuitState.OPEN and not was_open:
+            await self.supabase.table('webhooks')\
+                .update({'failure_count': failures})\
+                .eq('id', webhook_id)\
+                .execute()
+        
+        if attempt < self.max_attempts:
+            if parked:
+                await self._unpark(webhook_id, event_type, event, payload, attempt + 1)
+            else:
+                await self._schedule_retry(webhook_id, event_type, event, payload, attempt + 1)
+            return False
+        
+        # All attempts failed: keep the delivery so the customer can replay it
+        logger.error(f"Webhook {webhook_id} failed after {self.max_attempts} attempts, dead-lettered")
+        await self._dead_letter([self._build_job(webhook_id, event_type, event, payload, attempt)], "max_attempts")
+        return False
+    
+    @staticmethod
+    def _build_payload(event_type: str, event: dict) -> dict:
+        return {
             "id": f"evt_{event.get('id', 'unknown')}",
             "type": event_type,
             "timestamp": datetime.now(timezone.utc).isoformat(),
             "data": event.get('payload', {})
         }
+    
+    async def _deliver_batch(self, webhook: dict, batch_id: str, payloads: list[dict]):
+        """Send a batch as one signed JSON array (retried and parked as a unit)"""
+        await self._dispatch_webhook(webhook, "batch", {"id": batch_id}, payload=payloads)
+    
+    def _breaker(self, url: str) -> CircuitBreaker:
+        breaker = self._breakers.get(url)
+        if breaker is None:
+            breaker = self._breakers[url] = CircuitBreaker(
+                failure_threshold=self.breaker_failure_threshold,
+                open_seconds=self.breaker_open_seconds
+            )
+        return breaker
+    
+    async def _park(self, webhook_id: str, event_type: str, event: dict, payload: dict | list, attempt: int):
+        """Append a delivery to the webhook's backlog while its circuit is open"""
+        key = _backlog_key(webhook_id)
+        job = self._build_job(webhook_id, event_type, event, payload, attempt)
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.rpush(key, json.dumps(job))
+            pipe.ltrim(key, -self.backlog_max, -1)  # Oldest deliveries go first when full
+            pipe.sadd(BACKLOG_INDEX_KEY, webhook_id)
+            await pipe.execute()
+            self._parked_webhooks.add(webhook_id)
+        except Exception as e:
+            logger.error(f"Failed to park delivery for webhook {webhook_id}, delivery dropped: {e}")
+    
+    async def _unpark(self, webhook_id: str, event_type: str, event: dict, payload: dict | list, attempt: int):
+        """Put a delivery back at the head of the webhook's backlog"""
+        job = self._build_job(webhook_id, event_type, event, payload, attempt)
+        try:
+            await self.redis.lpush(_backlog_key(webhook_id), json.dumps(job))
+        except Exception as e:
+            logger.error(f"Failed to re-park delivery for webhook {webhook_id}, delivery dropped: {e}")
+    
+    async def _suspend_webhook(self, webhook: dict):
+        """Disable a webhook after too many consecutive failures"""
+        webhook_id = webhook['id']
+        logger.warning(
+            f"Disabling webhook {webhook_id} ({webhook['url']}) after {webhook['failure_count']} consecutive failures"
+        )
+        await self.supabase.table('webhooks')\
+            .update({'enabled': False, 'failure_count': webhook['failure_count']})\
+            .eq('id', webhook_id)\
+            .execute()
+        # Parked deliveries will never be drained now; dead-letter them for replay
+        parked = await self.redis.lrange(_backlog_key(webhook_id), 0, -1)
+        if parked:
+            await self._dead_letter([json.loads(raw_job) for raw_job in parked], "webhook_disabled")
+        await self._drop_backlog(webhook_id)
+        await publish_webhook_routing_change(self.redis, webhook_id=webhook_id)
+    
+    async def _run_backlog_drainer(self):
+        """Probe open endpoints that have parked deliveries and drain them on recovery"""
+        while self.running:
+            try:
+                await asyncio.sleep(self.backlog_drain_interval)
+                members = await self.redis.smembers(BACKLOG_INDEX_KEY)
+                # Also learns about backlogs parked by other dispatchers
+                self._parked_webhooks = {
+                    member.decode('utf-8') if isinstance(member, bytes) else member for member in members
+                }
+                for webhook_id in self._parked_webhooks:
+                    if webhook_id not in self._draining:
+                        self._draining.add(webhook_id)
+                        task = asyncio.create_task(self._drain_backlog(webhook_id))
+                        task.add_done_callback(lambda t, w=webhook_id: self._draining.discard(w))
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Backlog drainer error: {e}")
+    
+    async def _drain_backlog(self, webhook_id: str):
+        """
+        Replay a webhook's parked deliveries in order. The first one is the
+        half-open probe; draining stops as soon as the circuit is not closed.
+        
+        A delivery is only sent once the breaker lets this drainer through;
+        otherwise, or when it fails, it goes back to the head of the backlog.
+        """
+        try:
+            webhook = await self._get_webhook(webhook_id)
+            if not webhook:
+                await self._drop_backlog(webhook_id)
+                return
+            
+            breaker = self._breakers.get(webhook['url'])
+            if breaker and breaker.state is not CircuitState.CLOSED and not breaker.probe_due():
+                return
+            
+            key = _backlog_key(webhook_id)
+            while self.running:
+                raw_job = await self.redis.lpop(key)
+                if raw_job is None:
+                    await self.redis.srem(BACKLOG_INDEX_KEY, webhook_id)
+                    # A delivery parked between the LPOP and SREM re-adds itself on its next park
+                    if await self.redis.llen(key):
+                        await self.redis.sadd(BACKLOG_INDEX_KEY, webhook_id)
+                    else:
+                        self._parked_webhooks.discard(webhook_id)  # Live deliveries go out directly again
+                    return
+                
+                if not self._breaker(webhook['url']).allow():
+                    await self.redis.lpush(key, raw_job)  # Another probe is in flight
+                    return
+                
+                job = json.loads(raw_job)
+                await self._dispatch_webhook(
+                    webhook,
+                    job['event_type'],
+                    job['event'],
+                    attempt=job['attempt'],
+                    payload=job['payload'],
+                    parked=True
+                )
+                
+                breaker = self._breakers.get(webhook['url'])
+                if breaker and breaker.state is not CircuitState.CLOSED:
+                    return  # Probe failed (delivery back at the head) or circuit re-opened
+        except Exception as e:
+            logger.error(f"Failed to drain backlog of webhook {webhook_id}: {e}")
+    
+    async def _drop_backlog(self, webhook_id: str):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.delete(_backlog_key(webhook_id))
+        pipe.srem(BACKLOG_INDEX_KEY, webhook_id)
+        await pipe.execute()
+        self._parked_webhooks.discard(webhook_id)
+    
+    async def _dead_letter(self, jobs: list[dict], reason: str):
+        try:
+            await dead_letter(self.redis, jobs, reason)
+        except Exception as e:
+            logger.error(f"Failed to dead-letter {len(jobs)} deliveries, dropped: {e}")
+    
+    async def _run_replays(self):
+        """Run queued DLQ replays one at a time (each replay is taken by one dispatcher)"""
+        next_recovery = 0.0
+        while self.running:
+            try:
+                if time.monotonic() >= next_recovery:
+                    next_recovery = time.monotonic() + REPLAY_LEASE_SECONDS / 3
+                    for replay_id in await recover_replays(self.redis):
+                        logger.warning(f"Replay {replay_id} lost its dispatcher, requeued")
+                
+                item = await self.redis.blpop(REPLAY_QUEUE_KEY, timeout=1)
+                if not item:
+                    continue
+                replay_id = item[1].decode('utf-8') if isinstance(item[1], bytes) else item[1]
+                await lease_replay(self.redis, replay_id)
+                self._active_replay = replay_id
+                try:
+                    await self._replay(replay_id)
+                finally:
+                    self._active_replay = None
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Replay runner error: {e}")
+                await asyncio.sleep(1)
+    
+    async def _replay(self, replay_id: str):
+        """
+        Re-dispatch the replay's DLQ range for its webhook at `rate_per_second`.
+        Each entry gets a fresh first attempt, so failures go through the
+        normal retry/backlog path and may be dead-lettered again.
+        
+        If the dispatcher stops (or the task is cancelled) part-way, the
+        replay is requeued and resumes after the last entry it handled.
+        """
+        state = await get_replay(self.redis, replay_id)
+        if not state or state['status'] != 'pending':
+            return
+        
+        webhook_id = state['webhook_id']
+        webhook = await self._get_webhook(webhook_id)
+        if not webhook:
+            await release_replay(
+                self.redis, replay_id,
+                status='failed',
+                error='Webhook deleted or disabled',
+                finished_at=datetime.now(timezone.utc).isoformat()
+            )
+            return
+        
+        await update_replay(
+            self.redis, replay_id,
+            status='running',
+            owner=self.consumer_name,
+            started_at=state.get('started_at') or datetime.now(timezone.utc).isoformat()
+        )
+        logger.info(f"Replaying DLQ of webhook {webhook_id} ({replay_id})")
+        
+        interval = 1 / state['rate_per_second']
+        counters = {k: state[k] for k in ('scanned', 'matched', 'delivered', 'requeued')}
+        cursor = state['cursor']
+        lease_renewed_at = time.monotonic()
+        finished = False
+        try:
+            while self.running:
+                entries = await self.redis.xrange(
+                    DLQ_STREAM,
+                    min=f"({cursor}" if cursor else state['start_id'],
+                    max=state['end_id'],
+                    count=REPLAY_PAGE_SIZE
+                )
+                if not entries:
+                    finished = True
+                    break
+                
+                for entry_id, fields in entries:
+                    if not self.running:
+                        break
+                    if time.monotonic() - lease_renewed_at >= REPLAY_LEASE_SECONDS / 3:
+                        if not await lease_replay(self.redis, replay_id, owner=self.consumer_name):
+                            logger.warning(f"Replay {replay_id} was taken over by another dispatcher")
+                            return
+                        lease_renewed_at = time.monotonic()
+                    
+                    entry = decode_entry(fields)
+                    matched = entry['webhook_id'] == webhook_id
+                    if matched:
+                        delivered = await self._dispatch_webhook(
+                            webhook,
+                            entry['event_type'],
+                            entry['event'],
+                            payload=entry['payload']
+                        )
+                        counters['matched'] += 1
+                        counters['delivered' if delivered else 'requeued'] += 1
+                    counters['scanned'] += 1
+                    cursor = entry_id.decode('utf-8') if isinstance(entry_id, bytes) else entry_id
+                    if matched:
+                        await asyncio.sleep(interval)
+                
+                await update_replay(self.redis, replay_id, cursor=cursor, **counters)
+        except asyncio.CancelledError:
+            await requeue_replay(self.redis, replay_id, cursor=cursor, **counters)
+            logger.info(f"Replay {replay_id} of webhook {webhook_id} cancelled, requeued at {cursor or 'start'}")
+            raise
+        except Exception as e:
+            logger.error(f"Replay {replay_id} of webhook {webhook_id} failed: {e}")
+            await release_replay(
+                self.redis, replay_id,
+                status='failed',
+                error=str(e),
+                finished_at=datetime.now(timezone.utc).isoformat(),
+                **counters
+            )
+            return
         
-        payload_json = json.dumps(payload, separators=(',', ':'))
+        if not finished:
+            # Stopped mid-way: another dispatcher picks it up from the cursor
+            await requeue_replay(self.redis, replay_id, cursor=cursor, **counters)
+            logger.info(f"Replay {replay_id} of webhook {webhook_id} interrupted, requeued at {cursor or 'start'}")
+            return
+        
+        await release_replay(
+            self.redis, replay_id,
+            status='completed',
+            finished_at=datetime.now(timezone.utc).isoformat(),
+            **counters
+        )
+        logger.info(f"Replay {replay_id} of webhook {webhook_id} completed: {counters}")
+    
+    async def _attempt_delivery(
+        self,
+        webhook: dict,
+        event_type: str,
+        event: dict,
+        payload: dict | list,
+        attempt: int,
+        body: bytes
+    ) -> bool:
+        """POST the signed payload once and log the call. Returns True on 2xx."""
+        webhook_id = webhook['id']
+        url = webhook['url']
         
-        # Create HMAC signature
-        signature_payload = f"{timestamp}.{payload_json}"
-        signature = hmac.new(
-            secret.encode('utf-8'),
-            signature_payload.encode('utf-8'),
-            hashlib.sha256
-        ).hexdigest()
+        # Create HMAC signature over the shared body (fresh timestamp per attempt)
+        timestamp = int(time.time())
+        signature = sign_body(webhook['secret'], timestamp, body)
         
         headers = {
             "Content-Type": "application/json",
@@ -213,92 +1058,163 @@ class WebhookDispatcher:
             "User-Agent": "WhatsAppAPI-Webhook/1.0"
         }
         
-        # Dispatch with retry
-        for attempt in range(self.max_retries):
-            start_time = time.time()
-            response_status = None
-            response_body_text = None
-            error_msg = None
-            
-            try:
+        start_time = time.time()
+        response_status = None
+        
+        try:
+            async with self._delivery_slot(url):
+                start_time = time.time()
                 response = await self.http_client.post(
                     url,
-                    content=payload_json,
+                    content=body,
                     headers=headers
                 )
+            
+            response_status = response.status_code
+            response_body_text = response.text[:1000]  # Limit to 1000 chars
+            response_time_ms = int((time.time() - start_time) * 1000)
+            success = 200 <= response_status < 300
+            
+            # Log the call
+            self._log_webhook_call(
+                webhook_id=webhook_id,
+                event_id=event.get('id', 'unknown'),
+                event_type=event_type,
+                request_url=url,
+                request_headers=headers,
+                request_body=payload,
+                attempt_number=attempt,
+                response_status=response_status,
+                response_body=response_body_text,
+                response_time_ms=response_time_ms,
+                success=success
+            )
+            
+            if not success:
+                logger.warning(f"Webhook {webhook_id} returned {response_status}")
+            return success
+            
+        except Exception as e:
+            response_time_ms = int((time.time() - start_time) * 1000)
+            
+            # Log the failed attempt
+            self._log_webhook_call(
+                webhook_id=webhook_id,
+                event_id=event.get('id', 'unknown'),
+                event_type=event_type,
+                request_url=url,
+                request_headers=headers,
+                request_body=payload,
+                attempt_number=attempt,
+                response_status=response_status,
+                response_time_ms=response_time_ms,
+                success=False,
+                error_message=str(e)
+            )
+            
+            logger.error(f"Webhook {webhook_id} attempt {attempt} failed: {e}")
+            return False
+    
+    def _retry_delay(self, attempt: int) -> float:
+        """Exponential backoff with jitter before the given attempt (2, 3, ...)"""
+        delay = min(self.retry_max_delay, self.retry_base_delay * 2 ** (attempt - 2))
+        return delay * random.uniform(1 - self.retry_jitter, 1 + self.retry_jitter)
+    
+    async def _schedule_retry(
+        self,
+        webhook_id: str,
+        event_type: str,
+        event: dict,
+        payload: dict | list,
+        attempt: int
+    ):
+        """Park a failed delivery in the retry queue until it is due"""
+        delay = self._retry_delay(attempt)
+        job = self._build_job(webhook_id, event_type, event, payload, attempt)
+        try:
+            await self.redis.zadd(RETRY_QUEUE_KEY, {json.dumps(job): time.time() + delay})
+            logger.info(f"Webhook {webhook_id} attempt {attempt} scheduled in {delay:.1f}s")
+        except Exception as e:
+            logger.error(f"Failed to schedule retry for webhook {webhook_id}, delivery dropped: {e}")
+    
+    @staticmethod
+    def _build_job(webhook_id: str, event_type: str, event: dict, payload: dict | list, attempt: int) -> dict:
+        """A delivery that can be resumed later (retry queue or backlog)"""
+        return {
+            "job_id": str(uuid.uuid4()),
+            "webhook_id": webhook_id,
+            "event_type": event_type,
+            "event": event,
+            "payload": payload,
+            "attempt": attempt
+        }
+    
+    async def _run_retry_scheduler(self):
+        """Lease due retries and dispatch them alongside live events"""
+        while self.running:
+            try:
+                capacity = self.max_in_flight_events - len(self._retry_tasks)
+                jobs = []
+                if capacity > 0:
+                    now = time.time()
+                    jobs = await self._claim_retries(
+                        keys=[RETRY_QUEUE_KEY],
+                        args=[now, capacity, now + self.retry_lease_seconds]
+                    )
                 
-                response_status = response.status_code
-                response_body_text = response.text[:1000]  # Limit to 1000 chars
-                response_time_ms = int((time.time() - start_time) * 1000)
-                
-                # Log the call
-                await self._log_webhook_call(
-                    webhook_id=webhook_id,
-                    event_id=event.get('id', 'unknown'),
-                    event_type=event_type,
-                    request_url=url,
-                    request_headers=headers,
-                    request_body=payload,
-                    attempt_number=attempt + 1,
-                    response_status=response_status,
-                    response_body=response_body_text,
-                    response_time_ms=response_time_ms,
-                    success=(200 <= response_status < 300)
-                )
+                for raw_job in jobs:
+                    task = asyncio.create_task(self._run_retry(raw_job))
+                    self._retry_tasks.add(task)
+                    task.add_done_callback(self._retry_tasks.discard)
                 
-                if response.status_code >= 200 and response.status_code < 300:
-                    logger.info(f"Webhook {webhook_id} delivered: {event_type}")
-                    
-                    # Update last_triggered_at and reset failure_count
-                    self.supabase.table('webhooks')\
-                        .update({
-                            'last_triggered_at': datetime.now(timezone.utc).isoformat(),
-                            'failure_count': 0
-                        })\
-                        .eq('id', webhook_id)\
-                        .execute()
-                    
-                    return
-                else:
-                    logger.warning(f"Webhook {webhook_id} returned {response.status_code}")
+                # Keep draining while a full batch came back, otherwise wait
+                if not jobs or len(jobs) < capacity:
+                    await asyncio.sleep(self.retry_poll_interval)
                     
+            except asyncio.CancelledError:
+                break
             except Exception as e:
-                error_msg = str(e)
-                response_time_ms = int((time.time() - start_time) * 1000)
-                
-                # Log the failed attempt
-                await self._log_webhook_call(
-                    webhook_id=webhook_id,
-                    event_id=event.get('id', 'unknown'),
-                    event_type=event_type,
-                    request_url=url,
-                    request_headers=headers,
-                    request_body=payload,
-                    attempt_number=attempt + 1,
-                    response_status=response_status,
-                    response_time_ms=response_time_ms,
-                    success=False,
-                    error_message=error_msg
+                logger.error(f"Retry scheduler error: {e}")
+                await asyncio.sleep(1)
+    
+    async def _run_retry(self, raw_job):
+        """Re-dispatch one leased retry job against the webhook's current config, then release it"""
+        job = json.loads(raw_job)
+        try:
+            webhook = await self._get_webhook(job['webhook_id'])
+            if not webhook:
+                logger.info(f"Webhook {job['webhook_id']} deleted or disabled, dropping retry")
+            else:
+                # A failure schedules the next attempt as a new job
+                await self._dispatch_webhook(
+                    webhook,
+                    job['event_type'],
+                    job['event'],
+                    attempt=job['attempt'],
+                    payload=job['payload']
                 )
-                
-                logger.error(f"Webhook {webhook_id} attempt {attempt + 1} failed: {e}")
-            
-            # Wait before retry
-            if attempt < self.max_retries - 1:
-                await asyncio.sleep(self.retry_delays[attempt])
-        
-        # All retries failed
-        logger.error(f"Webhook {webhook_id} failed after {self.max_retries} attempts")
-        
-        # Increment failure count
-        self.supabase.table('webhooks')\
-            .update({
-                'failure_count': webhook['failure_count'] + 1
-            })\
+        except Exception as e:
+            logger.error(f"Retry of webhook {job.get('webhook_id')} failed: {e}")
+        
+        try:
+            await self.redis.zrem(RETRY_QUEUE_KEY, raw_job)
+        except Exception as e:
+            logger.warning(f"Failed to release retry of webhook {job.get('webhook_id')}, it may run again: {e}")
+    
+    async def _get_webhook(self, webhook_id: str) -> Optional[dict]:
+        """Current config of an enabled webhook"""
+        if self.routing.loaded:
+            return self.routing.get(webhook_id)
+        
+        result = await self.supabase.table('webhooks')\
+            .select('*')\
             .eq('id', webhook_id)\
+            .eq('enabled', True)\
+            .limit(1)\
             .execute()
+        return result.data[0] if result.data else None
     
-    async def _log_webhook_call(
+    def _log_webhook_call(
         self,
         webhook_id: str,
         event_id: str,
@@ -313,28 +1229,44 @@ class WebhookDispatcher:
         success: bool = False,
         error_message: Optional[str] = None
     ):
-        """Save webhook call to database for logging/debugging"""
-        try:
-            self.supabase.table('webhook_logs').insert({
-                'webhook_id': webhook_id,
-                'event_id': event_id,
-                'event_type': event_type,
-                'request_url': request_url,
-                'request_headers': request_headers,
-                'request_body': request_body,
-                'response_status': response_status,
-                'response_body': response_body,
-                'response_time_ms': response_time_ms,
-                'attempt_number': attempt_number,
-                'success': success,
-                'error_message': error_message,
-                'created_at': datetime.now(timezone.utc).isoformat()
-            }).execute()
-        except Exception as e:
-            logger.error(f"Failed to log webhook call: {e}")
+        """Queue webhook call for the logs table (written in batches by the log sink)"""
+        self.log_sink.record({
+            'webhook_id': webhook_id,
+            'event_id': event_id,
+            'event_type': event_type,
+            'request_url': request_url,
+            'request_headers': request_headers,
+            'request_body': request_body,
+            'response_status': response_status,
+            'response_body': response_body,
+            'response_time_ms': response_time_ms,
+            'attempt_number': attempt_number,
+            'success': success,
+            'error_message': error_message,
+            'created_at': datetime.now(timezone.utc).isoformat()
+        })
 
 
 
+@lru_cache(maxsize=4096)
+def _keyed_hmac(secret: str) -> hmac.HMAC:
+    """HMAC-SHA256 state with the key already absorbed, cloned per signature"""
+    return hmac.new(secret.encode('utf-8'), digestmod=hashlib.sha256)
+
+
+def sign_body(secret: str, timestamp: int, body: bytes) -> str:
+    """
+    Signature sent in X-Webhook-Signature: HMAC-SHA256 of "{timestamp}.{body}".
+    
+    Same result as compute_signature(), without re-keying the HMAC or
+    copying the body into a new string for every endpoint.
+    """
+    mac = _keyed_hmac(secret).copy()
+    mac.update(b"%d." % timestamp)
+    mac.update(body)
+    return mac.hexdigest()
+
+
 def compute_signature(secret: str, timestamp: int, payload: str) -> str:
     """
     Compute HMAC-SHA256 signature for webhook verification.
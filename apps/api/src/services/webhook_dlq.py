@@ -0,0 +1,163 @@
+"""
+Webhook Dead-Letter Queue
+
+Deliveries that exhausted their attempts (or were parked when their webhook
+was auto-disabled) are appended to the `whatsapp:events:dlq` stream with
+their webhook id. Customers replay a time range of it through the normal
+delivery pipeline: the API records a replay job in Redis, and a dispatcher
+picks it up, sends matching entries at the requested rate and keeps the
+job's progress counters up to date.
+
+A dispatcher holds a lease on the replay it runs (`webhooks:replay:running`,
+scored by lease expiry) and renews it while it works. A replay that is
+stopped part-way goes back to the queue and resumes from its cursor; one
+whose lease runs out (its dispatcher died) is requeued by another dispatcher.
+"""
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+from redis.asyncio import Redis
+
+from ..core.config import settings
+
+DLQ_STREAM = "whatsapp:events:dlq"
+REPLAY_KEY_PREFIX = "webhooks:replay:"
+REPLAY_QUEUE_KEY = "webhooks:replay:queue"
+REPLAY_RUNNING_KEY = "webhooks:replay:running"  # replay_id -> lease expiry
+REPLAY_TTL = 7 * 24 * 3600  # seconds a finished replay stays queryable
+REPLAY_LEASE_SECONDS = 60.0  # renewed every third of this while the replay runs
+
+_REPLAY_COUNTERS = ("rate_per_second", "scanned", "matched", "delivered", "requeued")
+
+
+def _replay_key(replay_id: str) -> str:
+    return f"{REPLAY_KEY_PREFIX}{replay_id}"
+
+
+def _decode(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+async def dead_letter(redis: Redis, jobs: list[dict], reason: str) -> None:
+    """Append failed deliveries (retry/backlog job dicts) to the DLQ stream"""
+    failed_at = datetime.now(timezone.utc).isoformat()
+    pipe = redis.pipeline(transaction=False)
+    for job in jobs:
+        pipe.xadd(
+            DLQ_STREAM,
+            {
+                "webhook_id": str(job['webhook_id']),
+                "event_type": job['event_type'],
+                "event": json.dumps(job['event']),
+                "payload": json.dumps(job['payload']),
+                "attempts": job['attempt'],
+                "reason": reason,
+                "failed_at": failed_at,
+            },
+            maxlen=settings.webhook_dlq_max_len,
+            approximate=True
+        )
+    await pipe.execute()
+
+
+def decode_entry(fields: dict) -> dict:
+    """DLQ stream fields -> delivery arguments"""
+    fields = {_decode(k): _decode(v) for k, v in fields.items()}
+    return {
+        "webhook_id": fields['webhook_id'],
+        "event_type": fields['event_type'],
+        "event": json.loads(fields['event']),
+        "payload": json.loads(fields['payload']),
+    }
+
+
+async def create_replay(
+    redis: Redis,
+    webhook_id: str,
+    start: datetime,
+    end: datetime,
+    rate_per_second: int
+) -> dict:
+    """Record a replay job and queue it for the dispatchers"""
+    replay_id = uuid.uuid4().hex
+    # Entries dead-lettered again during the replay must not be picked up by it
+    end_ms = min(int(end.timestamp() * 1000), int(time.time() * 1000))
+    state = {
+        "replay_id": replay_id,
+        "webhook_id": webhook_id,
+        "status": "pending",
+        "start_id": f"{int(start.timestamp() * 1000)}-0",
+        "end_id": str(end_ms),
+        "cursor": "",
+        "rate_per_second": rate_per_second,
+        "scanned": 0,
+        "matched": 0,
+        "delivered": 0,
+        "requeued": 0,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    pipe = redis.pipeline(transaction=True)
+    pipe.hset(_replay_key(replay_id), mapping=state)
+    pipe.expire(_replay_key(replay_id), REPLAY_TTL)
+    pipe.rpush(REPLAY_QUEUE_KEY, replay_id)
+    await pipe.execute()
+    return state
+
+
+async def get_replay(redis: Redis, replay_id: str) -> Optional[dict]:
+    data = await redis.hgetall(_replay_key(replay_id))
+    if not data:
+        return None
+    state = {_decode(k): _decode(v) for k, v in data.items()}
+    for counter in _REPLAY_COUNTERS:
+        state[counter] = int(state.get(counter) or 0)
+    return state
+
+
+async def update_replay(redis: Redis, replay_id: str, **fields) -> None:
+    await redis.hset(_replay_key(replay_id), mapping=fields)
+
+
+async def lease_replay(redis: Redis, replay_id: str, owner: Optional[str] = None) -> bool:
+    """
+    Take or extend the lease on a replay. With `owner`, the lease is only
+    extended while the replay still belongs to it; returns False otherwise.
+    """
+    if owner is not None and _decode(await redis.hget(_replay_key(replay_id), "owner")) != owner:
+        return False
+    await redis.zadd(REPLAY_RUNNING_KEY, {replay_id: time.time() + REPLAY_LEASE_SECONDS})
+    return True
+
+
+async def release_replay(redis: Redis, replay_id: str, **fields) -> None:
+    """Record a replay's final state and drop its lease"""
+    pipe = redis.pipeline(transaction=True)
+    pipe.hset(_replay_key(replay_id), mapping=fields)
+    pipe.zrem(REPLAY_RUNNING_KEY, replay_id)
+    await pipe.execute()
+
+
+async def requeue_replay(redis: Redis, replay_id: str, **fields) -> None:
+    """Put an unfinished replay back in the queue; it resumes from its cursor"""
+    pipe = redis.pipeline(transaction=True)
+    pipe.hset(_replay_key(replay_id), mapping={**fields, "status": "pending"})
+    pipe.zrem(REPLAY_RUNNING_KEY, replay_id)
+    pipe.rpush(REPLAY_QUEUE_KEY, replay_id)
+    await pipe.execute()
+
+
+async def recover_replays(redis: Redis) -> list[str]:
+    """Requeue replays whose dispatcher stopped renewing their lease"""
+    recovered = []
+    for member in await redis.zrangebyscore(REPLAY_RUNNING_KEY, "-inf", time.time()):
+        replay_id = _decode(member)
+        if not await redis.zrem(REPLAY_RUNNING_KEY, replay_id):
+            continue  # Another dispatcher got there first
+        status = _decode(await redis.hget(_replay_key(replay_id), "status"))
+        if status in ("pending", "running"):
+            await requeue_replay(redis, replay_id)
+            recovered.append(replay_id)
+    return recovered
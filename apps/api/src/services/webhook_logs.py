@@ -0,0 +1,139 @@
+"""
+Webhook Log Sink
+
+Delivery attempts are buffered in memory and written to `webhook_logs` with
+bulk inserts, once a batch fills up or the flush interval elapses, instead of
+one INSERT per attempt in the delivery path. When the buffer backs up,
+successful attempts are sampled. Failures are always kept because those are
+the rows users debug with.
+"""
+import asyncio
+import logging
+import random
+from collections import deque
+
+from supabase import AsyncClient
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookLogSink:
+    """
+    Buffered, batching writer for webhook_logs rows.
+
+    Above `sample_threshold` (a fraction of `max_buffer`) only a
+    `success_sample_rate` share of successful attempts is kept. A full buffer
+    drops successes outright. Failures then evict the oldest buffered success,
+    and are only dropped when the buffer holds nothing but failures.
+    """
+
+    def __init__(
+        self,
+        supabase: AsyncClient,
+        batch_size: int = settings.webhook_log_batch_size,
+        interval: float = settings.webhook_log_flush_interval,
+        max_buffer: int = settings.webhook_log_max_buffer,
+        sample_threshold: float = settings.webhook_log_sample_threshold,
+        success_sample_rate: float = settings.webhook_log_success_sample_rate
+    ):
+        self.supabase = supabase
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_buffer = max_buffer
+        self.sample_threshold = sample_threshold
+        self.success_sample_rate = success_sample_rate
+        self.running = False
+
+        self._buffer: deque[dict] = deque()
+        self._batch_ready = asyncio.Event()
+
+        # Counters
+        self.written = 0
+        self.sampled_out = 0      # successes skipped by sampling
+        self.dropped = 0          # rows lost to a full buffer or a failed write
+        self.write_errors = 0
+
+    def record(self, row: dict) -> None:
+        """Queue one attempt record (never blocks the delivery path)"""
+        depth = len(self._buffer)
+
+        if row.get('success'):
+            if depth >= self.max_buffer:
+                self.dropped += 1
+                return
+            if depth >= self.max_buffer * self.sample_threshold and random.random() >= self.success_sample_rate:
+                self.sampled_out += 1
+                return
+        elif depth >= self.max_buffer and not self._evict_success():
+            self.dropped += 1
+            return
+
+        self._buffer.append(row)
+        if len(self._buffer) >= self.batch_size:
+            self._batch_ready.set()
+
+    async def start(self):
+        """Flush by size or interval until stopped"""
+        self.running = True
+        logger.info(f"Webhook log sink started (batch {self.batch_size}, every {self.interval}s)")
+
+        while self.running:
+            try:
+                try:
+                    await asyncio.wait_for(self._batch_ready.wait(), timeout=self.interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._batch_ready.clear()
+                while await self.flush_once() >= self.batch_size:
+                    pass  # Backlog larger than one batch: keep draining
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Webhook log flush failed: {e}")
+
+    async def stop(self):
+        """Stop the loop and write what is left"""
+        self.running = False
+        try:
+            while await self.flush_once():
+                pass
+        except Exception as e:
+            logger.error(f"Final webhook log flush failed: {e}")
+        logger.info(f"Webhook log sink stopped ({self.dropped} dropped, {self.sampled_out} sampled out)")
+
+    async def flush_once(self) -> int:
+        """Insert one batch. Returns the number of rows taken from the buffer."""
+        batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+        if not batch:
+            return 0
+
+        try:
+            await self.supabase.table('webhook_logs').insert(batch).execute()
+            self.written += len(batch)
+        except Exception as e:
+            self.write_errors += 1
+            self.dropped += len(batch)
+            logger.error(f"Failed to write {len(batch)} webhook log rows: {e}")
+        return len(batch)
+
+    def stats(self) -> dict:
+        """Queue depth and counters for monitoring"""
+        return {
+            "queueDepth": len(self._buffer),
+            "maxBuffer": self.max_buffer,
+            "written": self.written,
+            "sampledOut": self.sampled_out,
+            "dropped": self.dropped,
+            "writeErrors": self.write_errors,
+        }
+
+    def _evict_success(self) -> bool:
+        """Make room for a failure by dropping the oldest buffered success"""
+        for i, row in enumerate(self._buffer):
+            if row.get('success'):
+                del self._buffer[i]
+                self.dropped += 1
+                return True
+        return False
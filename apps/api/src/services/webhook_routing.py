@@ -0,0 +1,236 @@
+"""
+Webhook Routing Index
+
+In-memory map from (session_id, event_type) to the enabled webhooks that
+should receive the event, so the dispatcher routes events without querying
+Supabase. The index is bulk-loaded at startup. The webhook and session CRUD
+routes publish the ids they changed on a Redis Pub/Sub channel, and every
+dispatcher re-reads just those rows. Secrets never travel over Pub/Sub.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Callable, Optional
+
+import orjson
+from redis.asyncio import Redis
+from supabase import AsyncClient
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_ROUTING_CHANNEL = "webhooks:routing"
+
+UNKNOWN_SESSION_TTL = 30.0  # seconds a session id not found in the database is remembered
+
+_LOAD_PAGE_SIZE = 1000
+_UNKNOWN_SESSIONS_MAX = 10000
+
+
+class WebhookRoutingIndex:
+    """
+    Enabled webhooks and session owners of every user, held in memory.
+
+    Route lookups are memoized per (session_id, event_type) and the memo is
+    dropped on any change, which is rare next to the event rate.
+    """
+
+    def __init__(self, supabase: AsyncClient):
+        self.supabase = supabase
+        self._webhooks: dict[str, dict] = {}                           # webhook_id -> row (incl. secret)
+        self._user_webhooks: dict[str, set[str]] = defaultdict(set)    # user_id -> webhook ids
+        self._session_owners: dict[str, str] = {}                      # session_id -> user_id
+        self._routes: dict[tuple[str, str], list[dict]] = {}
+        self._unknown_sessions: dict[str, float] = {}                  # session_id -> monotonic expiry
+        self.loaded = False
+        self.synced = asyncio.Event()  # Set once listen() has subscribed and attempted a load
+        self.misses = 0
+
+    async def load(self) -> None:
+        """Bulk-load every session owner and enabled webhook"""
+        sessions = await self._fetch_all(
+            lambda: self.supabase.table('sessions').select('id, user_id').order('id')
+        )
+        webhooks = await self._fetch_all(
+            lambda: self.supabase.table('webhooks').select('*').eq('enabled', True).order('id')
+        )
+
+        self._webhooks.clear()
+        self._user_webhooks.clear()
+        self._session_owners = {str(s['id']): str(s['user_id']) for s in sessions}
+        self._unknown_sessions.clear()
+        for webhook in webhooks:
+            self._put_webhook(webhook)
+        self._routes.clear()
+        self.loaded = True
+
+        logger.info(f"Webhook routing index loaded: {len(self._webhooks)} webhooks, {len(self._session_owners)} sessions")
+
+    async def match(self, session_id: str, event_type: str) -> list[dict]:
+        """Webhooks subscribed to this event on this session"""
+        key = (session_id, event_type)
+        routes = self._routes.get(key)
+        if routes is not None:
+            return routes
+
+        user_id = await self.owner(session_id)
+        if user_id is None:
+            return []
+
+        routes = [
+            webhook for webhook in (self._webhooks[w] for w in self._user_webhooks.get(user_id, ()))
+            if event_type in (webhook.get('events') or [])
+            and (webhook.get('session_id') is None or str(webhook['session_id']) == session_id)
+        ]
+        self._routes[key] = routes
+        return routes
+
+    async def owner(self, session_id: str) -> Optional[str]:
+        """User id owning a session"""
+        user_id = self._session_owners.get(session_id)
+        if user_id is None:
+            expires_at = self._unknown_sessions.get(session_id)
+            if expires_at is not None and expires_at > time.monotonic():
+                return None  # Looked up recently and not found
+            # Session created after the last load and its notification not seen yet
+            user_id = await self._load_session(session_id)
+        return user_id
+
+    def get(self, webhook_id: str) -> Optional[dict]:
+        """Cached config of an enabled webhook"""
+        return self._webhooks.get(webhook_id)
+
+    async def apply_change(self, message: dict) -> None:
+        """Re-read the webhook or session named in a change notification"""
+        if message.get('webhook_id'):
+            await self.refresh_webhook(str(message['webhook_id']))
+        if message.get('session_id'):
+            await self.refresh_session(str(message['session_id']))
+
+    async def refresh_webhook(self, webhook_id: str) -> None:
+        result = await self.supabase.table('webhooks')\
+            .select('*')\
+            .eq('id', webhook_id)\
+            .limit(1)\
+            .execute()
+
+        self._drop_webhook(webhook_id)
+        if result.data and result.data[0].get('enabled'):
+            self._put_webhook(result.data[0])
+        self._routes.clear()
+
+    async def refresh_session(self, session_id: str) -> None:
+        if await self._load_session(session_id) is None:
+            # Deleted: its session-scoped webhooks went with it (ON DELETE CASCADE)
+            for webhook_id in [w for w, hook in self._webhooks.items() if str(hook.get('session_id')) == session_id]:
+                self._drop_webhook(webhook_id)
+        self._routes.clear()
+
+    async def listen(self, redis: Redis) -> None:
+        """
+        Load the index, then apply change notifications until cancelled.
+
+        The index is (re)loaded only once the channel is subscribed, so a change
+        published during the load is applied after it rather than missed.
+        `synced` is set after the first load attempt.
+        """
+        while True:
+            pubsub = redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(WEBHOOK_ROUTING_CHANNEL)
+                logger.info(f"Listening for webhook routing changes on {WEBHOOK_ROUTING_CHANNEL}")
+
+                # Changes may have been missed before subscribing (or while disconnected)
+                try:
+                    await self.load()
+                except Exception as load_error:
+                    logger.error(f"Failed to load webhook routing index, will retry on first event: {load_error}")
+                self.synced.set()
+
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        await self.apply_change(orjson.loads(message["data"]))
+                    except orjson.JSONDecodeError:
+                        logger.warning(f"Invalid webhook routing message: {message}")
+                    except Exception as e:
+                        logger.error(f"Failed to apply webhook routing change {message}: {e}")
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Webhook routing listener error: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "webhooks": len(self._webhooks),
+            "sessions": len(self._session_owners),
+            "unknownSessions": len(self._unknown_sessions),
+            "routes": len(self._routes),
+            "misses": self.misses,
+        }
+
+    async def _load_session(self, session_id: str) -> Optional[str]:
+        self.misses += 1
+        result = await self.supabase.table('sessions')\
+            .select('id, user_id')\
+            .eq('id', session_id)\
+            .limit(1)\
+            .execute()
+
+        if not result.data:
+            self._session_owners.pop(session_id, None)
+            # Events for deleted or unknown sessions must not query on every event
+            if len(self._unknown_sessions) >= _UNKNOWN_SESSIONS_MAX:
+                self._unknown_sessions.clear()
+            self._unknown_sessions[session_id] = time.monotonic() + UNKNOWN_SESSION_TTL
+            return None
+
+        user_id = str(result.data[0]['user_id'])
+        self._session_owners[session_id] = user_id
+        self._unknown_sessions.pop(session_id, None)
+        return user_id
+
+    def _put_webhook(self, webhook: dict) -> None:
+        webhook_id = str(webhook['id'])
+        self._webhooks[webhook_id] = webhook
+        self._user_webhooks[str(webhook['user_id'])].add(webhook_id)
+
+    def _drop_webhook(self, webhook_id: str) -> None:
+        webhook = self._webhooks.pop(webhook_id, None)
+        if webhook:
+            self._user_webhooks[str(webhook['user_id'])].discard(webhook_id)
+
+    @staticmethod
+    async def _fetch_all(build_query: Callable) -> list[dict]:
+        """Page through a PostgREST query (builders are single use, so take a factory)"""
+        rows: list[dict] = []
+        start = 0
+        while True:
+            result = await build_query().range(start, start + _LOAD_PAGE_SIZE - 1).execute()
+            rows.extend(result.data)
+            if len(result.data) < _LOAD_PAGE_SIZE:
+                return rows
+            start += _LOAD_PAGE_SIZE
+
+
+async def publish_webhook_routing_change(
+    redis: Redis,
+    webhook_id: Optional[str] = None,
+    session_id: Optional[str] = None
+) -> None:
+    """
+    Tell every dispatcher to re-read a webhook or session.
+
+    Best effort: a dispatcher that misses the message reloads the whole index
+    when its listener reconnects.
+    """
+    message = {"webhook_id": webhook_id, "session_id": session_id}
+    try:
+        await redis.publish(WEBHOOK_ROUTING_CHANNEL, orjson.dumps(message).decode())
+    except Exception as e:
+        logger.warning(f"Failed to publish webhook routing change {message}: {e}")
@@ -2,15 +2,38 @@
 Pytest configuration and fixtures.
 """
 import pytest
-from unittest.mock import Mock, MagicMock
+from unittest.mock import AsyncMock, Mock, MagicMock
 from fastapi.testclient import TestClient
 from src.main import app
 from src.core.supabase import get_supabase_client, get_supabase_service_client
+from src.core.auth_cache import api_key_cache, jwt_session_cache, profile_cache
+
+@pytest.fixture(autouse=True)
+def clear_auth_cache():
+    """Keep cached credentials from leaking between tests."""
+    api_key_cache.clear()
+    profile_cache.clear()
+    jwt_session_cache.clear()
+    yield
+    api_key_cache.clear()
+    profile_cache.clear()
+    jwt_session_cache.clear()
+
+class AsyncSupabaseMock(MagicMock):
+    """MagicMock of the async Supabase client: query `.execute()` and auth calls are awaitable."""
+    _async_methods = {
+        "execute", "get_user", "sign_up", "sign_in_with_password", "reset_password_email"
+    }
+
+    def _get_child_mock(self, **kwargs):
+        if kwargs.get("name") in self._async_methods:
+            return AsyncMock(**kwargs)
+        return AsyncSupabaseMock(**kwargs)
 
 @pytest.fixture
 def mock_supabase():
     """Mock Supabase client."""
-    mock = MagicMock()
+    mock = AsyncSupabaseMock()
     return mock
 
 @pytest.fixture
@@ -0,0 +1,71 @@
+"""
+Tests for write-behind API key usage counters.
+"""
+from unittest.mock import AsyncMock, MagicMock, Mock
+
+import pytest
+
+from src.services.api_key_usage import (
+    ApiKeyUsageFlusher,
+    USAGE_DIRTY_SET,
+    record_api_key_usage,
+)
+
+
+def _redis_with_pipeline(results=None):
+    redis = AsyncMock()
+    pipe = MagicMock()
+    pipe.execute = AsyncMock(return_value=results or [])
+    redis.pipeline = Mock(return_value=pipe)
+    return redis, pipe
+
+
+@pytest.mark.asyncio
+async def test_record_api_key_usage_is_one_pipeline():
+    """Counter bump, timestamp and dirty marker go out in a single round trip"""
+    redis, pipe = _redis_with_pipeline()
+
+    await record_api_key_usage(redis, "key-1")
+
+    pipe.hincrby.assert_called_once_with("api_keys:usage:key-1", "count", 1)
+    assert pipe.hset.call_args[0][:2] == ("api_keys:usage:key-1", "last_used_at")
+    pipe.sadd.assert_called_once_with(USAGE_DIRTY_SET, "key-1")
+    pipe.execute.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_flush_once_sends_aggregated_deltas():
+    """Dirty keys are drained and written with one RPC call"""
+    redis, pipe = _redis_with_pipeline([
+        {"count": "3", "last_used_at": "2024-01-01T00:00:00+00:00"}, 1,
+        {}, 0,
+    ])
+    redis.spop.return_value = ["key-1", "key-2"]
+    supabase = MagicMock()
+    supabase.rpc.return_value.execute = AsyncMock()
+
+    flusher = ApiKeyUsageFlusher(redis, supabase, interval=1, batch_size=100)
+    taken = await flusher.flush_once()
+
+    assert taken == 2
+    supabase.rpc.assert_called_once_with("increment_api_key_usage", {"updates": [
+        {"id": "key-1", "count": 3, "last_used_at": "2024-01-01T00:00:00+00:00"}
+    ]})
+
+
+@pytest.mark.asyncio
+async def test_flush_once_restores_deltas_on_failure():
+    """A failed write puts the counts back for the next flush"""
+    redis, pipe = _redis_with_pipeline([
+        {"count": "2", "last_used_at": "2024-01-01T00:00:00+00:00"}, 1,
+    ])
+    redis.spop.return_value = ["key-1"]
+    supabase = MagicMock()
+    supabase.rpc.return_value.execute = AsyncMock(side_effect=Exception("database unavailable"))
+
+    flusher = ApiKeyUsageFlusher(redis, supabase, interval=1, batch_size=100)
+    with pytest.raises(Exception):
+        await flusher.flush_once()
+
+    pipe.hincrby.assert_called_once_with("api_keys:usage:key-1", "count", 2)
+    pipe.sadd.assert_called_once_with(USAGE_DIRTY_SET, "key-1")
@@ -1,5 +1,5 @@
 import pytest
-from unittest.mock import Mock, ANY
+from unittest.mock import AsyncMock, Mock, ANY
 from src.core.security import generate_api_key, hash_api_key, verify_api_key_format
 
 def test_generate_api_key():
@@ -97,9 +97,9 @@ def test_authenticate_with_api_key(client, mock_supabase, mock_profile_data):
     
     # Mock chain: table('api_keys').select(...).eq(...).is_(...).single().execute()
     mock_select = Mock()
-    mock_select.select.return_value.eq.return_value.is_.return_value.single.return_value.execute.return_value = Mock(
+    mock_select.select.return_value.eq.return_value.is_.return_value.single.return_value.execute = AsyncMock(return_value=Mock(
         data=mock_key_data
-    )
+    ))
     
     # We need to ensure we return this mock when table('api_keys') is called on the service client
     # Since mock_supabase is both normal and service client, we just config the table return
@@ -118,9 +118,9 @@ def test_authenticate_with_invalid_api_key(client, mock_supabase):
     
     # Mock lookup returning None
     mock_select = Mock()
-    mock_select.select.return_value.eq.return_value.is_.return_value.single.return_value.execute.return_value = Mock(
+    mock_select.select.return_value.eq.return_value.is_.return_value.single.return_value.execute = AsyncMock(return_value=Mock(
         data=None
-    )
+    ))
     mock_supabase.table.return_value = mock_select
     
     response = client.get("/api/v1/auth/profile",
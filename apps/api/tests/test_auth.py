@@ -1,7 +1,12 @@
 """
 Tests for authentication endpoints.
 """
-from unittest.mock import Mock
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, Mock
+
+from jose import jwt
+
+from src.core.config import settings
 
 def test_register_success(client, mock_supabase, mock_profile_data):
     """Test successful user registration."""
@@ -14,11 +19,11 @@ def test_register_success(client, mock_supabase, mock_profile_data):
     # Mock profile fetch and update
     # We need to mock both .select() and .update() chains
     mock_select = Mock()
-    mock_select.eq.return_value.single.return_value.execute.return_value = Mock(data=mock_profile_data)
+    mock_select.eq.return_value.single.return_value.execute = AsyncMock(return_value=Mock(data=mock_profile_data))
     mock_supabase.table.return_value.select.return_value = mock_select
     
     mock_update = Mock()
-    mock_update.eq.return_value.execute.return_value = Mock(data=[mock_profile_data])
+    mock_update.eq.return_value.execute = AsyncMock(return_value=Mock(data=[mock_profile_data]))
     mock_supabase.table.return_value.update.return_value = mock_update
     
     response = client.post("/api/v1/auth/register", json={
@@ -115,3 +120,76 @@ def test_update_profile_success(client, mock_supabase, auth_headers, mock_profil
     
     assert response.status_code == 200
     assert response.json()["displayName"] == "Updated Name"
+
+def _supabase_jwt(sub="123e4567-e89b-12d3-a456-426614174000", audience="authenticated", expires_in=3600, session_id=None):
+    """Build an access token signed like Supabase does."""
+    claims = {
+        "sub": sub,
+        "aud": audience,
+        "role": "authenticated",
+        "exp": datetime.now(timezone.utc) + timedelta(seconds=expires_in),
+    }
+    if session_id:
+        claims["session_id"] = session_id
+    return jwt.encode(claims, settings.jwt_secret, algorithm=settings.jwt_algorithm)
+
+def test_local_jwt_skips_supabase_auth(client, mock_supabase, mock_profile_data, monkeypatch):
+    """Local mode verifies the token in-process and caches the profile."""
+    monkeypatch.setattr(settings, "jwt_verification_mode", "local")
+    
+    mock_supabase.table.return_value.select.return_value.eq.return_value.single.return_value.execute.return_value = Mock(
+        data=mock_profile_data
+    )
+    headers = {"Authorization": f"Bearer {_supabase_jwt()}"}
+    
+    for _ in range(2):
+        response = client.get("/api/v1/auth/profile", headers=headers)
+        assert response.status_code == 200
+        assert response.json()["email"] == "test@example.com"
+    
+    mock_supabase.auth.get_user.assert_not_called()
+    assert mock_supabase.table.return_value.select.call_count == 1
+
+def test_local_jwt_rejects_expired_and_wrong_audience(client, mock_supabase, monkeypatch):
+    """Expired tokens and tokens for another audience are rejected locally."""
+    monkeypatch.setattr(settings, "jwt_verification_mode", "local")
+    
+    for token in (_supabase_jwt(expires_in=-60), _supabase_jwt(audience="anon-service")):
+        response = client.get("/api/v1/auth/profile", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 401
+    
+    mock_supabase.table.assert_not_called()
+
+def test_hybrid_jwt_confirms_session_on_cache_miss(client, mock_supabase, mock_profile_data, monkeypatch):
+    """Hybrid mode asks Supabase Auth once, then serves the cached profile."""
+    monkeypatch.setattr(settings, "jwt_verification_mode", "hybrid")
+    
+    mock_supabase.auth.get_user.return_value = Mock(user=Mock(id=mock_profile_data["id"]))
+    mock_supabase.table.return_value.select.return_value.eq.return_value.single.return_value.execute.return_value = Mock(
+        data=mock_profile_data
+    )
+    headers = {"Authorization": f"Bearer {_supabase_jwt()}"}
+    
+    for _ in range(2):
+        assert client.get("/api/v1/auth/profile", headers=headers).status_code == 200
+    
+    assert mock_supabase.auth.get_user.call_count == 1
+
+def test_hybrid_jwt_confirmation_is_per_session(client, mock_supabase, mock_profile_data, monkeypatch):
+    """An active session of the same user does not keep a revoked one valid."""
+    monkeypatch.setattr(settings, "jwt_verification_mode", "hybrid")
+    
+    mock_supabase.table.return_value.select.return_value.eq.return_value.single.return_value.execute.return_value = Mock(
+        data=mock_profile_data
+    )
+    active = {"Authorization": f"Bearer {_supabase_jwt(session_id='session-a')}"}
+    revoked = {"Authorization": f"Bearer {_supabase_jwt(session_id='session-b')}"}
+    
+    mock_supabase.auth.get_user.return_value = Mock(user=Mock(id=mock_profile_data["id"]))
+    assert client.get("/api/v1/auth/profile", headers=active).status_code == 200
+    
+    mock_supabase.auth.get_user.return_value = Mock(user=None)
+    assert client.get("/api/v1/auth/profile", headers=revoked).status_code == 401
+    assert client.get("/api/v1/auth/profile", headers=active).status_code == 200
+    
+    assert mock_supabase.auth.get_user.call_count == 2
@@ -0,0 +1,93 @@
+"""
+Tests for the in-process authentication caches.
+"""
+import json
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+
+from src.core.auth_cache import (
+    ApiKeyCache,
+    TTLCache,
+    api_key_cache,
+    publish_auth_invalidation,
+    AUTH_INVALIDATION_CHANNEL,
+)
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    """Oldest untouched entry is evicted when the cache is full"""
+    cache = TTLCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" becomes most recently used
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_ttl_cache_expires_entries():
+    """Entries are treated as misses once their TTL has elapsed"""
+    cache = TTLCache(max_size=10, ttl=30)
+    with patch("src.core.auth_cache.time.monotonic", return_value=100.0):
+        cache.set("a", 1)
+    with patch("src.core.auth_cache.time.monotonic", return_value=129.0):
+        assert cache.get("a") == 1
+    with patch("src.core.auth_cache.time.monotonic", return_value=131.0):
+        assert cache.get("a") is None
+
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_api_key_cache_invalidate_by_key_and_user():
+    """Invalidation removes rows by key id or by owning user"""
+    cache = ApiKeyCache(max_size=10, ttl=60)
+    cache.set("h1", {"id": "k1", "user_id": "u1"})
+    cache.set("h2", {"id": "k2", "user_id": "u1"})
+    cache.set("h3", {"id": "k3", "user_id": "u2"})
+
+    assert cache.invalidate(key_id="k3") == 1
+    assert cache.invalidate(user_id="u1") == 2
+    assert cache.stats()["size"] == 0
+
+
+@pytest.mark.asyncio
+async def test_publish_auth_invalidation_clears_locally_and_publishes():
+    """Revocation is applied locally and fanned out on the invalidation channel"""
+    api_key_cache.set("h1", {"id": "k1", "user_id": "u1"})
+    redis = AsyncMock()
+
+    await publish_auth_invalidation(redis, key_id="k1")
+
+    assert api_key_cache.get("h1") is None
+    channel, data = redis.publish.call_args[0]
+    assert channel == AUTH_INVALIDATION_CHANNEL
+    assert json.loads(data) == {"key_id": "k1", "user_id": None}
+
+
+def test_api_key_lookup_is_cached(client, mock_supabase, mock_profile_data):
+    """Second request with the same key does not hit the api_keys lookup"""
+    api_key = "sk_live_" + "2" * 32
+    mock_select = Mock()
+    mock_select.select.return_value.eq.return_value.is_.return_value.single.return_value.execute = AsyncMock(return_value=Mock(
+        data={
+            "id": "key-uuid",
+            "user_id": "user-uuid",
+            "expires_at": None,
+            "request_count": 0,
+            "profiles": mock_profile_data
+        }
+    ))
+    mock_supabase.table.side_effect = lambda table_name: mock_select if table_name == 'api_keys' else Mock()
+
+    with patch("src.core.auth.RedisClient.get_client", new=AsyncMock()), \
+            patch("src.core.auth.record_api_key_usage", new=AsyncMock()) as record_usage:
+        for _ in range(2):
+            response = client.get("/api/v1/auth/profile", headers={"Authorization": f"Bearer {api_key}"})
+            assert response.status_code == 200
+
+    assert mock_select.select.call_count == 1
+    assert record_usage.await_count == 2
@@ -0,0 +1,50 @@
+"""
+Tests for the per-endpoint circuit breaker.
+"""
+from src.services.circuit_breaker import CircuitBreaker, CircuitState
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, open_seconds=60)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state is CircuitState.OPEN
+    assert not breaker.allow()
+
+
+def test_success_resets_the_streak():
+    breaker = CircuitBreaker(failure_threshold=2, open_seconds=60)
+
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert breaker.state is CircuitState.CLOSED
+
+
+def test_half_open_admits_a_single_probe():
+    breaker = CircuitBreaker(failure_threshold=1, open_seconds=0)
+    breaker.record_failure()
+
+    assert breaker.allow()
+    assert breaker.state is CircuitState.HALF_OPEN
+    assert not breaker.allow()
+
+
+def test_failed_probe_reopens_and_successful_probe_closes():
+    breaker = CircuitBreaker(failure_threshold=5, open_seconds=0)
+    for _ in range(5):
+        breaker.record_failure()
+
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state is CircuitState.OPEN
+
+    breaker.allow()
+    breaker.record_success()
+    assert breaker.state is CircuitState.CLOSED
+    assert breaker.failures == 0
@@ -0,0 +1,70 @@
+"""
+Tests for the standalone dispatcher supervisor.
+"""
+import time
+from unittest.mock import Mock
+
+from src.dispatcher import DispatcherSupervisor, RESTART_BACKOFF_MAX, STABLE_AFTER, STALE_AFTER
+
+
+def _supervisor(alive=(True, True), reported=(0, 0)):
+    supervisor = DispatcherSupervisor(workers=len(alive), metrics_port=0)
+    now = time.time()
+    for index, (is_alive, ago) in enumerate(zip(alive, reported)):
+        supervisor.processes[index] = Mock(pid=1000 + index, is_alive=Mock(return_value=is_alive))
+        if ago is not None:
+            supervisor.reports[index] = (now - ago, {"consumer": f"c{index}"})
+    return supervisor
+
+
+def test_healthy_when_all_workers_report():
+    healthy, body = _supervisor().health()
+
+    assert healthy
+    assert [w["pid"] for w in body["workers"]] == [1000, 1001]
+
+
+def test_unhealthy_when_a_worker_is_dead_or_silent():
+    assert not _supervisor(alive=(True, False)).health()[0]
+    assert not _supervisor(reported=(0, STALE_AFTER + 1)).health()[0]
+    assert not _supervisor(reported=(0, None)).health()[0]
+
+
+def test_unhealthy_while_draining():
+    supervisor = _supervisor()
+    supervisor.stopping.set()
+
+    assert not supervisor.health()[0]
+
+
+def test_metrics_aggregate_worker_stats():
+    metrics = _supervisor().metrics()
+
+    assert metrics["dispatchers"] == {0: {"consumer": "c0"}, 1: {"consumer": "c1"}}
+
+
+def test_crashing_worker_is_restarted_with_backoff():
+    supervisor = _supervisor(alive=(False,), reported=(None,))
+    now = 0.0
+    supervisor._spawn = Mock(side_effect=lambda index: supervisor.started_at.__setitem__(index, now))
+    restarted_at = []
+
+    while now < 200:
+        supervisor._restart_exited(now)
+        if supervisor._spawn.call_count > len(restarted_at):
+            restarted_at.append(now)
+        now += 1
+
+    gaps = [b - a for a, b in zip(restarted_at, restarted_at[1:])]
+    assert restarted_at[:4] == [1, 4, 9, 18]  # 1s, 2s, 4s, 8s after each crash, plus a tick
+    assert max(gaps) == RESTART_BACKOFF_MAX + 1
+
+
+def test_backoff_resets_after_a_stable_run():
+    supervisor = _supervisor(alive=(False,), reported=(None,))
+    supervisor.restart_delays[0] = RESTART_BACKOFF_MAX
+    supervisor.started_at[0] = 0.0
+
+    supervisor._restart_exited(STABLE_AFTER)
+
+    assert supervisor.restart_at[0] == STABLE_AFTER + 1
@@ -0,0 +1,71 @@
+"""
+Tests for the long-poll event feed.
+"""
+import json
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+
+from src.main import app
+from src.core.auth import get_current_user
+
+
+def _entry(entry_id, event_id):
+    return (entry_id, {"data": json.dumps({"id": event_id, "type": "message.received"})})
+
+
+@pytest.fixture
+def feed_client(client):
+    app.dependency_overrides[get_current_user] = lambda: {"id": "u1"}
+    yield client
+    app.dependency_overrides.pop(get_current_user, None)
+
+
+def _get_feed(client, redis, multiplexer=None, **params):
+    with patch("src.api.v1.events.RedisClient.get_client", new=AsyncMock(return_value=redis)), \
+            patch("src.api.v1.events.get_pubsub_multiplexer", new=AsyncMock(return_value=multiplexer)):
+        return client.get("/api/v1/events/feed", params=params)
+
+
+def test_feed_returns_available_events_without_waiting(feed_client):
+    redis = Mock(xread=AsyncMock(return_value=[["user:u1:feed", [_entry("5-0", "evt_a"), _entry("6-0", "evt_b")]]]))
+
+    response = _get_feed(feed_client, redis, cursor="4-0", limit=2)
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "events": [{"id": "evt_a", "type": "message.received"}, {"id": "evt_b", "type": "message.received"}],
+        "nextCursor": "6-0",
+        "hasMore": True,
+    }
+    assert redis.xread.call_args.args == ({"user:u1:feed": "4-0"},)
+
+
+def test_feed_waits_for_the_next_event(feed_client):
+    redis = Mock(xread=AsyncMock(side_effect=[[], [], [["user:u1:feed", [_entry("7-0", "evt_c")]]]]))
+    subscription = Mock(get=AsyncMock(return_value="wake"), close=AsyncMock())
+    multiplexer = Mock(subscribe=AsyncMock(return_value=subscription))
+
+    response = _get_feed(feed_client, redis, multiplexer, cursor="6-0", wait=5)
+
+    assert response.json()["events"] == [{"id": "evt_c", "type": "message.received"}]
+    assert response.json()["nextCursor"] == "7-0"
+    assert multiplexer.subscribe.call_args.args == ("user:u1:events", "u1")
+    subscription.get.assert_awaited_once_with(timeout=5)
+    subscription.close.assert_awaited_once()
+
+
+def test_feed_times_out_with_unchanged_cursor(feed_client):
+    redis = Mock(xread=AsyncMock(return_value=[]))
+    subscription = Mock(get=AsyncMock(return_value=None), close=AsyncMock())
+    multiplexer = Mock(subscribe=AsyncMock(return_value=subscription))
+
+    response = _get_feed(feed_client, redis, multiplexer, cursor="6-0", wait=1)
+
+    assert response.json() == {"events": [], "nextCursor": "6-0", "hasMore": False}
+
+
+def test_feed_rejects_invalid_cursor(feed_client):
+    response = _get_feed(feed_client, Mock(), cursor="abc")
+
+    assert response.status_code == 400
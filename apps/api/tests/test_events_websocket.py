@@ -0,0 +1,78 @@
+"""
+Tests for the events WebSocket.
+"""
+import asyncio
+import json
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from src.main import app
+from src.api.v1.events import events_websocket
+from src.core.auth import get_websocket_user
+
+
+def _event(event_type, session_id):
+    return json.dumps({"id": "evt_1", "type": event_type, "data": {"session_id": session_id}})
+
+
+def _subscription(messages):
+    pending = list(messages)
+
+    async def get(timeout=None):
+        if pending:
+            return pending.pop(0)
+        await asyncio.Event().wait()
+
+    return Mock(get=get, close=AsyncMock(), overflowed=False)
+
+
+@pytest.fixture
+def ws_client(client):
+    app.dependency_overrides[get_websocket_user] = lambda: {"id": "u1"}
+    yield client
+    app.dependency_overrides.pop(get_websocket_user, None)
+
+
+def test_websocket_filters_by_session_and_event_type(ws_client):
+    subscription = _subscription([
+        _event("message.received", "s2"),
+        _event("message.sent", "s1"),
+        _event("message.received", "s1"),
+    ])
+    multiplexer = Mock(subscribe=AsyncMock(return_value=subscription))
+
+    with patch("src.api.v1.events.get_pubsub_multiplexer", new=AsyncMock(return_value=multiplexer)):
+        with ws_client.websocket_connect("/api/v1/events/ws?sessionId=s1&events=message.received") as ws:
+            assert json.loads(ws.receive_text())["data"]["session_id"] == "s1"
+
+    assert multiplexer.subscribe.call_args.args == ("user:u1:events", "u1")
+    assert multiplexer.subscribe.call_args.kwargs["drop_oldest"] is False
+    subscription.close.assert_awaited()
+
+
+def test_slow_consumer_is_disconnected(ws_client):
+    subscription = _subscription([_event("message.received", "s1")])
+    subscription.overflowed = True
+    multiplexer = Mock(subscribe=AsyncMock(return_value=subscription))
+
+    with patch("src.api.v1.events.get_pubsub_multiplexer", new=AsyncMock(return_value=multiplexer)):
+        with ws_client.websocket_connect("/api/v1/events/ws") as ws:
+            with pytest.raises(WebSocketDisconnect) as disconnect:
+                ws.receive_text()
+
+    assert disconnect.value.code == 4008
+    subscription.close.assert_awaited()
+
+
+@pytest.mark.asyncio
+async def test_subscription_is_released_if_accept_fails():
+    subscription = _subscription([])
+    multiplexer = Mock(subscribe=AsyncMock(return_value=subscription))
+    websocket = Mock(accept=AsyncMock(side_effect=RuntimeError("client went away")))
+
+    with patch("src.api.v1.events.get_pubsub_multiplexer", new=AsyncMock(return_value=multiplexer)):
+        await events_websocket(websocket, session_id=None, events=None, current_user={"id": "u1"})
+
+    subscription.close.assert_awaited_once()
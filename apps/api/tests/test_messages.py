@@ -0,0 +1,118 @@
+"""
+Tests for message endpoints.
+"""
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
+
+import pytest
+
+from src.core.stream_producer import StreamProducer
+from src.services.quota import QuotaResult
+
+
+@pytest.fixture
+def batch_tables(mock_supabase, mock_profile_data):
+    """Per-table mocks for an authenticated user with a connected session"""
+    mock_supabase.auth.get_user.return_value = Mock(user=Mock(id=mock_profile_data["id"]))
+    tables = {name: type(mock_supabase)() for name in ("profiles", "messages")}
+    tables["profiles"].select.return_value.eq.return_value.single.return_value.execute.return_value = Mock(
+        data=mock_profile_data
+    )
+    tables["messages"].insert.return_value.execute.side_effect = lambda: Mock(data=[
+        {**row, "id": f"00000000-0000-0000-0000-00000000000{i}"}
+        for i, row in enumerate(tables["messages"].insert.call_args[0][0])
+    ])
+    mock_supabase.table.side_effect = lambda name: tables[name]
+    session = {"id": "550e8400-e29b-41d4-a716-446655440000", "status": "connected"}
+    session_cache = Mock(get_session=AsyncMock(return_value=session), connected_session=AsyncMock(return_value=session))
+    with patch("src.api.v1.messages.get_session_cache", new=AsyncMock(return_value=session_cache)):
+        yield tables
+
+
+def test_send_batch_renders_templates_and_pipelines(client, auth_headers, batch_tables):
+    """One quota reservation, one insert and one pipeline for the whole batch"""
+    quota_engine = Mock(check_and_increment=AsyncMock(return_value=QuotaResult(used=2, limit=100)))
+    redis = MagicMock()
+    pipe = MagicMock()
+    pipe.execute = AsyncMock(return_value=["1-0", "1-1"])
+    redis.pipeline.return_value = pipe
+
+    with patch("src.api.v1.messages.get_quota_engine", new=AsyncMock(return_value=quota_engine)), \
+            patch("src.api.v1.messages.get_stream_producer", new=AsyncMock(return_value=StreamProducer(redis))):
+        response = client.post("/api/v1/messages/batch", headers=auth_headers, json={
+            "sessionId": "550e8400-e29b-41d4-a716-446655440000",
+            "message": "Hi {{name}}, your code is {{ code }}",
+            "recipients": [
+                {"to": "+15550000001", "variables": {"name": "Ada", "code": "123"}},
+                {"to": "+15550000002", "variables": {"name": "Bob", "code": "456"}}
+            ]
+        })
+
+    assert response.status_code == 202
+    data = response.json()
+    assert data["total"] == 2
+    assert [m["toPhone"] for m in data["messages"]] == ["+15550000001", "+15550000002"]
+    assert quota_engine.check_and_increment.call_args.kwargs["amount"] == 2
+
+    rows = batch_tables["messages"].insert.call_args[0][0]
+    assert rows[0]["content"] == {"message": "Hi Ada, your code is 123"}
+    assert rows[1]["batch_id"] == data["batchId"]
+    assert pipe.xadd.call_count == 2
+    pipe.execute.assert_awaited_once()
+
+
+def test_send_batch_pairs_texts_with_returned_rows(client, auth_headers, batch_tables):
+    """Each command takes its text from its own row, whatever order the rows come back in"""
+    insert = batch_tables["messages"].insert
+    insert.return_value.execute.side_effect = lambda: Mock(data=[
+        {**row, "id": f"00000000-0000-0000-0000-00000000000{i}"}
+        for i, row in reversed(list(enumerate(insert.call_args[0][0])))
+    ])
+    quota_engine = Mock(check_and_increment=AsyncMock(return_value=QuotaResult(used=2, limit=100)))
+    producer = Mock(publish_many=AsyncMock(return_value=["1-0", "1-1"]))
+
+    with patch("src.api.v1.messages.get_quota_engine", new=AsyncMock(return_value=quota_engine)), \
+            patch("src.api.v1.messages.get_stream_producer", new=AsyncMock(return_value=producer)):
+        response = client.post("/api/v1/messages/batch", headers=auth_headers, json={
+            "message": "Hi {{name}}",
+            "recipients": [
+                {"to": "+15550000001", "variables": {"name": "Ada"}},
+                {"to": "+15550000002", "variables": {"name": "Bob"}}
+            ]
+        })
+
+    assert response.status_code == 202
+    commands = producer.publish_many.await_args.args[0]
+    assert [(payload["to"], payload["message"]) for _, payload in commands] == [
+        ("+15550000002", "Hi Bob"), ("+15550000001", "Hi Ada")
+    ]
+
+
+def test_send_batch_refunds_unqueued_messages(client, auth_headers, batch_tables, mock_profile_data):
+    """Quota reserved for commands that could not be published is given back"""
+    quota_engine = Mock(
+        check_and_increment=AsyncMock(return_value=QuotaResult(used=2, limit=100)),
+        refund=AsyncMock()
+    )
+    producer = Mock(publish_many=AsyncMock(return_value=["1-0", None]))
+
+    with patch("src.api.v1.messages.get_quota_engine", new=AsyncMock(return_value=quota_engine)), \
+            patch("src.api.v1.messages.get_stream_producer", new=AsyncMock(return_value=producer)):
+        response = client.post("/api/v1/messages/batch", headers=auth_headers, json={
+            "message": "Hi",
+            "recipients": [{"to": "+15550000001"}, {"to": "+15550000002"}]
+        })
+
+    assert response.status_code == 202
+    assert [m["status"] for m in response.json()["messages"]] == ["pending", "failed"]
+    quota_engine.refund.assert_awaited_once_with(mock_profile_data["id"], 1)
+
+
+def test_send_batch_rejects_missing_variable(client, auth_headers, batch_tables):
+    """A recipient without a placeholder value rejects the batch before any write"""
+    response = client.post("/api/v1/messages/batch", headers=auth_headers, json={
+        "message": "Hi {{name}}",
+        "recipients": [{"to": "+15550000001", "variables": {}}]
+    })
+
+    assert response.status_code == 422
+    batch_tables["messages"].insert.assert_not_called()
@@ -0,0 +1,114 @@
+"""
+Tests for the shared pub/sub multiplexer.
+"""
+import asyncio
+
+import pytest
+
+from src.core.pubsub_multiplexer import PubSubMultiplexer, StreamLimitExceeded
+
+
+class FakePubSub:
+    """In-memory stand-in for one redis.asyncio PubSub connection"""
+
+    def __init__(self):
+        self.channels = set()
+        self.subscribe_calls = []
+        self.unsubscribe_calls = []
+        self.messages = asyncio.Queue()
+
+    @property
+    def subscribed(self):
+        return bool(self.channels)
+
+    async def subscribe(self, *channels):
+        self.subscribe_calls.extend(channels)
+        self.channels.update(channels)
+
+    async def unsubscribe(self, *channels):
+        self.unsubscribe_calls.extend(channels)
+        self.channels.difference_update(channels)
+        self.messages.put_nowait({"type": "unsubscribe", "channel": channels[0], "data": 0})
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=None):
+        message = await self.messages.get()
+        if ignore_subscribe_messages and message["type"] != "message":
+            return None
+        return message
+
+    async def aclose(self):
+        pass
+
+    def publish(self, channel, data):
+        if channel in self.channels:
+            self.messages.put_nowait({"type": "message", "channel": channel, "data": data})
+
+
+class FakeRedis:
+    def __init__(self):
+        self.connections = []
+
+    def pubsub(self):
+        self.connections.append(FakePubSub())
+        return self.connections[-1]
+
+
+@pytest.mark.asyncio
+async def test_clients_share_one_connection_and_subscription():
+    redis = FakeRedis()
+    multiplexer = PubSubMultiplexer(redis, max_streams_per_user=10)
+    pubsub = redis.connections[0]
+
+    first = await multiplexer.subscribe("session:a:events", "u1")
+    second = await multiplexer.subscribe("session:a:events", "u2")
+    other = await multiplexer.subscribe("session:b:events", "u1")
+
+    pubsub.publish("session:a:events", "qr-1")
+
+    assert await first.get(timeout=1) == "qr-1"
+    assert await second.get(timeout=1) == "qr-1"
+    assert await other.get(timeout=0.05) is None
+    assert len(redis.connections) == 1
+    assert pubsub.subscribe_calls == ["session:a:events", "session:b:events"]
+
+    await first.close()
+    assert pubsub.unsubscribe_calls == []
+    await second.close()
+    await other.close()
+    assert pubsub.unsubscribe_calls == ["session:a:events", "session:b:events"]
+    assert multiplexer.stats()["subscribers"] == 0
+
+    await multiplexer.close()
+
+
+@pytest.mark.asyncio
+async def test_per_user_stream_limit():
+    multiplexer = PubSubMultiplexer(FakeRedis(), max_streams_per_user=2)
+
+    first = await multiplexer.subscribe("session:a:events", "u1")
+    await multiplexer.subscribe("session:b:events", "u1")
+    with pytest.raises(StreamLimitExceeded):
+        await multiplexer.subscribe("session:c:events", "u1")
+    await multiplexer.subscribe("session:c:events", "u2")  # Other users are unaffected
+
+    await first.close()
+    await first.close()  # Idempotent
+    await multiplexer.subscribe("session:c:events", "u1")
+
+    await multiplexer.close()
+
+
+@pytest.mark.asyncio
+async def test_slow_client_drops_oldest_messages():
+    redis = FakeRedis()
+    multiplexer = PubSubMultiplexer(redis, max_streams_per_user=10, queue_size=2)
+    subscription = await multiplexer.subscribe("session:a:events", "u1")
+
+    for i in range(4):
+        redis.connections[0].publish("session:a:events", f"m{i}")
+    await asyncio.sleep(0.01)
+
+    assert [await subscription.get(timeout=1) for _ in range(2)] == ["m2", "m3"]
+    assert subscription.dropped == 2
+
+    await multiplexer.close()
@@ -0,0 +1,133 @@
+"""
+Tests for the Redis-backed message quota engine.
+"""
+from unittest.mock import AsyncMock, MagicMock, Mock
+
+import pytest
+from fastapi import HTTPException
+
+from src.services.quota import (
+    QUOTA_INFLIGHT_KEY,
+    QUOTA_PENDING_KEY,
+    QuotaEngine,
+    QuotaReconciler,
+)
+
+
+def _engine(check_results):
+    """QuotaEngine whose Lua scripts are mocks"""
+    redis = MagicMock()
+    check_script = AsyncMock(side_effect=check_results)
+    seed_script = AsyncMock(return_value=1)
+    redis.register_script.side_effect = [check_script, seed_script, AsyncMock()]
+    return QuotaEngine(redis, cache_ttl=300), check_script, seed_script
+
+
+def _supabase(subscription):
+    supabase = MagicMock()
+    supabase.table.return_value.select.return_value.eq.return_value.limit.return_value.execute = AsyncMock(
+        return_value=Mock(data=[subscription] if subscription else [])
+    )
+    supabase.table.return_value.update.return_value.eq.return_value.execute = AsyncMock()
+    return supabase
+
+
+@pytest.mark.asyncio
+async def test_cache_miss_seeds_from_subscription():
+    """A missing counter is loaded from subscriptions, then checked again"""
+    engine, check_script, seed_script = _engine([[-1, 0, 0, 0], [0, 11, 100, 0]])
+    supabase = _supabase({"messages_used": 10, "message_limit": 100, "current_period_end": None})
+
+    result = await engine.check_and_increment("user-1", supabase)
+
+    assert result.used == 11
+    assert check_script.await_count == 2
+    seed_args = seed_script.call_args.kwargs["args"]
+    assert seed_args[:3] == [10, 100, 0]
+
+
+@pytest.mark.asyncio
+async def test_no_subscription_is_payment_required():
+    """Users without a subscription row are rejected"""
+    engine, _, seed_script = _engine([[-1, 0, 0, 0]])
+
+    with pytest.raises(HTTPException) as exc:
+        await engine.check_and_increment("user-1", _supabase(None))
+
+    assert exc.value.status_code == 402
+    seed_script.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_exceeded_quota_is_forbidden():
+    """The script's exceeded result maps to 403"""
+    engine, _, _ = _engine([[-3, 100, 100, 0]])
+
+    with pytest.raises(HTTPException) as exc:
+        await engine.check_and_increment("user-1", _supabase(None), amount=1)
+
+    assert exc.value.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_crossed_thresholds_are_recorded():
+    """Alert bits from the script are persisted as quota_alert_sent_* flags"""
+    engine, _, _ = _engine([[0, 100, 100, 3]])
+    supabase = _supabase(None)
+
+    result = await engine.check_and_increment("user-1", supabase)
+
+    assert result.alerts == [80, 100]
+    supabase.table.return_value.update.assert_called_once_with({
+        "quota_alert_sent_80": True,
+        "quota_alert_sent_100": True
+    })
+
+
+@pytest.mark.asyncio
+async def test_reconciler_writes_pending_deltas():
+    """Pending deltas are moved aside, written in one RPC and then dropped"""
+    redis = AsyncMock()
+    redis.set.return_value = True
+    redis.exists.side_effect = [0, 1]  # no in-flight batch, pending exists
+    redis.hgetall.return_value = {"user-1": "4", "user-2": "0"}
+    supabase = MagicMock()
+    supabase.rpc.return_value.execute = AsyncMock()
+
+    updated = await QuotaReconciler(redis, supabase, interval=1).flush_once()
+
+    assert updated == 1
+    redis.rename.assert_awaited_once_with(QUOTA_PENDING_KEY, QUOTA_INFLIGHT_KEY)
+    supabase.rpc.assert_called_once_with("increment_messages_used", {"updates": [
+        {"user_id": "user-1", "count": 4}
+    ]})
+    redis.delete.assert_any_await(QUOTA_INFLIGHT_KEY)
+
+
+@pytest.mark.asyncio
+async def test_reconciler_keeps_batch_on_failure():
+    """A failed write leaves the in-flight batch for the next run"""
+    redis = AsyncMock()
+    redis.set.return_value = True
+    redis.exists.return_value = 1  # previous batch still in flight
+    redis.hgetall.return_value = {"user-1": "4"}
+    supabase = MagicMock()
+    supabase.rpc.return_value.execute = AsyncMock(side_effect=Exception("database unavailable"))
+
+    with pytest.raises(Exception):
+        await QuotaReconciler(redis, supabase, interval=1).flush_once()
+
+    redis.rename.assert_not_awaited()
+    assert all(call.args[0] != QUOTA_INFLIGHT_KEY for call in redis.delete.await_args_list)
+
+
+@pytest.mark.asyncio
+async def test_refund_returns_reserved_messages():
+    """Refunds decrement the live counter and the delta reconciled to Postgres"""
+    engine, _, _ = _engine([])
+    refund_script = engine._refund_script
+
+    await engine.refund("user-1", 3)
+    await engine.refund("user-1", 0)
+
+    refund_script.assert_awaited_once_with(keys=["quota:user-1", QUOTA_PENDING_KEY], args=[3, "user-1"])
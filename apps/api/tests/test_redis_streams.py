@@ -1,7 +1,8 @@
+import asyncio
 import pytest
 import json
-from unittest.mock import AsyncMock, patch
-from src.core.stream_producer import StreamProducer
+from unittest.mock import AsyncMock, MagicMock, patch
+from src.core.stream_producer import BufferedStreamProducer, StreamProducer
 from src.models.commands import CommandType
 
 @pytest.mark.asyncio
@@ -56,3 +57,75 @@ async def test_publish_command_failure_logs_to_error_stream():
     error_call = mock_redis.xadd.call_args
     stream_name = error_call[0][0]
     assert stream_name == "whatsapp:errors"
+
+@pytest.mark.asyncio
+async def test_publish_many_pipelines_and_returns_ids_in_order():
+    """publish_many sends every XADD in one pipeline and keeps input order"""
+    mock_redis = MagicMock()
+    pipe = MagicMock()
+    pipe.execute = AsyncMock(return_value=["1-0", "1-1"])
+    mock_redis.pipeline.return_value = pipe
+    
+    producer = StreamProducer(mock_redis)
+    ids = await producer.publish_many([
+        ("SEND_TEXT", {"to": "1"}),
+        ("SEND_TEXT", {"to": "2"})
+    ])
+    
+    assert ids == ["1-0", "1-1"]
+    pipe.execute.assert_awaited_once()
+    payloads = [json.loads(call[0][1]["data"])["payload"] for call in pipe.xadd.call_args_list]
+    assert payloads == [{"to": "1"}, {"to": "2"}]
+
+@pytest.mark.asyncio
+async def test_publish_many_reports_failed_items():
+    """A failed XADD yields None and an error entry, the rest still succeed"""
+    mock_redis = MagicMock()
+    command_pipe = MagicMock()
+    command_pipe.execute = AsyncMock(return_value=["1-0", Exception("OOM")])
+    error_pipe = MagicMock()
+    error_pipe.execute = AsyncMock(return_value=["2-0"])
+    mock_redis.pipeline.side_effect = [command_pipe, error_pipe]
+    
+    producer = StreamProducer(mock_redis)
+    ids = await producer.publish_many([
+        ("SEND_TEXT", {"to": "1"}),
+        ("SEND_TEXT", {"to": "2"})
+    ])
+    
+    assert ids == ["1-0", None]
+    stream_name, data = error_pipe.xadd.call_args[0]
+    assert stream_name == "whatsapp:errors"
+    assert json.loads(data["data"])["context"] == {"to": "2"}
+
+@pytest.mark.asyncio
+async def test_buffered_producer_coalesces_concurrent_commands():
+    """Concurrent publish_command calls share one pipeline and get their own ids"""
+    mock_redis = MagicMock()
+    pipe = MagicMock()
+    pipe.execute = AsyncMock(return_value=["1-0", "1-1", "1-2"])
+    mock_redis.pipeline.return_value = pipe
+    
+    producer = BufferedStreamProducer(mock_redis, max_batch_size=10, linger_ms=20, max_pending=100)
+    producer.start()
+    ids = await asyncio.gather(*[
+        producer.publish_command("SEND_TEXT", {"to": str(i)}) for i in range(3)
+    ])
+    await producer.stop()
+    
+    assert ids == ["1-0", "1-1", "1-2"]
+    pipe.execute.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_buffered_producer_propagates_item_failure():
+    """A failed XADD raises in the caller that queued it"""
+    mock_redis = MagicMock()
+    pipe = MagicMock()
+    pipe.execute = AsyncMock(side_effect=[[Exception("OOM")], ["2-0"]])
+    mock_redis.pipeline.return_value = pipe
+    
+    producer = BufferedStreamProducer(mock_redis, max_batch_size=1, linger_ms=0, max_pending=10)
+    producer.start()
+    with pytest.raises(Exception, match="OOM"):
+        await producer.publish_command("SEND_TEXT", {"to": "1"})
+    await producer.stop()
@@ -0,0 +1,112 @@
+"""
+Tests for the Redis-backed session status cache.
+"""
+import json
+from unittest.mock import AsyncMock, MagicMock, Mock
+
+import pytest
+from fastapi import HTTPException
+
+from src.api.v1.messages import resolve_connected_session
+from src.services.session_cache import SessionCache
+
+SESSIONS = [
+    {"id": "s2", "status": "connected", "phone_number": "15550000002", "created_at": "2024-02-01T00:00:00+00:00"},
+    {"id": "s1", "status": "disconnected", "phone_number": None, "created_at": "2024-01-01T00:00:00+00:00"},
+]
+
+
+def _cache():
+    """SessionCache whose Lua scripts are mocks"""
+    redis = MagicMock(hgetall=AsyncMock(return_value={}), hmget=AsyncMock(return_value=[None, None]))
+    seed_script, put_script, patch_script = AsyncMock(), AsyncMock(), AsyncMock()
+    redis.register_script.side_effect = [seed_script, put_script, patch_script]
+    return SessionCache(redis, ttl=60), seed_script, patch_script
+
+
+def _supabase(rows):
+    supabase = MagicMock()
+    supabase.table.return_value.select.return_value.eq.return_value.order.return_value.execute = AsyncMock(
+        return_value=Mock(data=rows)
+    )
+    return supabase
+
+
+def _cached(rows):
+    return {**{row["id"]: json.dumps(row) for row in rows}, "__loaded__": "1"}
+
+
+@pytest.mark.asyncio
+async def test_miss_loads_from_postgres_and_seeds():
+    cache, seed_script, _ = _cache()
+    supabase = _supabase(SESSIONS)
+
+    assert await cache.list_sessions("u1", supabase) == SESSIONS
+
+    args = seed_script.call_args.kwargs["args"]
+    assert seed_script.call_args.kwargs["keys"] == ["user:u1:sessions"]
+    assert args[0] == 60
+    assert args[1::2] == ["s2", "s1", "__loaded__"]
+    assert cache.stats() == {"hits": 0, "misses": 1}
+
+
+@pytest.mark.asyncio
+async def test_hit_skips_postgres():
+    cache, _, _ = _cache()
+    cache.redis.hgetall.return_value = _cached(reversed(SESSIONS))
+    cache.redis.hmget.return_value = [None, "1"]
+    supabase = _supabase([])
+
+    assert await cache.list_sessions("u1", supabase) == SESSIONS  # Newest first
+    assert await cache.get_session("u1", "s3", supabase) is None  # Fully loaded: not the user's
+    supabase.table.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_redis_errors_fall_back_to_postgres():
+    cache, seed_script, _ = _cache()
+    cache.redis.hmget.side_effect = ConnectionError("redis down")
+
+    assert await cache.get_session("u1", "s1", _supabase(SESSIONS)) == SESSIONS[1]
+    seed_script.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_session_events_patch_status_and_phone():
+    cache, _, patch_script = _cache()
+
+    await cache.apply_event("u1", "s1", "SESSION_CONNECTED", {
+        "session_id": "s1", "phone_number": "15550000001", "timestamp": "2024-03-01T00:00:00Z"
+    })
+    await cache.apply_event("u1", "s1", "message.received", {"session_id": "s1"})
+
+    patch_script.assert_awaited_once()
+    assert patch_script.call_args.kwargs["args"][0] == "s1"
+    assert json.loads(patch_script.call_args.kwargs["args"][1]) == {
+        "status": "connected", "phone_number": "15550000001", "updated_at": "2024-03-01T00:00:00Z"
+    }
+
+
+@pytest.mark.asyncio
+async def test_forget_user_drops_the_cached_sessions():
+    cache, _, _ = _cache()
+    cache.redis.delete = AsyncMock()
+
+    await cache.forget_user("u1")
+
+    cache.redis.delete.assert_awaited_once_with("user:u1:sessions")
+
+
+@pytest.mark.asyncio
+async def test_send_resolves_the_newest_connected_session(monkeypatch):
+    cache, _, _ = _cache()
+    cache.redis.hgetall.return_value = _cached(SESSIONS)
+    cache.redis.hmget.return_value = [json.dumps(SESSIONS[1]), "1"]
+    monkeypatch.setattr("src.api.v1.messages.get_session_cache", AsyncMock(return_value=cache))
+    supabase = _supabase([])
+
+    assert await resolve_connected_session("u1", None, supabase) == "s2"
+    with pytest.raises(HTTPException) as exc:
+        await resolve_connected_session("u1", "s1", supabase)
+    assert exc.value.status_code == 409
+    supabase.table.assert_not_called()
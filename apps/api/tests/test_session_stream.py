@@ -0,0 +1,75 @@
+"""
+Tests for the resumable session SSE stream.
+"""
+import json
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+
+SESSION_ID = "550e8400-e29b-41d4-a716-446655440000"
+
+
+@pytest.fixture
+def session_tables(mock_supabase, mock_profile_data):
+    """Per-table mocks for an authenticated user who owns SESSION_ID"""
+    mock_supabase.auth.get_user.return_value = Mock(user=Mock(id=mock_profile_data["id"]))
+    tables = {name: type(mock_supabase)() for name in ("profiles", "sessions")}
+    tables["profiles"].select.return_value.eq.return_value.single.return_value.execute.return_value = Mock(
+        data=mock_profile_data
+    )
+    tables["sessions"].select.return_value.eq.return_value.eq.return_value.single.return_value.execute.return_value = Mock(
+        data={"id": SESSION_ID, "status": "qr_pending"}
+    )
+    mock_supabase.table.side_effect = lambda name: tables[name]
+    return tables
+
+
+def _envelope(event_type, payload, stream_id=None):
+    event = {"type": event_type, "payload": payload}
+    if stream_id:
+        event["stream_id"] = stream_id
+    return event
+
+
+def _stream(client, auth_headers, redis, live, last_event_id=None):
+    subscription = Mock(get=AsyncMock(side_effect=[json.dumps(m) for m in live]), close=AsyncMock())
+    multiplexer = Mock(subscribe=AsyncMock(return_value=subscription))
+    headers = {**auth_headers, **({"Last-Event-ID": last_event_id} if last_event_id else {})}
+
+    with patch("src.api.v1.sessions.get_pubsub_multiplexer", new=AsyncMock(return_value=multiplexer)), \
+            patch("src.api.v1.sessions.RedisClient.get_client", new=AsyncMock(return_value=redis)):
+        response = client.get(f"/api/v1/sessions/{SESSION_ID}/stream", headers=headers)
+
+    subscription.close.assert_awaited()
+    return response
+
+
+def test_resume_replays_missed_events_then_skips_duplicates(client, auth_headers, session_tables):
+    redis = Mock(xrange=AsyncMock(return_value=[
+        ("1700000000002-0", {"data": json.dumps(_envelope("QR_CODE_UPDATED", {"qr_data": "qr-2"}))}),
+    ]))
+    live = [
+        _envelope("QR_CODE_UPDATED", {"qr_data": "qr-2"}, "1700000000002-0"),  # Also in the log
+        _envelope("SESSION_CONNECTED", {"phone_number": "15550000001"}, "1700000000003-0"),
+    ]
+
+    response = _stream(client, auth_headers, redis, live, last_event_id="1700000000001-0")
+
+    assert response.status_code == 200
+    assert response.text == (
+        'id: 1700000000002-0\nevent: qr\ndata: {"qr_data": "qr-2"}\n\n'
+        'id: 1700000000003-0\nevent: connected\ndata: {"phone_number": "15550000001"}\n\n'
+    )
+    assert redis.xrange.call_args.kwargs["min"] == "(1700000000001-0"
+
+
+def test_new_client_gets_cached_qr_immediately(client, auth_headers, session_tables):
+    cached = _envelope("QR_CODE_UPDATED", {"qr_data": "qr-1"}, "1700000000001-0")
+    redis = Mock(get=AsyncMock(return_value=json.dumps(cached)), xrange=AsyncMock())
+    live = [_envelope("SESSION_FAILED", {"reason": "bad_session"}, "1700000000002-0")]
+
+    response = _stream(client, auth_headers, redis, live)
+
+    assert response.text.startswith('id: 1700000000001-0\nevent: qr\ndata: {"qr_data": "qr-1"}\n\n')
+    assert response.text.endswith('id: 1700000000002-0\nevent: error\ndata: {"reason": "bad_session"}\n\n')
+    redis.xrange.assert_not_awaited()
@@ -0,0 +1,706 @@
+"""
+Tests for the webhook dispatcher.
+"""
+import asyncio
+import json
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from src.services.webhook_dispatcher import WebhookDispatcher
+from src.services.webhook_dlq import DLQ_STREAM, REPLAY_QUEUE_KEY, REPLAY_RUNNING_KEY, recover_replays
+
+
+def _webhook(webhook_id, url):
+    return {"id": webhook_id, "url": url, "secret": "whsec_test", "failure_count": 0}
+
+
+def _dispatcher(mock_supabase, post):
+    redis = AsyncMock(register_script=Mock(), pipeline=Mock())
+    redis.pipeline.return_value.execute = AsyncMock()
+    dispatcher = WebhookDispatcher(redis=redis, supabase=mock_supabase)
+    dispatcher.http_client = Mock(post=post)
+    return dispatcher
+
+
+@pytest.mark.asyncio
+async def test_per_endpoint_limit_does_not_block_other_endpoints(mock_supabase):
+    """A slow endpoint is capped at its own limit while other endpoints keep flowing"""
+    in_flight = {"slow": 0, "fast": 0}
+    peak = {"slow": 0, "fast": 0}
+
+    async def post(url, **kwargs):
+        key = "slow" if "slow" in url else "fast"
+        in_flight[key] += 1
+        peak[key] = max(peak[key], in_flight[key])
+        await asyncio.sleep(0.05 if key == "slow" else 0)
+        in_flight[key] -= 1
+        return Mock(status_code=200, text="ok")
+
+    dispatcher = _dispatcher(mock_supabase, post)
+    dispatcher.per_endpoint_concurrency = 2
+    event = {"id": "evt", "payload": {}}
+
+    await asyncio.gather(
+        *(dispatcher._dispatch_webhook(_webhook(f"s{i}", "https://slow.example"), "message.received", event)
+          for i in range(6)),
+        *(dispatcher._dispatch_webhook(_webhook(f"f{i}", "https://fast.example"), "message.received", event)
+          for i in range(6))
+    )
+
+    assert peak["slow"] == 2
+    assert peak["fast"] <= 2
+    assert dispatcher._endpoint_slots == {}
+
+
+@pytest.mark.asyncio
+async def test_event_is_acked_after_deliveries_settle(mock_supabase):
+    """XACK happens only once every matching webhook has been attempted"""
+    delivered = []
+
+    async def post(url, **kwargs):
+        await asyncio.sleep(0.01)
+        delivered.append(url)
+        return Mock(status_code=200, text="ok")
+
+    dispatcher = _dispatcher(mock_supabase, post)
+    dispatcher._find_webhooks = AsyncMock(return_value=[
+        _webhook("w1", "https://a.example"),
+        _webhook("w2", "https://b.example")
+    ])
+    dispatcher.redis.xack.side_effect = lambda *args: delivered.append("ack")
+
+    await dispatcher._event_slots.acquire()
+    await dispatcher._handle_message("1-0", {
+        "data": json.dumps({"id": "evt", "type": "message.received", "payload": {"session_id": "s1"}})
+    })
+
+    assert sorted(delivered[:2]) == ["https://a.example", "https://b.example"]
+    assert delivered[2] == "ack"
+
+
+@pytest.mark.asyncio
+async def test_failed_delivery_is_queued_for_retry(mock_supabase, monkeypatch):
+    """A failure parks the delivery in the delay queue instead of sleeping inline"""
+    monkeypatch.setattr("src.services.webhook_dispatcher.time.time", lambda: 1000.0)
+    post = AsyncMock(return_value=Mock(status_code=500, text="boom"))
+    dispatcher = _dispatcher(mock_supabase, post)
+    dispatcher.retry_jitter = 0
+
+    await dispatcher._dispatch_webhook(
+        _webhook("w1", "https://a.example"), "message.received", {"id": "evt", "payload": {}}
+    )
+
+    assert post.await_count == 1
+    key, members = dispatcher.redis.zadd.await_args.args
+    assert key == "webhooks:retry"
+    (raw_job, due), = members.items()
+    job = json.loads(raw_job)
+    assert job["webhook_id"] == "w1"
+    assert job["attempt"] == 2
+    assert due == 1000.0 + dispatcher.retry_base_delay
+
+
+@pytest.mark.asyncio
+async def test_last_attempt_is_not_requeued(mock_supabase):
+    post = AsyncMock(return_value=Mock(status_code=500, text="boom"))
+    dispatcher = _dispatcher(mock_supabase, post)
+
+    await dispatcher._dispatch_webhook(
+        _webhook("w1", "https://a.example"), "message.received", {"id": "evt", "payload": {}},
+        attempt=dispatcher.max_attempts
+    )
+
+    dispatcher.redis.zadd.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_exhausted_delivery_is_dead_lettered(mock_supabase):
+    post = AsyncMock(return_value=Mock(status_code=500, text="boom"))
+    dispatcher = _dispatcher(mock_supabase, post)
+
+    await dispatcher._dispatch_webhook(
+        _webhook("w1", "https://a.example"), "message.received", {"id": "evt", "payload": {}},
+        attempt=dispatcher.max_attempts
+    )
+
+    stream, fields = dispatcher.redis.pipeline.return_value.xadd.call_args.args
+    assert stream == DLQ_STREAM
+    assert fields["webhook_id"] == "w1"
+    assert fields["reason"] == "max_attempts"
+    assert json.loads(fields["payload"])["id"] == "evt_evt"
+
+
+def _dlq_entry(entry_id, webhook_id, event_id):
+    payload = {"id": f"evt_{event_id}", "type": "message.received", "data": {}}
+    return (entry_id.encode(), {
+        b"webhook_id": webhook_id.encode(),
+        b"event_type": b"message.received",
+        b"event": json.dumps({"id": event_id}).encode(),
+        b"payload": json.dumps(payload).encode(),
+    })
+
+
+@pytest.mark.asyncio
+async def test_replay_redelivers_matching_dlq_entries(mock_supabase):
+    delivered = []
+
+    async def post(url, **kwargs):
+        delivered.append(json.loads(kwargs["content"])["id"])
+        return Mock(status_code=200, text="ok")
+
+    dispatcher = _dispatcher(mock_supabase, post)
+    dispatcher.running = True
+    dispatcher._get_webhook = AsyncMock(return_value=_webhook("w1", "https://a.example"))
+    dispatcher.redis.hgetall.return_value = {
+        b"webhook_id": b"w1", b"status": b"pending", b"start_id": b"1000-0", b"end_id": b"5000",
+        b"cursor": b"", b"rate_per_second": b"100",
+    }
+    dispatcher.redis.xrange.side_effect = [
+        [_dlq_entry("1000-0", "w1", "a"), _dlq_entry("2000-0", "w2", "b"), _dlq_entry("3000-0", "w1", "c")],
+        [],
+    ]
+
+    await dispatcher._replay("r1")
+
+    assert delivered == ["evt_a", "evt_c"]
+    assert dispatcher.redis.xrange.call_args_list[1].kwargs["min"] == "(3000-0"
+    pipe = dispatcher.redis.pipeline.return_value
+    final = pipe.hset.call_args.kwargs["mapping"]
+    assert final["status"] == "completed"
+    assert (final["scanned"], final["matched"], final["delivered"], final["requeued"]) == (3, 2, 2, 0)
+    pipe.zrem.assert_called_once_with(REPLAY_RUNNING_KEY, "r1")
+
+
+def _replay_state(cursor=b""):
+    return {
+        b"webhook_id": b"w1", b"status": b"pending", b"start_id": b"1000-0", b"end_id": b"5000",
+        b"cursor": cursor, b"rate_per_second": b"100",
+    }
+
+
+@pytest.mark.asyncio
+async def test_stopped_replay_is_requeued_at_its_cursor(mock_supabase):
+    dispatcher = _dispatcher(mock_supabase, None)
+
+    async def post(url, **kwargs):
+        dispatcher.running = False  # Dispatcher stops while the first entry is sent
+        return Mock(status_code=200, text="ok")
+
+    dispatcher.http_client = Mock(post=post)
+    dispatcher.running = True
+    dispatcher._get_webhook = AsyncMock(return_value=_webhook("w1", "https://a.example"))
+    dispatcher.redis.hgetall.return_value = _replay_state()
+    dispatcher.redis.xrange.return_value = [_dlq_entry("1000-0", "w1", "a"), _dlq_entry("2000-0", "w1", "b")]
+
+    await dispatcher._replay("r1")
+
+    pipe = dispatcher.redis.pipeline.return_value
+    state = pipe.hset.call_args.kwargs["mapping"]
+    assert (state["status"], state["cursor"], state["delivered"]) == ("pending", "1000-0", 1)
+    pipe.rpush.assert_called_once_with(REPLAY_QUEUE_KEY, "r1")
+
+
+@pytest.mark.asyncio
+async def test_cancelled_replay_is_requeued(mock_supabase):
+    started = asyncio.Event()
+
+    async def post(url, **kwargs):
+        started.set()
+        await asyncio.sleep(10)
+
+    dispatcher = _dispatcher(mock_supabase, post)
+    dispatcher.running = True
+    dispatcher._get_webhook = AsyncMock(return_value=_webhook("w1", "https://a.example"))
+    dispatcher.redis.hgetall.return_value = _replay_state(cursor=b"900-0")
+    dispatcher.redis.xrange.return_value = [_dlq_entry("1000-0", "w1", "a")]
+
+    task = asyncio.create_task(dispatcher._replay("r1"))
+    await asyncio.wait_for(started.wait(), timeout=1)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert dispatcher.redis.xrange.call_args.kwargs["min"] == "(900-0"
+    pipe = dispatcher.redis.pipeline.return_value
+    state = pipe.hset.call_args.kwargs["mapping"]
+    assert (state["status"], state["cursor"]) == ("pending", "900-0")
+    pipe.rpush.assert_called_once_with(REPLAY_QUEUE_KEY, "r1")
+
+
+@pytest.mark.asyncio
+async def test_replays_with_expired_leases_are_requeued():
+    redis = AsyncMock(pipeline=Mock())
+    redis.pipeline.return_value.execute = AsyncMock()
+    redis.zrangebyscore.return_value = [b"r1", b"r2", b"r3"]
+    redis.zrem.side_effect = [1, 1, 0]  # r3 was recovered by another dispatcher
+    redis.hget.side_effect = [b"running", b"completed"]
+
+    assert await recover_replays(redis) == ["r1"]
+    redis.pipeline.return_value.rpush.assert_called_once_with(REPLAY_QUEUE_KEY, "r1")
+
+
+def test_retry_delay_backs_off_exponentially(mock_supabase):
+    dispatcher = _dispatcher(mock_supabase, AsyncMock())
+    dispatcher.retry_jitter = 0
+    dispatcher.retry_base_delay = 1
+    dispatcher.retry_max_delay = 10
+
+    assert [dispatcher._retry_delay(attempt) for attempt in range(2, 7)] == [1, 2, 4, 8, 10]
+
+
+@pytest.mark.asyncio
+async def test_retry_scheduler_dispatches_claimed_jobs(mock_supabase):
+    dispatcher = _dispatcher(mock_supabase, AsyncMock())
+    webhook = _webhook("w1", "https://a.example")
+    job = {
+        "job_id": "j1", "webhook_id": "w1", "event_type": "message.received",
+        "event": {"id": "evt"}, "payload": {"id": "evt_evt"}, "attempt": 3
+    }
+    raw_job = json.dumps(job)
+    dispatcher._claim_retries = AsyncMock(side_effect=[[raw_job], []])
+    dispatcher._get_webhook = AsyncMock(return_value=webhook)
+    dispatcher._dispatch_webhook = AsyncMock()
+    dispatcher.retry_poll_interval = 0.01
+    dispatcher.running = True
+
+    scheduler = asyncio.create_task(dispatcher._run_retry_scheduler())
+    await asyncio.sleep(0.05)
+    dispatcher.running = False
+    await scheduler
+
+    dispatcher._dispatch_webhook.assert_awaited_once_with(
+        webhook, "message.received", {"id": "evt"}, attempt=3, payload={"id": "evt_evt"}
+    )
+    # Leased, not removed, when claimed; released once the attempt is done
+    now, capacity, lease_until = dispatcher._claim_retries.call_args_list[0].kwargs["args"]
+    assert lease_until == now + dispatcher.retry_lease_seconds
+    dispatcher.redis.zrem.assert_awaited_once_with("webhooks:retry", raw_job)
+
+
+@pytest.mark.asyncio
+async def test_stop_waits_for_running_retries(mock_supabase):
+    dispatcher = _dispatcher(mock_supabase, AsyncMock())
+    finished = []
+
+    async def retry():
+        await asyncio.sleep(0.02)
+        finished.append(True)
+
+    dispatcher.http_client = AsyncMock()
+    dispatcher._retry_tasks.add(asyncio.create_task(retry()))
+    await dispatcher.stop()
+
+    assert finished == [True]
+
+
+@pytest.mark.asyncio
+async def test_stop_drains_the_consumer_before_closing_the_client(mock_supabase):
+    dispatcher = _dispatcher(mock_supabase, AsyncMock())
+    dispatcher.running = True
+    dispatcher.http_client = AsyncMock()
+    sent = []
+
+    async def process(msg_id, msg_data, event):
+        await asyncio.sleep(0.02)
+        sent.append(dispatcher.http_client.aclose.await_count)
+
+    async def xreadgroup(*args, **kwargs):
+        if dispatcher.redis.xreadgroup.await_count == 1:
+            return [("whatsapp:events", [("1-0", _event("m1", "S"))])]
+        await asyncio.sleep(10)
+
+    dispatcher._process_event = process
+    dispatcher.redis.xreadgroup.side_effect = xreadgroup
+    dispatcher._consumer_task = asyncio.create_task(dispatcher._consume_events())
+    await asyncio.sleep(0.01)
+
+    await dispatcher.stop()
+
+    assert dispatcher._consumer_task.done()
+    assert sent == [0]  # Handled before the client was closed
+    dispatcher.http_client.aclose.assert_awaited_once()
+
+
+def test_consumer_names_are_unique(mock_supabase):
+    first = _dispatcher(mock_supabase, AsyncMock())
+    second = _dispatcher(mock_supabase, AsyncMock())
+
+    assert first.consumer_name != second.consumer_name
+
+
+@pytest.mark.asyncio
+async def test_stale_pending_events_are_claimed_and_processed(mock_supabase):
+    dispatcher = _dispatcher(mock_supabase, AsyncMock())
+    dispatcher.running = True
+    dispatcher._handling.add(b"2-0")
+    dispatcher.redis.xautoclaim.return_value = [
+        b"0-0",
+        [(b"1-0", {b"data": b"{}"}), (b"2-0", {b"data": b"{}"}), (b"3-0", None)],
+        []
+    ]
+    dispatcher._process_event = AsyncMock()
+
+    assert await dispatcher._claim_pending() == 1
+    await asyncio.gather(*dispatcher._event_tasks)
+
+    dispatcher._process_event.assert_awaited_once_with(b"1-0", {b"data": b"{}"}, {})
+    assert [call.args[2] for call in dispatcher.redis.xack.await_args_list] == [b"3-0", b"1-0"]
+    assert dispatcher._event_slots._value == dispatcher.max_in_flight_events
+
+
+@pytest.mark.asyncio
+async def test_in_progress_entries_are_kept_from_going_idle(mock_supabase, monkeypatch):
+    """Entries still queued or waiting on an endpoint are re-claimed by their owner every heartbeat"""
+    monkeypatch.setattr("src.services.webhook_dispatcher.REFRESH_CHUNK_SIZE", 2)
+    dispatcher = _dispatcher(mock_supabase, AsyncMock())
+    dispatcher._handling.update([b"1-0", b"2-0", b"3-0"])
+
+    await dispatcher._refresh_in_progress()
+
+    calls = dispatcher.redis.xclaim.await_args_list
+    assert sorted(id_ for call in calls for id_ in call.kwargs["message_ids"]) == [b"1-0", b"2-0", b"3-0"]
+    assert all(call.args[2] == dispatcher.consumer_name and call.kwargs["justid"] for call in calls)
+
+
+@pytest.mark.asyncio
+async def test_dead_consumers_without_pending_entries_are_removed(mock_supabase):
+    dispatcher = _dispatcher(mock_supabase, AsyncMock())
+    dispatcher.redis.xinfo_consumers.return_value = [
+        {"name": dispatcher.consumer_name.encode(), "pending": 0},
+        {"name": b"alive", "pending": 0},
+        {"name": b"dead-with-pending", "pending": 3},
+        {"name": b"dead", "pending": 0},
+    ]
+    dispatcher.redis.exists.side_effect = lambda key: key.endswith("alive")
+
+    assert await dispatcher._remove_dead_consumers() == 1
+    dispatcher.redis.xgroup_delconsumer.assert_awaited_once_with(
+        "whatsapp:events", "webhook-dispatcher", "dead"
+    )
+
+
+def _event(msg_id, session_id):
+    return {"data": json.dumps({"id": msg_id, "type": "message.sent", "payload": {"session_id": session_id}})}
+
+
+@pytest.mark.asyncio
+async def test_events_are_ordered_per_session_and_parallel_across_sessions(mock_supabase):
+    dispatcher = _dispatcher(mock_supabase, AsyncMock())
+    handled = []
+    in_flight = set()
+    peak = 0
+
+    async def process(msg_id, msg_data, event):
+        nonlocal peak
+        session_id = event["payload"]["session_id"]
+        assert session_id not in in_flight  # never two events of one session at once
+        in_flight.add(session_id)
+        peak = max(peak, len(in_flight))
+        await asyncio.sleep(0.01 if msg_id.endswith("1") else 0)
+        in_flight.discard(session_id)
+        handled.append(msg_id)
+
+    dispatcher._process_event = process
+    for msg_id, session_id in [("a1", "A"), ("b1", "B"), ("a2", "A"), ("a3", "A"), ("b2", "B")]:
+        await dispatcher._event_slots.acquire()
+        dispatcher._spawn_event(msg_id, _event(msg_id, session_id))
+
+    await asyncio.gather(*dispatcher._event_tasks)
+
+    assert [m for m in handled if m.startswith("a")] == ["a1", "a2", "a3"]
+    assert [m for m in handled if m.startswith("b")] == ["b1", "b2"]
+    assert peak == 2
+    assert dispatcher._partitions == {}
+    assert dispatcher._handling == set()
+
+
+@pytest.mark.asyncio
+async def test_busy_session_does_not_starve_other_sessions(mock_supabase):
+    """Events queued behind a stuck session give back their slots"""
+    dispatcher = _dispatcher(mock_supabase, AsyncMock())
+    dispatcher._event_slots = asyncio.Semaphore(4)
+    dispatcher.max_queued_events = 9
+    release_a = asyncio.Event()
+    handled = []
+
+    async def process(msg_id, msg_data, event):
+        if event["payload"]["session_id"] == "A":
+            await release_a.wait()
+        handled.append(msg_id)
+
+    dispatcher._process_event = process
+    for i in range(10):
+        await asyncio.wait_for(dispatcher._event_slots.acquire(), timeout=1)
+        dispatcher._spawn_event(f"a{i}", _event(f"a{i}", "A"))
+
+    assert not dispatcher._queue_room.is_set()  # Reading pauses at the queue cap
+    await asyncio.wait_for(dispatcher._event_slots.acquire(), timeout=1)
+    dispatcher._spawn_event("b1", _event("b1", "B"))
+    await asyncio.sleep(0.01)
+    assert handled == ["b1"]
+
+    release_a.set()
+    await asyncio.gather(*dispatcher._event_tasks)
+    assert handled == ["b1"] + [f"a{i}" for i in range(10)]
+    assert dispatcher._queued_events == 0
+    assert dispatcher._queue_room.is_set()
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_parks_deliveries(mock_supabase):
+    post = AsyncMock(return_value=Mock(status_code=503, text="down"))
+    dispatcher = _dispatcher(mock_supabase, post)
+    dispatcher.breaker_failure_threshold = 2
+    webhook = _webhook("w1", "https://down.example")
+    event = {"id": "evt", "payload": {}}
+
+    for _ in range(4):
+        await dispatcher._dispatch_webhook(webhook, "message.received", event)
+
+    assert post.await_count == 2
+    pipe = dispatcher.redis.pipeline.return_value
+    assert pipe.rpush.call_count == 2
+    assert pipe.rpush.call_args.args[0] == "webhooks:backlog:w1"
+    pipe.sadd.assert_called_with("webhooks:backlog:index", "w1")
+
+
+@pytest.mark.asyncio
+async def test_successful_probe_drains_backlog_in_order(mock_supabase):
+    delivered = []
+
+    async def post(url, content, **kwargs):
+        delivered.append(json.loads(content)["id"])
+        return Mock(status_code=200, text="ok")
+
+    dispatcher = _dispatcher(mock_supabase, post)
+    dispatcher.running = True
+    webhook = _webhook("w1", "https://back.example")
+    dispatcher._get_webhook = AsyncMock(return_value=webhook)
+    dispatcher.breaker_failure_threshold = 1
+    dispatcher.breaker_open_seconds = 0  # open long enough to probe right away
+    dispatcher._breaker(webhook["url"]).record_failure()
+
+    jobs = [
+        json.dumps(dispatcher._build_job("w1", "message.sent", {"id": i}, {"id": f"evt_{i}"}, 1))
+        for i in range(3)
+    ]
+    dispatcher.redis.lpop.side_effect = jobs + [None]
+    dispatcher.redis.llen.return_value = 0
+
+    await dispatcher._drain_backlog("w1")
+
+    assert delivered == ["evt_0", "evt_1", "evt_2"]
+    assert dispatcher._breakers == {}
+    dispatcher.redis.srem.assert_awaited_once_with("webhooks:backlog:index", "w1")
+
+
+@pytest.mark.asyncio
+async def test_live_deliveries_queue_behind_parked_ones(mock_supabase):
+    """Only the drainer probes, so recovered endpoints get parked deliveries first"""
+    post = AsyncMock(return_value=Mock(status_code=200, text="ok"))
+    dispatcher = _dispatcher(mock_supabase, post)
+    dispatcher.breaker_failure_threshold = 1
+    dispatcher.breaker_open_seconds = 0  # a probe is due right away
+    webhook = _webhook("w1", "https://back.example")
+    event = {"id": "evt", "payload": {}}
+
+    dispatcher._breaker(webhook["url"]).record_failure()
+    await dispatcher._dispatch_webhook(webhook, "message.received", event)
+    assert dispatcher._breakers[webhook["url"]].state.value == "open"
+
+    dispatcher._breakers.clear()  # Recovered, but the backlog is not drained yet
+    await dispatcher._dispatch_webhook(webhook, "message.received", event)
+
+    post.assert_not_awaited()
+    assert dispatcher.redis.pipeline.return_value.rpush.call_count == 2
+
+    dispatcher.redis.lpop.return_value = None
+    dispatcher.redis.llen.return_value = 0
+    dispatcher.running = True
+    dispatcher._get_webhook = AsyncMock(return_value=webhook)
+    await dispatcher._drain_backlog("w1")
+    await dispatcher._dispatch_webhook(webhook, "message.received", event)
+    post.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_reenabled_webhook_starts_a_fresh_failure_streak(mock_supabase):
+    post = AsyncMock(return_value=Mock(status_code=500, text="boom"))
+    dispatcher = _dispatcher(mock_supabase, post)
+    dispatcher.disable_after_failures = 25
+    webhook = {**_webhook("w1", "https://a.example"), "failure_count": 25}
+
+    await dispatcher._dispatch_webhook(webhook, "message.received", {"id": "evt", "payload": {}})
+
+    assert webhook["failure_count"] == 1
+    dispatcher.redis.publish.assert_not_awaited()
+    dispatcher.redis.zadd.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_failed_probe_keeps_its_place_in_the_backlog(mock_supabase):
+    post = AsyncMock(return_value=Mock(status_code=503, text="down"))
+    dispatcher = _dispatcher(mock_supabase, post)
+    dispatcher.running = True
+    webhook = _webhook("w1", "https://down.example")
+    dispatcher._get_webhook = AsyncMock(return_value=webhook)
+    dispatcher.breaker_failure_threshold = 1
+    dispatcher.breaker_open_seconds = 0
+    dispatcher._breaker(webhook["url"]).record_failure()
+    dispatcher.redis.lpop.return_value = json.dumps(
+        dispatcher._build_job("w1", "message.sent", {"id": 0}, {"id": "evt_0"}, 1)
+    )
+
+    await dispatcher._drain_backlog("w1")
+
+    assert post.await_count == 1
+    key, raw_job = dispatcher.redis.lpush.await_args.args
+    assert key == "webhooks:backlog:w1"
+    assert json.loads(raw_job)["attempt"] == 2
+    dispatcher.redis.zadd.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_drainer_waits_while_another_probe_is_in_flight(mock_supabase):
+    post = AsyncMock()
+    dispatcher = _dispatcher(mock_supabase, post)
+    dispatcher.running = True
+    webhook = _webhook("w1", "https://down.example")
+    dispatcher._get_webhook = AsyncMock(return_value=webhook)
+    dispatcher.breaker_failure_threshold = 1
+    dispatcher.breaker_open_seconds = 0
+    breaker = dispatcher._breaker(webhook["url"])
+    breaker.record_failure()
+
+    async def lpop(key):
+        breaker.allow()  # A live delivery takes the probe meanwhile
+        return "job"
+
+    dispatcher.redis.lpop.side_effect = lpop
+
+    await dispatcher._drain_backlog("w1")
+
+    post.assert_not_awaited()
+    dispatcher.redis.lpush.assert_awaited_once_with("webhooks:backlog:w1", "job")
+
+
+@pytest.mark.asyncio
+async def test_failure_streak_is_written_when_the_circuit_opens(mock_supabase):
+    post = AsyncMock(return_value=Mock(status_code=500, text="boom"))
+    dispatcher = _dispatcher(mock_supabase, post)
+    dispatcher.breaker_failure_threshold = 3
+    webhook = _webhook("w1", "https://a.example")
+    update = mock_supabase.table.return_value.update
+
+    for _ in range(2):
+        await dispatcher._dispatch_webhook(webhook, "message.received", {"id": "evt", "payload": {}})
+    update.assert_not_called()
+
+    await dispatcher._dispatch_webhook(webhook, "message.received", {"id": "evt", "payload": {}})
+    update.assert_called_once_with({"failure_count": 3})
+
+
+@pytest.mark.asyncio
+async def test_webhook_is_disabled_after_failure_streak(mock_supabase):
+    post = AsyncMock(return_value=Mock(status_code=500, text="boom"))
+    dispatcher = _dispatcher(mock_supabase, post)
+    dispatcher.disable_after_failures = 3
+    webhook = {**_webhook("w1", "https://a.example"), "failure_count": 2}
+
+    await dispatcher._dispatch_webhook(webhook, "message.received", {"id": "evt", "payload": {}})
+
+    mock_supabase.table.return_value.update.assert_called_with({"enabled": False, "failure_count": 3})
+    dispatcher.redis.zadd.assert_not_awaited()
+    dispatcher.redis.publish.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_batch_mode_sends_one_signed_array(mock_supabase):
+    bodies = []
+
+    async def post(url, content, headers):
+        bodies.append((json.loads(content), headers))
+        return Mock(status_code=200, text="ok")
+
+    dispatcher = _dispatcher(mock_supabase, post)
+    webhook = {**_webhook("w1", "https://bulk.example"), "delivery_mode": "batch",
+               "batch_max_events": 3, "batch_max_wait_ms": 60000}
+    dispatcher._find_webhooks = AsyncMock(return_value=[webhook])
+
+    for i in range(3):
+        await dispatcher._event_slots.acquire()
+        await dispatcher._handle_message(f"{i}-0", _event(f"m{i}", "S"))
+    await asyncio.gather(*dispatcher._event_tasks)
+
+    assert len(bodies) == 1
+    body, headers = bodies[0]
+    assert [item["id"] for item in body] == ["evt_m0", "evt_m1", "evt_m2"]
+    assert headers["X-Webhook-Signature"].startswith("sha256=")
+    assert dispatcher.redis.xack.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_batch_larger_than_event_slots_is_filled(mock_supabase):
+    """Events waiting for their batch give back their slots, so the batch can fill"""
+    post = AsyncMock(return_value=Mock(status_code=200, text="ok"))
+    dispatcher = _dispatcher(mock_supabase, post)
+    dispatcher._event_slots = asyncio.Semaphore(2)
+    webhook = {**_webhook("w1", "https://bulk.example"), "delivery_mode": "batch",
+               "batch_max_events": 5, "batch_max_wait_ms": 60000}
+    dispatcher._find_webhooks = AsyncMock(return_value=[webhook])
+
+    for i in range(5):
+        await asyncio.wait_for(dispatcher._event_slots.acquire(), timeout=1)
+        await dispatcher._handle_message(f"{i}-0", _event(f"m{i}", "S"))
+    await asyncio.gather(*dispatcher._event_tasks)
+
+    assert len(json.loads(post.await_args.kwargs["content"])) == 5
+    assert dispatcher.redis.xack.await_count == 5
+    assert dispatcher._queued_events == 0
+    assert dispatcher._event_slots._value == 2
+
+
+@pytest.mark.asyncio
+async def test_batch_is_flushed_after_max_wait(mock_supabase):
+    post = AsyncMock(return_value=Mock(status_code=200, text="ok"))
+    dispatcher = _dispatcher(mock_supabase, post)
+    webhook = {**_webhook("w1", "https://bulk.example"), "delivery_mode": "batch",
+               "batch_max_events": 100, "batch_max_wait_ms": 20}
+
+    waiter = dispatcher.batcher.add(webhook, {"id": "evt_1"})
+    assert post.await_count == 0
+
+    await asyncio.wait_for(waiter, timeout=1)
+
+    assert json.loads(post.await_args.kwargs["content"]) == [{"id": "evt_1"}]
+
+
+@pytest.mark.asyncio
+async def test_events_are_published_to_the_session_owner(mock_supabase):
+    dispatcher = _dispatcher(mock_supabase, AsyncMock())
+    dispatcher.routing.loaded = True
+    dispatcher.routing._session_owners["s1"] = "u1"
+    event = {"id": "m1", "type": "message.received", "payload": {"session_id": "s1"}}
+
+    await dispatcher._process_event("1-0", {}, event)
+
+    pipe = dispatcher.redis.pipeline.return_value
+    channel, body = pipe.publish.call_args.args
+    assert channel == "user:u1:events"
+    assert json.loads(body)["id"] == "evt_m1"
+    assert pipe.xadd.call_args.args == ("user:u1:feed", {"data": body})
+    dispatcher.http_client.post.assert_not_called()  # No webhooks for this user
+
+
+@pytest.mark.asyncio
+async def test_session_events_update_the_owners_session_cache(mock_supabase):
+    dispatcher = _dispatcher(mock_supabase, AsyncMock())
+    dispatcher.routing.loaded = True
+    dispatcher.routing._session_owners["s1"] = "u1"
+    dispatcher.session_cache = Mock(apply_event=AsyncMock())
+    event = {"id": "e1", "type": "SESSION_FAILED", "payload": {"session_id": "s1", "reason": "bad_session"}}
+
+    await dispatcher._process_event("1-0", {}, event)
+
+    dispatcher.session_cache.apply_event.assert_awaited_once_with("u1", "s1", "SESSION_FAILED", event["payload"])
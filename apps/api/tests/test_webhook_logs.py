@@ -0,0 +1,71 @@
+"""
+Tests for the batched webhook_logs writer.
+"""
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from src.services.webhook_logs import WebhookLogSink
+
+
+def _sink(**kwargs):
+    table = Mock()
+    table.insert.return_value.execute = AsyncMock(return_value=Mock(data=[]))
+    supabase = Mock(table=Mock(return_value=table))
+    options = {"batch_size": 3, "interval": 60, "max_buffer": 10, "sample_threshold": 0.5, "success_sample_rate": 0}
+    options.update(kwargs)
+    return WebhookLogSink(supabase, **options), table
+
+
+@pytest.mark.asyncio
+async def test_rows_are_written_in_bulk_batches():
+    sink, table = _sink()
+    for i in range(5):
+        sink.record({"attempt_number": i, "success": True})
+
+    assert await sink.flush_once() == 3
+    assert await sink.flush_once() == 2
+
+    assert [len(call.args[0]) for call in table.insert.call_args_list] == [3, 2]
+    assert sink.stats()["written"] == 5
+    assert sink.stats()["queueDepth"] == 0
+
+
+def test_successes_are_sampled_under_pressure_but_failures_kept():
+    sink, _ = _sink()
+    for _ in range(5):
+        sink.record({"success": True})  # fills to the sampling threshold
+
+    sink.record({"success": True})
+    sink.record({"success": False})
+
+    stats = sink.stats()
+    assert stats["queueDepth"] == 6
+    assert stats["sampledOut"] == 1
+
+
+def test_failure_evicts_oldest_success_when_full():
+    sink, _ = _sink(sample_threshold=1.0)
+    for i in range(10):
+        sink.record({"id": i, "success": True})
+
+    sink.record({"id": "fail", "success": False})
+    sink.record({"id": "late", "success": True})
+
+    rows = list(sink._buffer)
+    assert len(rows) == 10
+    assert rows[0]["id"] == 1
+    assert rows[-1]["id"] == "fail"
+    assert sink.stats()["dropped"] == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_write_is_counted():
+    sink, table = _sink()
+    table.insert.return_value.execute.side_effect = Exception("boom")
+    sink.record({"success": False})
+
+    await sink.flush_once()
+
+    assert sink.stats()["writeErrors"] == 1
+    assert sink.stats()["dropped"] == 1
@@ -0,0 +1,130 @@
+"""
+Tests for the in-memory webhook routing index.
+"""
+import asyncio
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from src.services.webhook_routing import WebhookRoutingIndex
+
+
+def _query(rows):
+    query = Mock()
+    for method in ("select", "eq", "order", "range", "limit"):
+        getattr(query, method).return_value = query
+    query.execute = AsyncMock(return_value=Mock(data=rows))
+    return query
+
+
+def _supabase(sessions, webhooks):
+    tables = {"sessions": _query(sessions), "webhooks": _query(webhooks)}
+    return Mock(table=Mock(side_effect=lambda name: tables[name])), tables
+
+
+def _hook(webhook_id, events, session_id=None, user_id="u1"):
+    return {
+        "id": webhook_id, "user_id": user_id, "session_id": session_id,
+        "url": f"https://{webhook_id}.example", "secret": "whsec", "events": events, "enabled": True
+    }
+
+
+@pytest.fixture
+async def index():
+    supabase, tables = _supabase(
+        sessions=[{"id": "s1", "user_id": "u1"}, {"id": "s2", "user_id": "u1"}, {"id": "s3", "user_id": "u2"}],
+        webhooks=[
+            _hook("all", ["message.received"]),
+            _hook("s1-only", ["message.received", "session.connected"], session_id="s1"),
+            _hook("other-user", ["message.received"], user_id="u2"),
+        ]
+    )
+    routing = WebhookRoutingIndex(supabase)
+    await routing.load()
+    routing.tables = tables
+    return routing
+
+
+@pytest.mark.asyncio
+async def test_match_filters_by_owner_session_and_event(index):
+    assert {w["id"] for w in await index.match("s1", "message.received")} == {"all", "s1-only"}
+    assert {w["id"] for w in await index.match("s2", "message.received")} == {"all"}
+    assert {w["id"] for w in await index.match("s3", "message.received")} == {"other-user"}
+    assert await index.match("s2", "session.connected") == []
+    assert index.misses == 0
+
+
+@pytest.mark.asyncio
+async def test_match_makes_no_database_calls_after_load(index):
+    index.supabase.table.reset_mock()
+
+    for _ in range(3):
+        await index.match("s1", "message.received")
+
+    index.supabase.table.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_unknown_session_is_looked_up_once(index):
+    index.tables["sessions"].execute.return_value = Mock(data=[{"id": "s9", "user_id": "u1"}])
+
+    assert {w["id"] for w in await index.match("s9", "message.received")} == {"all"}
+    await index.match("s9", "message.received")
+
+    assert index.misses == 1
+
+
+@pytest.mark.asyncio
+async def test_disabled_webhook_is_dropped_on_change(index):
+    index.tables["webhooks"].execute.return_value = Mock(data=[{**_hook("all", ["message.received"]), "enabled": False}])
+
+    await index.apply_change({"webhook_id": "all"})
+
+    assert index.get("all") is None
+    assert {w["id"] for w in await index.match("s2", "message.received")} == set()
+
+
+@pytest.mark.asyncio
+async def test_deleted_session_drops_its_webhooks(index):
+    index.tables["sessions"].execute.return_value = Mock(data=[])
+
+    await index.apply_change({"session_id": "s1"})
+
+    assert index.get("s1-only") is None
+    assert index.get("all") is not None
+    assert await index.match("s1", "message.received") == []
+
+
+@pytest.mark.asyncio
+async def test_missing_session_is_remembered_briefly(index):
+    index.tables["sessions"].execute.return_value = Mock(data=[])
+
+    for _ in range(3):
+        assert await index.owner("deleted") is None
+    assert index.misses == 1
+
+    index._unknown_sessions["deleted"] = 0  # Expired
+    await index.owner("deleted")
+    assert index.misses == 2
+
+
+@pytest.mark.asyncio
+async def test_listener_subscribes_before_loading(index):
+    calls = []
+    pubsub = Mock(
+        subscribe=AsyncMock(side_effect=lambda channel: calls.append("subscribe")),
+        listen=Mock(return_value=_never()),
+        aclose=AsyncMock()
+    )
+    index.load = AsyncMock(side_effect=lambda: calls.append("load"))
+
+    listener = asyncio.create_task(index.listen(Mock(pubsub=Mock(return_value=pubsub))))
+    await asyncio.wait_for(index.synced.wait(), timeout=1)
+    listener.cancel()
+
+    assert calls == ["subscribe", "load"]
+
+
+async def _never():
+    await asyncio.Event().wait()
+    yield
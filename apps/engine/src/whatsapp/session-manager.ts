@@ -12,6 +12,19 @@ import * as fs from 'fs';
 import * as path from 'path';
 import { SessionSettings } from './types.js';
 
+// Per-session event log behind the API's SSE stream (resumable with Last-Event-ID)
+const SESSION_EVENT_LOG_MAXLEN = '100';
+const SESSION_EVENT_LOG_TTL_SECONDS = 24 * 60 * 60;
+// Only lifecycle events are logged; message events would crowd them out of the capped log
+const SESSION_LOG_EVENT_TYPES = new Set([
+    'QR_CODE_UPDATED',
+    'SESSION_CONNECTED',
+    'SESSION_DISCONNECTED',
+    'SESSION_FAILED'
+]);
+// Latest QR code, so a newly opened stream shows it without waiting for the next rotation
+const SESSION_QR_TTL_SECONDS = 60;
+
 export class SessionManager {
     private sessions: Map<string, any> = new Map();
     private redis: Redis;
@@ -207,21 +220,12 @@ export class SessionManager {
             // Convert QR to Base64 image
             const qrBase64 = await QRCode.toDataURL(qr);
 
-            // Publish QR event to main events stream
+            // Publish QR event to main events stream and the session's SSE log
             await this.publishEvent('QR_CODE_UPDATED', {
                 session_id: sessionId,
                 qr_data: qrBase64,
                 timestamp: new Date().toISOString()
             });
-
-            // Also publish to session-specific channel for SSE
-            await this.redis.publish(
-                `session:${sessionId}:events`,
-                JSON.stringify({
-                    type: 'QR_CODE_UPDATED',
-                    payload: { qr_data: qrBase64 }
-                })
-            );
         }
 
         // Connection opened (successfully connected)
@@ -244,15 +248,6 @@ export class SessionManager {
                 timestamp: new Date().toISOString()
             });
 
-            // Publish to session-specific channel
-            await this.redis.publish(
-                `session:${sessionId}:events`,
-                JSON.stringify({
-                    type: 'SESSION_CONNECTED',
-                    payload: { phone_number: phoneNumber }
-                })
-            );
-
             // Start keepalive to maintain connection
             this.startKeepalive(sessionId);
         }
@@ -690,11 +685,49 @@ export class SessionManager {
             envelopeJson
         );
 
-        // ALSO publish to session-specific Pub/Sub channel for SSE
+        // ALSO notify the session's SSE streams; lifecycle events are logged for resume
         if (payload.session_id) {
-            const channel = `session:${payload.session_id}:events`;
-            await this.redis.publish(channel, envelopeJson);
-            logger.info({ sessionId: payload.session_id, eventType, channel }, 'Event published to Pub/Sub');
+            if (SESSION_LOG_EVENT_TYPES.has(eventType)) {
+                await this.appendSessionEvent(payload.session_id, envelope);
+            } else {
+                const channel = `session:${payload.session_id}:events`;
+                await this.redis.publish(channel, envelopeJson);
+                logger.info({ sessionId: payload.session_id, eventType, channel }, 'Event published to Pub/Sub');
+            }
+        }
+    }
+
+    /**
+     * Append an event to the session's capped log and notify live SSE streams.
+     * The published message carries the log entry id (`stream_id`) so a
+     * reconnecting stream can resume from it with XRANGE.
+     */
+    private async appendSessionEvent(sessionId: string, envelope: Record<string, any>): Promise<void> {
+        const logKey = `session:${sessionId}:events:log`;
+        const qrKey = `session:${sessionId}:qr`;
+        const channel = `session:${sessionId}:events`;
+
+        const streamId = await this.redis.xadd(
+            logKey,
+            'MAXLEN',
+            '~',
+            SESSION_EVENT_LOG_MAXLEN,
+            '*',
+            'data',
+            JSON.stringify(envelope)
+        );
+        const message = JSON.stringify({ ...envelope, stream_id: streamId });
+
+        const pipeline = this.redis.pipeline().expire(logKey, SESSION_EVENT_LOG_TTL_SECONDS);
+        if (envelope.type === 'QR_CODE_UPDATED') {
+            pipeline.set(qrKey, message, 'EX', SESSION_QR_TTL_SECONDS);
+        } else {
+            // Connected, disconnected or failed: the last QR code is no longer scannable
+            pipeline.del(qrKey);
         }
+        pipeline.publish(channel, message);
+        await pipeline.exec();
+
+        logger.info({ sessionId, eventType: envelope.type, streamId }, 'Event appended to session log');
     }
 }
@@ -0,0 +1,18 @@
+-- Bulk flush of API key usage counters
+-- The API accumulates per-key request counts in Redis and applies them here
+-- in batches, so request_count is incremented in SQL instead of read-modify-write.
+
+CREATE OR REPLACE FUNCTION public.increment_api_key_usage(updates JSONB)
+RETURNS VOID AS $$
+BEGIN
+  UPDATE public.api_keys AS k
+  SET
+    request_count = COALESCE(k.request_count, 0) + u.count,
+    last_used_at = GREATEST(k.last_used_at, u.last_used_at)
+  FROM jsonb_to_recordset(updates) AS u(id UUID, count BIGINT, last_used_at TIMESTAMPTZ)
+  WHERE k.id = u.id;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Only the API (service role) flushes usage
+REVOKE EXECUTE ON FUNCTION public.increment_api_key_usage(JSONB) FROM PUBLIC, anon, authenticated;
@@ -0,0 +1,19 @@
+-- Bulk reconciliation of message quota counters
+-- The API checks and increments quotas in Redis and periodically applies the
+-- accumulated per-user deltas here, so messages_used is incremented in SQL
+-- instead of read-modify-write on every send.
+
+CREATE OR REPLACE FUNCTION public.increment_messages_used(updates JSONB)
+RETURNS VOID AS $$
+BEGIN
+  UPDATE public.subscriptions AS s
+  SET
+    messages_used = COALESCE(s.messages_used, 0) + u.count,
+    updated_at = NOW()
+  FROM jsonb_to_recordset(updates) AS u(user_id UUID, count BIGINT)
+  WHERE s.user_id = u.user_id;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Only the API (service role) reconciles usage
+REVOKE EXECUTE ON FUNCTION public.increment_messages_used(JSONB) FROM PUBLIC, anon, authenticated;
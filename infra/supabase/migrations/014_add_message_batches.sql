@@ -0,0 +1,10 @@
+-- Migration: Group messages sent through POST /messages/batch
+
+ALTER TABLE public.messages
+  ADD COLUMN IF NOT EXISTS batch_id UUID;
+
+CREATE INDEX IF NOT EXISTS idx_messages_batch_id
+  ON public.messages(batch_id)
+  WHERE batch_id IS NOT NULL;
+
+COMMENT ON COLUMN public.messages.batch_id IS 'Batch the message was created in (POST /messages/batch), NULL for single sends';
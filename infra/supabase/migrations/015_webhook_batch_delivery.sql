@@ -0,0 +1,15 @@
+-- Migration: Opt-in batched webhook delivery
+-- Webhooks in 'batch' mode receive a JSON array of up to batch_max_events
+-- events per POST, sent at most batch_max_wait_ms after the first one.
+
+ALTER TABLE public.webhooks
+  ADD COLUMN IF NOT EXISTS delivery_mode TEXT NOT NULL DEFAULT 'single'
+    CHECK (delivery_mode IN ('single', 'batch')),
+  ADD COLUMN IF NOT EXISTS batch_max_events INTEGER NOT NULL DEFAULT 100
+    CHECK (batch_max_events BETWEEN 1 AND 1000),
+  ADD COLUMN IF NOT EXISTS batch_max_wait_ms INTEGER NOT NULL DEFAULT 1000
+    CHECK (batch_max_wait_ms BETWEEN 10 AND 60000);
+
+COMMENT ON COLUMN public.webhooks.delivery_mode IS 'single: one POST per event; batch: JSON array of events per POST';
+COMMENT ON COLUMN public.webhooks.batch_max_events IS 'Batch mode: send once this many events are queued';
+COMMENT ON COLUMN public.webhooks.batch_max_wait_ms IS 'Batch mode: send at most this long after the first queued event';
@@ -0,0 +1,91 @@
+"""
+Benchmark: per-request Supabase client overhead, before and after pooling.
+
+Starts a local keep-alive HTTP server that answers like PostgREST and times
+what `get_current_user` does on each request (build the anon and service
+clients, run one profile lookup):
+
+  before: acreate_client() for both clients on every request (new pool, new TCP connection)
+  after:  src.core.supabase getters (shared pool, singleton service client)
+
+Usage (from apps/api):
+    python ../../scripts/bench_supabase_clients.py [iterations]
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / "apps" / "api"))
+
+
+class PostgrestStub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        body = b'{"id":"123e4567-e89b-12d3-a456-426614174000"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+async def run(label, get_anon, get_service, iterations):
+    # One untimed round so imports and lazy properties don't skew the first sample
+    await (await get_service()).table("profiles").select("*").eq("id", "x").single().execute()
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await get_anon()
+        service = await get_service()
+        await service.table("profiles").select("*").eq("id", "x").single().execute()
+    elapsed = time.perf_counter() - start
+
+    print(f"{label:<8} {elapsed / iterations * 1000:8.3f} ms/request  ({iterations} requests)")
+    return elapsed
+
+
+async def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PostgrestStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+
+    os.environ.update({
+        "SUPABASE_URL": url,
+        "SUPABASE_KEY": "anon-key",
+        "SUPABASE_SERVICE_KEY": "service-key",
+        "JWT_SECRET": os.environ.get("JWT_SECRET", "bench"),
+    })
+
+    from supabase import acreate_client
+    from src.core.supabase import (
+        get_supabase_client,
+        get_supabase_service_client,
+        close_supabase_clients
+    )
+
+    before = await run(
+        "before",
+        lambda: acreate_client(url, "anon-key"),
+        lambda: acreate_client(url, "service-key"),
+        iterations
+    )
+    after = await run("after", get_supabase_client, get_supabase_service_client, iterations)
+    print(f"speedup  {before / after:8.2f}x")
+
+    await close_supabase_clients()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -12,7 +12,7 @@ from models.billing import PLAN_LIMITS, PlanType
 
 async def migrate_plans():
     print("🚀 Starting plans migration...")
-    supabase = get_supabase_service_client()
+    supabase = await get_supabase_service_client()
     
     # 1. Create the table (via RPC or assuming it exists, but since I can't run SQL directly easily, 
     # I'll try to upsert and see if it fails. Actually, I should check if the user can create it manually 
@@ -43,7 +43,7 @@ async def migrate_plans():
         print(f"📦 Migrating {len(plans_data)} plans...")
         
         # Upsert based on name
-        result = supabase.table("plans").upsert(plans_data, on_conflict="name").execute()
+        result = await supabase.table("plans").upsert(plans_data, on_conflict="name").execute()
         
         print("✅ Migration successful!")
         print(result.data)